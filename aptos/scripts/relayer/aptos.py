@@ -1,21 +1,22 @@
-import base64
 import functools
 import logging
-import random
 import threading
 import time
 from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
-import ccxt
-import pandas as pd
 import requests
 from brownie import network
 from retrying import retry
 
 from scripts.serde_aptos import parse_vaa_to_wormhole_payload
-from scripts.serde_struct import omniswap_aptos_path, decode_hex_to_ascii, hex_str_to_vector_u8, change_network
+from scripts.serde_struct import omniswap_aptos_path, decode_hex_to_ascii, hex_str_to_vector_u8
+from omniswap_relayer.gas_ledger import get_gas_ledger
+from omniswap_relayer.guardian_rpc import get_guardian_fetcher
+from omniswap_relayer.price_feed import get_price_feed
+from omniswap_relayer.processed_store import ProcessedStore, get_processed_store
+from omniswap_relayer.scheduler import PollTimer
 import aptos_brownie
 
 FORMAT = '%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s'
@@ -82,10 +83,9 @@ NET_TO_EMITTER = {
     "base-main": "0x8d2de8d2f73F1F4cAB472AC9A881C9b123C79627",
 }
 
-@retry
+@retry(wait_exponential_multiplier=1000, wait_exponential_max=60 * 1000)
 def get_token_price():
-    kucoin = ccxt.kucoin()
-    return float(kucoin.fetch_ticker("APT/USDT")['close'])
+    return get_price_feed().price("APT/USDT")
 
 
 @functools.lru_cache()
@@ -101,20 +101,13 @@ def get_signed_vaa_by_wormhole(
         sequence: int,
         emitter_chain_id: str = None
 ):
-    wormhole_url = random.choice(WORMHOLE_GUARDIAN_RPC)
     src_net = get_chain_id_to_net()[emitter_chain_id]
     emitter = NET_TO_EMITTER[src_net]
     emitter_address = format_emitter_address(emitter)
 
-    url = f"{wormhole_url}/v1/signed_vaa/{emitter_chain_id}/{emitter_address}/{sequence}"
-    response = requests.get(url)
-
-    if 'vaaBytes' not in response.json():
-        return None
-
-    vaa_bytes = response.json()['vaaBytes']
-    vaa = base64.b64decode(vaa_bytes).hex()
-    return f"0x{vaa}"
+    return get_guardian_fetcher(tuple(WORMHOLE_GUARDIAN_RPC)).get_signed_vaa(
+        emitter_chain_id, emitter_address, sequence
+    )
 
 
 def get_pending_data(url: str = None, dstWormholeChainId=None) -> list:
@@ -154,11 +147,10 @@ def process_vaa(
         price=0
 ) -> bool:
     try:
-        # Use bsc-test to decode, too slow may need to change bsc-mainnet
         vaa_str = vaa_str if "0x" in vaa_str else "0x" + vaa_str
         vaa_data, transfer_data, wormhole_data = parse_vaa_to_wormhole_payload(
             package, network.show_active(),
-            vaa_str)
+            vaa_str, offline=True)
         dst_max_gas = wormhole_data[1]
         dst_max_gas_price = wormhole_data[0] / 1e10
         dst_max_gas_price = min(package.estimate_gas_price(), dst_max_gas_price)
@@ -261,24 +253,22 @@ def process_v2(
         pending_url = "https://crossswap-pre.coming.chat/v1/getUnSendTransferFromWormhole"
     else:
         pending_url = "https://crossswap.coming.chat/v1/getUnSendTransferFromWormhole"
-    has_process = {}
+    processed_store = get_processed_store()
+    processed_namespace = f"wormhole_{package.network}"
     last_price_update = 0
     interval_price = 3 * 60
     price_info = 0
-    last_pending_time = 0
-    pending_interval = 30
+    poll_timer = PollTimer(30, max_interval=5 * 60)
     while True:
+        poll_timer.wait()
         try:
-            if time.time() < last_pending_time + pending_interval:
-                continue
-            else:
-                last_pending_time = time.time()
             pending_data = get_pending_data(url=pending_url, dstWormholeChainId=dstWormholeChainId)
             local_logger.info(f"Get signed vaa length: {len(pending_data)}")
         except Exception as e:
             local_logger.error(
                 f'Get pending data for aptos error: {e}'
             )
+            poll_timer.fail()
             continue
 
         try:
@@ -288,7 +278,9 @@ def process_v2(
                 last_price_update = time.time()
         except Exception as e:
             local_logger.error(f'Get token price error: {e}')
+            poll_timer.fail()
             continue
+        poll_timer.succeed()
 
         for d in pending_data:
             try:
@@ -301,19 +293,14 @@ def process_v2(
                 local_logger.error(f'Get signed vaa for :{d["srcWormholeChainId"]}, '
                                    f'sequence:{d["sequence"]} error: {e}')
                 continue
-            has_key = (int(d["srcWormholeChainId"]), int(d["sequence"]))
-            if (
-                    has_key in has_process
-                    and (time.time() - has_process[has_key]) <= 3 * 60
-            ):
+            has_key = ProcessedStore.key(int(d["srcWormholeChainId"]), int(d["sequence"]))
+            if not processed_store.claim(processed_namespace, has_key, 3 * 60):
                 local_logger.warning(
                     f'emitterChainId:{d["srcWormholeChainId"]} sequence:{d["sequence"]} '
                     f"inner 10min has process!"
                 )
                 continue
-            else:
-                has_process[has_key] = time.time()
-            process_vaa(
+            if process_vaa(
                 dstSoDiamond=dstSoDiamond,
                 vaa_str=vaa,
                 emitterChainId=d["srcWormholeChainId"],
@@ -322,7 +309,8 @@ def process_v2(
                 local_logger=local_logger,
                 is_admin=False,
                 price=price_info
-            )
+            ):
+                processed_store.put(processed_namespace, has_key)
 
 
 def compensate(
@@ -385,16 +373,7 @@ def record_gas(
         dst_txid=None,
         price=0
 ):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"{dst_net}_{period1}_{period2}_v1.csv")
     sender_value = sender_gas * sender_gas_price
     actual_value = actual_gas * actual_gas_price
     data = OrderedDict({
@@ -415,13 +394,7 @@ def record_gas(
         "diff_gas": sender_value - actual_value,
         "diff_value": round((sender_value - actual_value) / 1e8 * price, 4)
     })
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode='a')
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode='w')
+    get_gas_ledger(str(file_path), "{dst_net}_{period1}_{period2}_v1.csv").record(data, cur_timestamp)
 
 
 def main():
@@ -432,7 +405,6 @@ def main():
 
 
 def single_process():
-    change_network("bsc-main")
     process_v2(22, package.network_config["SoDiamond"])
 
 
@@ -1,10 +1,8 @@
-import functools
-
 from brownie import network
-import ccxt
 
 from scripts.serde_aptos import get_serde_facet, get_price_resource
 from scripts.serde_struct import omniswap_aptos_path, hex_str_to_vector_u8
+from omniswap_relayer.price_feed import get_price_feed
 import aptos_brownie
 
 
@@ -71,16 +69,10 @@ def set_so_gas():
         )
 
 
-@functools.lru_cache()
 def get_prices(symbols=("ETH/USDT", "BNB/USDT", "POL/USDT", "AVAX/USDT", "APT/USDT", "SUI/USDT", "SOL/USDT")):
-    api = ccxt.kucoin()
-    prices = {}
-
-    for symbol in symbols:
-        result = api.fetch_ticker(symbol=symbol)
-        price = result["close"]
+    prices = get_price_feed().get(symbols)
+    for symbol, price in prices.items():
         print(f"Symbol:{symbol}, price:{price}")
-        prices[symbol] = price
     return prices
 
 
@@ -4,6 +4,7 @@ from brownie import Contract
 
 from scripts.serde_struct import change_network, omniswap_ethereum_project, padding_to_bytes, hex_str_to_vector_u8
 import aptos_brownie
+from omniswap_relayer import wormhole_serder
 
 
 @functools.lru_cache()
@@ -196,8 +197,20 @@ def parse_wormhole_payload(
 def parse_vaa_to_wormhole_payload(
         package: aptos_brownie.AptosPackage,
         net: str,
-        vaa: str
+        vaa: str,
+        offline: bool = False
 ):
+    """
+    Decode vaa, transfer and wormhole payload
+    :param package:
+    :param net: evm network used to decode, not needed when offline
+    :param vaa:
+    :param offline: decode locally with wormhole_serder instead of evm eth_call,
+        the result layout is the same
+    :return: (vaa_data, transfer_data, wormhole_data)
+    """
+    if offline:
+        return wormhole_serder.parse_vaa_to_wormhole_payload(vaa)
     vaa_data = parse_vaa(package, net, vaa)
     transfer_data = parse_transfer_with_payload(package, net, vaa_data[-4])
     wormhole_data = parse_wormhole_payload(package, net, transfer_data[-1])
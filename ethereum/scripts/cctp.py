@@ -10,6 +10,7 @@ from brownie import Contract, web3, project
 from brownie.project.main import Project
 from retrying import retry
 
+from contract_registry import get_contract as get_cached_contract
 from helpful_scripts import (
     get_account,
     zero_address,
@@ -485,14 +486,14 @@ class SwapData(View):
         account = get_account()
         swap_info = get_swap_info()[swapType]
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountOut = swap_contract.quoteExactInput.call(
                 cls.encode_path_for_uniswap_v3(swapPath), amountIn, {"from": account}
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountOuts = swap_contract.getAmountsOut(
@@ -526,7 +527,7 @@ class SwapData(View):
         account = get_account()
         swap_info = get_swap_info()[swapType]
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountIn = swap_contract.quoteExactOutput.call(
@@ -535,7 +536,7 @@ class SwapData(View):
                 {"from": account},
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountIns = swap_contract.getAmountsIn(
@@ -8,6 +8,7 @@ import requests
 from brownie import Contract, web3
 from brownie.project.main import Project
 
+from scripts.contract_registry import get_contract as get_cached_contract
 from scripts.helpful_scripts import (
     get_account,
     zero_address,
@@ -621,14 +622,14 @@ class SwapData(View):
         account = get_account()
         swap_info = get_swap_info()[swapType]
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountOut = swap_contract.quoteExactInput.call(
                 cls.encode_path_for_uniswap_v3(swapPath), amountIn, {"from": account}
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountOuts = swap_contract.getAmountsOut(
@@ -662,7 +663,7 @@ class SwapData(View):
         account = get_account()
         swap_info = get_swap_info()[swapType]
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountIn = swap_contract.quoteExactOutput.call(
@@ -671,7 +672,7 @@ class SwapData(View):
                 {"from": account},
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountIns = swap_contract.getAmountsIn(
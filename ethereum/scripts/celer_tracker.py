@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from scripts.celer_tx_status import (
+    HEADERS,
+    TransferHistoryStatus,
+    XferStatus,
+    decode_refund,
+    get_celer_url,
+)
+from scripts.relayer.attestation import RateLimiter
+
+# TransferHistoryStatus -> seconds until the next poll, None when final
+STATUS_INTERVALS = {
+    "TRANSFER_UNKNOWN": 30,
+    "TRANSFER_SUBMITTING": 15,
+    "TRANSFER_FAILED": None,
+    "TRANSFER_WAITING_FOR_SGN_CONFIRMATION": 15,
+    "TRANSFER_WAITING_FOR_FUND_RELEASE": 30,
+    "TRANSFER_COMPLETED": None,
+    "TRANSFER_TO_BE_REFUNDED": 60,
+    "TRANSFER_REQUESTING_REFUND": 30,
+    "TRANSFER_REFUND_TO_BE_CONFIRMED": 60,
+    "TRANSFER_CONFIRMING_YOUR_REFUND": 30,
+    "TRANSFER_REFUNDED": None,
+}
+
+# The gateway holds the withdraw signatures in these states
+REFUND_STATUSES = ("TRANSFER_TO_BE_REFUNDED", "TRANSFER_REFUND_TO_BE_CONFIRMED")
+
+
+class CelerTransferTracker:
+    """Outstanding Celer transfers, polled concurrently against getTransferStatus
+
+    Every tracked transfer is polled after the interval of its last status,
+    doubled up to `max_interval` while the status does not change. Status
+    changes are appended to a transition log and the current state is kept
+    in the sqlite file at `path`, so tracking resumes after a restart. When
+    a transfer is refundable and the gateway returns the withdraw
+    signatures they are stored, `refunds` lists them for a batched bridge
+    withdraw on the source chain.
+    """
+
+    def __init__(
+            self,
+            path: str = "./cache/celer_transfers.sqlite",
+            base_url: str = None,
+            max_workers: int = 8,
+            rate: float = 10,
+            max_interval: float = 10 * 60,
+            timeout: float = 10,
+    ):
+        self.path = path
+        # None for the gateway of the transfer's source network
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS transfers ("
+            "transfer_id TEXT PRIMARY KEY, src_net TEXT, status TEXT, refund_reason TEXT, "
+            "polls INTEGER, next_poll REAL, updated REAL, refund TEXT, withdraw_tx TEXT)"
+        )
+        self._execute(
+            "CREATE INDEX IF NOT EXISTS transfers_next_poll ON transfers (next_poll) "
+            "WHERE next_poll IS NOT NULL"
+        )
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS transitions ("
+            "transfer_id TEXT, status TEXT, refund_reason TEXT, time REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, args: tuple = ()):
+        return self._connection().execute(sql, args)
+
+    def track(self, transfer_id: str, src_net: str):
+        """Poll `transfer_id` from now on, a tracked transfer is left as is"""
+        transfer_id = transfer_id.lower()
+        if not transfer_id.startswith("0x"):
+            transfer_id = "0x" + transfer_id
+        self._execute(
+            "INSERT OR IGNORE INTO transfers VALUES (?, ?, NULL, NULL, 0, ?, ?, NULL, NULL)",
+            (transfer_id, src_net, time.time(), time.time()),
+        )
+
+    def get(self, transfer_id: str) -> Optional[dict]:
+        cursor = self._execute("SELECT * FROM transfers WHERE transfer_id=?", (transfer_id.lower(),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def transitions(self, transfer_id: str) -> List[tuple]:
+        """(status, refund_reason, time) of every status change"""
+        return self._execute(
+            "SELECT status, refund_reason, time FROM transitions WHERE transfer_id=? ORDER BY time",
+            (transfer_id.lower(),),
+        ).fetchall()
+
+    def outstanding(self) -> int:
+        """Transfers not in a final status"""
+        return self._execute(
+            "SELECT COUNT(*) FROM transfers WHERE next_poll IS NOT NULL"
+        ).fetchone()[0]
+
+    def waiting(self) -> int:
+        """Outstanding transfers, not counting refunds ready to withdraw"""
+        return self._execute(
+            "SELECT COUNT(*) FROM transfers WHERE next_poll IS NOT NULL "
+            "AND NOT (refund IS NOT NULL AND withdraw_tx IS NULL)"
+        ).fetchone()[0]
+
+    def next_poll(self) -> Optional[float]:
+        return self._execute("SELECT MIN(next_poll) FROM transfers").fetchone()[0]
+
+    def request(self, transfer_id: str, src_net: str) -> Optional[dict]:
+        """One rate limited getTransferStatus, None on failure"""
+        self.limiter.acquire()
+        response = self.session.post(
+            self.base_url if self.base_url is not None else get_celer_url(src_net),
+            headers=HEADERS,
+            data=json.dumps({"transfer_id": transfer_id}),
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if data.get("err", None) is not None:
+            return None
+        return data
+
+    def _interval(self, status: Optional[str], polls: int) -> Optional[float]:
+        if status is None:
+            return min(STATUS_INTERVALS["TRANSFER_UNKNOWN"] * 2 ** polls, self.max_interval)
+        interval = STATUS_INTERVALS.get(status, STATUS_INTERVALS["TRANSFER_UNKNOWN"])
+        if interval is None:
+            return None
+        return min(interval * 2 ** polls, self.max_interval)
+
+    def _update(self, row: tuple, data: Optional[dict]):
+        transfer_id, src_net, old_status, polls, refund = row
+        now = time.time()
+        if data is None:
+            # Gateway error, back off without a transition
+            self._execute(
+                "UPDATE transfers SET polls=?, next_poll=?, updated=? WHERE transfer_id=?",
+                (polls + 1, now + self._interval(old_status, polls + 1), now, transfer_id),
+            )
+            return
+        status = TransferHistoryStatus[data["status"]]
+        refund_reason = XferStatus[data.get("refund_reason", 0)]
+        polls = polls + 1 if status == old_status else 0
+        interval = self._interval(status, polls)
+        if status in REFUND_STATUSES and data.get("wd_onchain"):
+            refund = json.dumps({
+                k: data[k] for k in ("wd_onchain", "sorted_sigs", "signers", "powers")
+            })
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE transfers SET status=?, refund_reason=?, polls=?, next_poll=?, updated=?, refund=? "
+                "WHERE transfer_id=?",
+                (status, refund_reason, polls, None if interval is None else now + interval,
+                 now, refund, transfer_id),
+            )
+            if status != old_status:
+                conn.execute(
+                    "INSERT INTO transitions VALUES (?, ?, ?, ?)",
+                    (transfer_id, status, refund_reason, now),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def poll_once(self) -> int:
+        """Poll every due transfer concurrently, return how many were polled"""
+        rows = self._execute(
+            "SELECT transfer_id, src_net, status, polls, refund FROM transfers "
+            "WHERE next_poll IS NOT NULL AND next_poll<=?",
+            (time.time(),),
+        ).fetchall()
+        if len(rows) == 0:
+            return 0
+
+        def poll(row):
+            try:
+                data = self.request(row[0], row[1])
+            except Exception as e:
+                print(f"Get celer transfer {row[0]} status error: {e}")
+                data = None
+            self._update(row, data)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(rows))) as executor:
+            list(executor.map(poll, rows))
+        return len(rows)
+
+    def run(self, timeout: float = None):
+        """Poll until only final or withdrawable transfers are left, or for `timeout` seconds"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.waiting() > 0:
+            self.poll_once()
+            next_poll = self.next_poll()
+            if next_poll is None:
+                break
+            wait = max(next_poll - time.time(), 0)
+            if deadline is not None and time.time() + wait > deadline:
+                break
+            time.sleep(wait)
+
+    def refunds(self, src_net: str = None) -> List[dict]:
+        """Refundable transfers with withdraw signatures and no withdraw sent"""
+        sql = "SELECT transfer_id, src_net, refund FROM transfers WHERE refund IS NOT NULL " \
+              "AND withdraw_tx IS NULL AND status IN (?, ?)"
+        args = REFUND_STATUSES
+        if src_net is not None:
+            sql += " AND src_net=?"
+            args = args + (src_net,)
+        return [
+            {"transfer_id": transfer_id, "src_net": net, "refund": json.loads(refund)}
+            for transfer_id, net, refund in self._execute(sql, args).fetchall()
+        ]
+
+    def mark_withdrawn(self, transfer_id: str, txid: str):
+        self._execute(
+            "UPDATE transfers SET withdraw_tx=?, updated=? WHERE transfer_id=?",
+            (txid, time.time(), transfer_id.lower()),
+        )
+
+    def summary(self) -> Dict[str, int]:
+        """Transfer count by status"""
+        return {
+            str(status): count
+            for status, count in self._execute(
+                "SELECT status, COUNT(*) FROM transfers GROUP BY status"
+            ).fetchall()
+        }
+
+
+def withdraw_refunds(tracker: CelerTransferTracker, batch_size: int = 20) -> int:
+    """Send the prepared refunds of the active network through Multicall3
+
+    The bridge withdraw can be sent by anyone and pays the original sender,
+    so many refunds share one transaction. A withdraw that fails, e.g.
+    already done, does not revert the others, so every withdraw is first
+    simulated with Multicall3 and only the ones that pass are sent and
+    marked withdrawn. Return how many were marked.
+    """
+    from brownie import interface, network
+
+    from scripts.contract_registry import get_contract
+    from scripts.helpful_scripts import get_account, get_celer_message_bus
+    from scripts.multicall import multicall, multicall_transaction
+
+    refunds = tracker.refunds(network.show_active())
+    if len(refunds) == 0:
+        return 0
+    message_bus = get_contract(
+        "ICelerMessageBus", get_celer_message_bus(), interface.ICelerMessageBus.abi
+    )
+    bridge = get_contract(
+        "ICelerBridge", message_bus.liquidityBridge(), interface.ICelerBridge.abi
+    )
+    calls = [(bridge.withdraw, decode_refund(v["refund"])) for v in refunds]
+    ready = []
+    for v, call, (ok, _) in zip(refunds, calls, multicall(calls)):
+        if ok:
+            ready.append((v, call))
+        else:
+            print(f"Withdraw refund {v['transfer_id']} would fail, skipped")
+    if len(ready) == 0:
+        return 0
+
+    txs = multicall_transaction([call for _, call in ready], {"from": get_account()}, batch_size)
+    withdrawn = 0
+    for i, tx in enumerate(txs):
+        batch = ready[i * batch_size:(i + 1) * batch_size]
+        if tx.status != 1:
+            print(f"Withdraw {len(batch)} refunds in {tx.txid} fail")
+            continue
+        for v, _ in batch:
+            tracker.mark_withdrawn(v["transfer_id"], tx.txid)
+        withdrawn += len(batch)
+    print(f"Withdraw {withdrawn} of {len(refunds)} refunds in {len(txs)} transactions")
+    return withdrawn
+
+
+# Track, wait and refund a backlog of transfers sent from the active network:
+# brownie run --network bsc-main scripts/celer_tracker.py recover 0x... 0x... [transfers.json]
+def recover(*transfer_ids, timeout: float = 30 * 60):
+    from brownie import network
+
+    src_net = network.show_active()
+    tracker = CelerTransferTracker()
+    for transfer_id in transfer_ids:
+        if transfer_id.endswith(".json"):
+            with open(transfer_id) as f:
+                for v in json.load(f):
+                    tracker.track(v, src_net)
+        else:
+            tracker.track(transfer_id, src_net)
+    tracker.run(timeout=timeout)
+    withdraw_refunds(tracker)
+    print(f"Celer transfers: {tracker.summary()}")
@@ -1,18 +1,19 @@
 import json
-import polling
 import requests
 import base64
 
+from brownie import network
 from brownie.convert import to_address, to_uint
 
 SUCCESS_CODE = 200
+TRANSFER_FAILED = 2
 TRANSFER_COMPLETED = 5
+TRANSFER_TO_BE_REFUNDED = 6
 TRANSFER_REFUND_TO_BE_CONFIRMED = 8
 TRANSFER_REFUNDED = 10
 
-# main https://cbridge-prod2.celer.app/v2/getTransferStatus
-# test "https://cbridge-v2-test.celer.network/v2/getTransferStatus"
-CELER_URL = "https://cbridge-v2-test.celer.network/v2/getTransferStatus"
+CELER_MAIN_URL = "https://cbridge-prod2.celer.app/v2/getTransferStatus"
+CELER_TEST_URL = "https://cbridge-v2-test.celer.network/v2/getTransferStatus"
 HEADERS = {"Content-Type": "application/json"}
 
 TransferHistoryStatus = [
@@ -42,7 +43,24 @@ XferStatus = [
     "BAD_DEST_CHAIN",
 ]
 
+def get_celer_url(net: str = None) -> str:
+    if net is None:
+        net = network.show_active()
+    return CELER_MAIN_URL if "main" in net else CELER_TEST_URL
+
+
 # https://cbridge-docs.celer.network/developer/api-reference/contract-pool-based-transfer-refund
+def decode_refund(data):
+    """Arguments of the bridge withdraw call from a getTransferStatus response"""
+    wd_onchain = base64.b64decode(data["wd_onchain"])
+    sigs = list(map(lambda p: base64.b64decode(p), data["sorted_sigs"]))
+    signers = list(
+        map(lambda p: to_address(base64.b64decode(p).hex()), data["signers"])
+    )
+    powers = list(map(lambda p: to_uint(base64.b64decode(p)), data["powers"]))
+    return wd_onchain, sigs, signers, powers
+
+
 def convert_parameters(data):
     print("wd_onchain:", data["wd_onchain"])
     print("sorted_sigs:", data["sorted_sigs"])
@@ -51,12 +69,7 @@ def convert_parameters(data):
 
     print("=================================")
 
-    wd_onchain = base64.b64decode(data["wd_onchain"])
-    sigs = list(map(lambda p: base64.b64decode(p), data["sorted_sigs"]))
-    signers = list(
-        map(lambda p: to_address(base64.b64decode(p).hex()), data["signers"])
-    )
-    powers = list(map(lambda p: to_uint(base64.b64decode(p)), data["powers"]))
+    wd_onchain, sigs, signers, powers = decode_refund(data)
 
     print("wd_onchain:", wd_onchain.hex())
     print("signs:", list(map(lambda p: p.hex(), sigs)))
@@ -92,9 +105,12 @@ def is_correct_response(response):
 
 
 def get_celer_transfer_status(transfer_id):
+    # Only this blocking helper polls, the tracker does not need the package
+    import polling
+
     payload = json.dumps({"transfer_id": transfer_id})
     polling.poll(
-        lambda: requests.request("POST", CELER_URL, headers=HEADERS, data=payload),
+        lambda: requests.request("POST", get_celer_url(), headers=HEADERS, data=payload),
         check_success=is_correct_response,
         step=10,
         max_tries=30,
@@ -1,6 +1,15 @@
-import requests
-from typing import Dict
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+DECIMALS_SIGNATURE = "0x313ce567"
+ALLOWANCE_SIGNATURE = "0xdd62ed3e"
+
 
 @dataclass
 class ChainConfig:
@@ -12,10 +21,19 @@ class ChainConfig:
 
 
 class SoDiamondAllowanceChecker:
-    def __init__(self, config: ChainConfig):
+    def __init__(self, config: ChainConfig, batch_size: int = 100, timeout: float = 30):
         self.config = config
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
         self._decimals_cache = {}  # Cache for token decimals
 
+    @staticmethod
+    def _encode_call(method_signature: str, params: list = None) -> str:
+        if params is None:
+            params = []
+        return method_signature + ''.join([p[2:].zfill(64) for p in params])
+
     def _make_rpc_call(self, method_signature: str, to_address: str, params: list = None) -> str:
         """
         Make a generic RPC call to the blockchain
@@ -28,24 +46,62 @@ class SoDiamondAllowanceChecker:
         Returns:
             The hex string result from the RPC call
         """
-        if params is None:
-            params = []
-
-        data = method_signature + ''.join([p[2:].zfill(64) for p in params])
-
         payload = {
             "jsonrpc": "2.0",
             "method": "eth_call",
             "params": [{
                 "to": to_address,
-                "data": data
+                "data": self._encode_call(method_signature, params)
             }, "latest"],
             "id": 1
         }
 
-        response = requests.post(self.config.rpc_url, json=payload)
+        response = self.session.post(self.config.rpc_url, json=payload, timeout=self.timeout)
         return response.json().get("result")
 
+    def _batch_rpc_call(self, calls: List[Tuple[str, str, list]]) -> List[Optional[str]]:
+        """
+        Make many eth_calls with JSON-RPC batch requests
+
+        Args:
+            calls: List of (method_signature, to_address, params)
+
+        Returns:
+            The hex string result of every call, None for a call answered
+            with a JSON-RPC error or missing from the reply. Falls back to
+            single calls when the endpoint rejects batches.
+        """
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            batch = calls[start:start + self.batch_size]
+            payload = [
+                {
+                    "jsonrpc": "2.0",
+                    "method": "eth_call",
+                    "params": [{
+                        "to": to_address,
+                        "data": self._encode_call(method_signature, params)
+                    }, "latest"],
+                    "id": i
+                }
+                for i, (method_signature, to_address, params) in enumerate(batch)
+            ]
+            response = self.session.post(self.config.rpc_url, json=payload, timeout=self.timeout)
+            replies = response.json()
+            if not isinstance(replies, list):
+                results.extend(self._make_rpc_call(*call) for call in batch)
+                continue
+            by_id = {reply.get("id"): reply.get("result") for reply in replies}
+            results.extend(by_id.get(i) for i in range(len(batch)))
+        return results
+
+    @staticmethod
+    def _decode_uint(result: Optional[str]) -> Optional[int]:
+        """uint256 of an eth_call result, None when the call failed or returned nothing"""
+        if not result or result == "0x":
+            return None
+        return int(result, 16)
+
     def _get_token_decimals(self, token_address: str) -> int:
         """
         Get token decimals with caching
@@ -61,7 +117,7 @@ class SoDiamondAllowanceChecker:
         """
         if token_address not in self._decimals_cache:
             # Call decimals() method
-            result = self._make_rpc_call("0x313ce567", token_address)
+            result = self._make_rpc_call(DECIMALS_SIGNATURE, token_address)
             if result:
                 self._decimals_cache[token_address] = int(result, 16)
             else:
@@ -81,13 +137,29 @@ class SoDiamondAllowanceChecker:
         """
         # Call allowance(address,address) method
         result = self._make_rpc_call(
-            "0xdd62ed3e",
+            ALLOWANCE_SIGNATURE,
             token_address,
             [self.config.so_diamond, spender]
         )
         return int(result, 16) if result else 0
 
-    def check_all_allowances(self, token_symbol: str) -> Dict[str, int]:
+    def check_allowances(self, pairs: List[Tuple[str, str]]) -> List[Optional[int]]:
+        """
+        Check many (token_address, spender) allowances in batch requests
+
+        Args:
+            pairs: List of (token_address, spender)
+
+        Returns:
+            The allowance amount of every pair, None when it can not be read
+        """
+        results = self._batch_rpc_call([
+            (ALLOWANCE_SIGNATURE, token_address, [self.config.so_diamond, spender])
+            for token_address, spender in pairs
+        ])
+        return [self._decode_uint(result) for result in results]
+
+    def check_all_allowances(self, token_symbol: str) -> Dict[str, Optional[int]]:
         """
         Check SoDiamond's allowances for a token against all swap protocols
 
@@ -95,7 +167,8 @@ class SoDiamondAllowanceChecker:
             token_symbol: The symbol of the token to check
 
         Returns:
-            Dictionary mapping protocol names to allowance amounts
+            Dictionary mapping protocol names to allowance amounts, None
+            when it can not be read
 
         Raises:
             ValueError: If token symbol is not found in config
@@ -106,12 +179,52 @@ class SoDiamondAllowanceChecker:
 
         print(f"{token_address}\n")
 
-        results = {}
-        for swap_name, swap_address in self.config.swaps.items():
-            allowance = self.check_allowance(token_address, swap_address)
-            results[swap_name] = allowance
+        swaps = list(self.config.swaps.items())
+        allowances = self.check_allowances([(token_address, swap_address) for _, swap_address in swaps])
+        return {swap_name: allowance for (swap_name, _), allowance in zip(swaps, allowances)}
 
-        return results
+    def allowance_matrix(self) -> dict:
+        """
+        Check every token against every swap protocol, decimals included,
+        in one round of batch requests
+
+        Returns:
+            {"chain_id", "so_diamond", "tokens": {symbol: {"address", "decimals",
+            "allowances": {protocol: {"spender", "amount"}}}}}, decimals and
+            amount are None when they can not be read
+        """
+        tokens = list(self.config.tokens.items())
+        swaps = list(self.config.swaps.items())
+        calls = [(DECIMALS_SIGNATURE, token_address, []) for _, token_address in tokens]
+        calls.extend(
+            (ALLOWANCE_SIGNATURE, token_address, [self.config.so_diamond, swap_address])
+            for _, token_address in tokens
+            for _, swap_address in swaps
+        )
+        results = self._batch_rpc_call(calls)
+        decimals, allowances = results[:len(tokens)], results[len(tokens):]
+
+        matrix = {}
+        for i, (token_symbol, token_address) in enumerate(tokens):
+            if self._decode_uint(decimals[i]) is not None:
+                self._decimals_cache[token_address] = self._decode_uint(decimals[i])
+            row = allowances[i * len(swaps):(i + 1) * len(swaps)]
+            matrix[token_symbol] = {
+                "address": token_address,
+                "decimals": self._decimals_cache.get(token_address, None),
+                "allowances": {
+                    swap_name: {
+                        "spender": swap_address,
+                        "amount": self._decode_uint(result),
+                    }
+                    for (swap_name, swap_address), result in zip(swaps, row)
+                },
+            }
+        return {
+            "chain_id": self.config.chain_id,
+            "so_diamond": self.config.so_diamond,
+            "tokens": matrix,
+        }
 
     def format_amount(self, amount: int, token_symbol: str) -> str:
         """
@@ -128,19 +241,24 @@ class SoDiamondAllowanceChecker:
         decimals = self._get_token_decimals(token_address)
         return f"{amount / (10 ** decimals):.6f} {token_symbol}"
 
-    def show_allowances(self):
+    def show_allowances(self, matrix: dict = None):
         """
         Check and print allowances for all configured tokens
         """
         print("/" * 50)
         print(f"\nChain ID: {self.config.chain_id}")
-        for token in self.config.tokens.keys():
+        if matrix is None:
+            matrix = self.allowance_matrix()
+        for token, info in matrix["tokens"].items():
             try:
                 print(f"\n{token} Allowances for SoDiamond:")
                 print("-" * 50)
-                allowances = self.check_all_allowances(token)
-                for protocol, amount in allowances.items():
-                    formatted_amount = self.format_amount(amount, token)
+                print(f"{info['address']}\n")
+                for protocol, allowance in info["allowances"].items():
+                    if allowance["amount"] is None:
+                        print(f"{protocol:<15}: read error")
+                        continue
+                    formatted_amount = self.format_amount(allowance["amount"], token)
                     print(f"{protocol:<15}: {formatted_amount}")
 
             except Exception as e:
@@ -148,6 +266,147 @@ class SoDiamondAllowanceChecker:
         print("/" * 50)
 
 
+def audit_allowances(configs: List[ChainConfig], show: bool = False) -> dict:
+    """
+    Check all chains concurrently
+
+    Returns:
+        Snapshot {"timestamp", "chains": {chain_id: allowance matrix}}, a chain
+        that can not be checked has {"chain_id", "so_diamond", "error"}
+    """
+
+    def check(config: ChainConfig):
+        checker = SoDiamondAllowanceChecker(config)
+        try:
+            matrix = checker.allowance_matrix()
+        except Exception as e:
+            return config, checker, {"chain_id": config.chain_id, "so_diamond": config.so_diamond, "error": str(e)}
+        return config, checker, matrix
+
+    with ThreadPoolExecutor(max_workers=max(len(configs), 1)) as executor:
+        results = list(executor.map(check, configs))
+
+    chains = {}
+    for config, checker, matrix in results:
+        chains[str(config.chain_id)] = matrix
+        if not show:
+            continue
+        if "error" in matrix:
+            print(f"Error checking chain {config.chain_id}: {matrix['error']}")
+        else:
+            checker.show_allowances(matrix)
+    return {"timestamp": int(time.time()), "chains": chains}
+
+
+def allowance_errors(snapshot: dict) -> List[dict]:
+    """
+    Chains and allowances of a snapshot that could not be read
+
+    Returns:
+        [{"chain_id", "token", "protocol", "error"}], token and protocol are
+        None for a chain that could not be checked at all
+    """
+    errors = []
+    for chain_id, matrix in snapshot["chains"].items():
+        if "error" in matrix:
+            errors.append({"chain_id": chain_id, "token": None, "protocol": None, "error": matrix["error"]})
+            continue
+        for token, info in matrix["tokens"].items():
+            for protocol, allowance in info["allowances"].items():
+                if allowance["amount"] is None:
+                    errors.append({
+                        "chain_id": chain_id, "token": token, "protocol": protocol, "error": "eth_call failed",
+                    })
+    return errors
+
+
+def diff_allowances(previous: dict, current: dict) -> List[dict]:
+    """
+    Allowances that differ between two snapshots
+
+    Allowances that could not be read in either snapshot are left out, see
+    `allowance_errors`.
+
+    Returns:
+        [{"chain_id", "token", "token_address", "protocol", "spender", "before", "after"}],
+        "before" is None for a pair missing from `previous`
+    """
+    changes = []
+    for chain_id, matrix in current["chains"].items():
+        if "error" in matrix:
+            continue
+        previous_matrix = previous.get("chains", {}).get(chain_id, {})
+        if "error" in previous_matrix:
+            continue
+        previous_tokens = previous_matrix.get("tokens", {})
+        for token, info in matrix["tokens"].items():
+            previous_allowances = previous_tokens.get(token, {}).get("allowances", {})
+            for protocol, allowance in info["allowances"].items():
+                if allowance["amount"] is None:
+                    continue
+                if protocol in previous_allowances and previous_allowances[protocol]["amount"] is None:
+                    continue
+                before = previous_allowances.get(protocol, {}).get("amount", None)
+                if before != allowance["amount"]:
+                    changes.append({
+                        "chain_id": matrix["chain_id"],
+                        "token": token,
+                        "token_address": info["address"],
+                        "protocol": protocol,
+                        "spender": allowance["spender"],
+                        "before": before,
+                        "after": allowance["amount"],
+                    })
+    return changes
+
+
+def revocation_plan(current: dict, previous: dict = None) -> Dict[str, dict]:
+    """
+    Nonzero allowances to clear, grouped per chain and token
+
+    With `previous`, only allowances that are new or changed since that
+    snapshot are included.
+
+    Returns:
+        {chain_id: {"chain_id", "so_diamond", "clear": [{"token", "token_address", "spenders"}]}}
+    """
+    if previous is not None:
+        changed = {
+            (str(v["chain_id"]), v["token"], v["protocol"])
+            for v in diff_allowances(previous, current)
+        }
+    plan = {}
+    for chain_id, matrix in current["chains"].items():
+        if "error" in matrix:
+            continue
+        clear = []
+        for token, info in matrix["tokens"].items():
+            spenders = [
+                allowance["spender"]
+                for protocol, allowance in info["allowances"].items()
+                if allowance["amount"] is not None and allowance["amount"] > 0
+                and (previous is None or (chain_id, token, protocol) in changed)
+            ]
+            if spenders:
+                clear.append({"token": token, "token_address": info["address"], "spenders": spenders})
+        if clear:
+            plan[chain_id] = {
+                "chain_id": matrix["chain_id"],
+                "so_diamond": matrix["so_diamond"],
+                "clear": clear,
+            }
+    return plan
+
+
+def read_snapshot(file: str) -> dict:
+    with open(file) as f:
+        return json.load(f)
+
+
+def write_snapshot(file: str, data):
+    with open(file, "w") as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+
 
 ETH_CONFIG = ChainConfig(
     chain_id=1,
@@ -408,20 +667,46 @@ CORE_CONFIG = ChainConfig(
     }
 )
 
-if __name__ == "__main__":
-    SoDiamondAllowanceChecker(ETH_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(BSC_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(BASE_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(AVAX_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(POL_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(ARB_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(OP_CONFIG).show_allowances()
-    SoDiamondAllowanceChecker(ZKSYNC_CONFIG).show_allowances()
-
-    # SoDiamondAllowanceChecker(ZKEVM_CONFIG).show_allowances()
-    # SoDiamondAllowanceChecker(LINEA_CONFIG).show_allowances()
-    # SoDiamondAllowanceChecker(METIS_CONFIG).show_allowances()
-    # SoDiamondAllowanceChecker(MANTLE_CONFIG).show_allowances()
-    # SoDiamondAllowanceChecker(CORE_CONFIG).show_allowances()
-
+MAIN_CONFIGS = [
+    ETH_CONFIG,
+    BSC_CONFIG,
+    BASE_CONFIG,
+    AVAX_CONFIG,
+    POL_CONFIG,
+    ARB_CONFIG,
+    OP_CONFIG,
+    ZKSYNC_CONFIG,
+    # ZKEVM_CONFIG,
+    # LINEA_CONFIG,
+    # METIS_CONFIG,
+    # MANTLE_CONFIG,
+    # CORE_CONFIG,
     # Ignore bevm-canary, scroll, opbnb
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="write the allowance snapshot to this json file")
+    parser.add_argument("--diff", help="previous snapshot, print the changed allowances")
+    parser.add_argument("--plan", help="write the allowances to clear to this json file, "
+                                       "only the changed ones with --diff")
+    parser.add_argument("--quiet", action="store_true", help="do not print the allowances")
+    args = parser.parse_args()
+
+    snapshot = audit_allowances(MAIN_CONFIGS, show=not args.quiet)
+    if args.output:
+        write_snapshot(args.output, snapshot)
+    for error in allowance_errors(snapshot):
+        if error["token"] is None:
+            print(f"chain {error['chain_id']} not checked: {error['error']}")
+        else:
+            print(f"chain {error['chain_id']} {error['token']} -> {error['protocol']}: {error['error']}")
+
+    previous = read_snapshot(args.diff) if args.diff else None
+    if previous is not None:
+        for change in diff_allowances(previous, snapshot):
+            print(f"chain {change['chain_id']} {change['token']} -> {change['protocol']}: "
+                  f"{change['before']} => {change['after']}")
+    if args.plan:
+        write_snapshot(args.plan, revocation_plan(snapshot, previous))
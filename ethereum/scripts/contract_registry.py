@@ -0,0 +1,103 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from brownie import Contract, network
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector
+
+
+class AbiInfo:
+    """Selectors and event topics of one abi, computed once"""
+
+    def __init__(self, abi: List[dict]):
+        self.abi = abi
+        # 0x selector -> function abi
+        self.selectors: Dict[str, dict] = {}
+        # 0x topic0 -> event abi
+        self.topics: Dict[str, dict] = {}
+        self.events: Dict[str, dict] = {}
+        for item in abi:
+            if item.get("type") == "function":
+                self.selectors["0x" + function_abi_to_4byte_selector(item).hex()] = item
+            elif item.get("type") == "event" and not item.get("anonymous", False):
+                self.topics["0x" + event_abi_to_log_topic(item).hex()] = item
+                self.events[item["name"]] = item
+
+    def event_abi(self, event_name: str) -> Optional[dict]:
+        return self.events.get(event_name, None)
+
+    def event_by_topic(self, topic0) -> Optional[dict]:
+        if not isinstance(topic0, str):
+            topic0 = topic0.hex()
+        if not topic0.startswith("0x"):
+            topic0 = "0x" + topic0
+        return self.topics.get(topic0.lower(), None)
+
+
+class ContractRegistry:
+    """Brownie contract handles and config lookups per network
+
+    `Contract.from_abi` parses the abi and builds every method on each call,
+    so handles are built once per (network, address, abi) and reused. Each
+    network has its own cache, a lookup never returns an entry built for
+    another network, and switching back and forth keeps both warm. Abis are
+    keyed by identity, project and interface abis are long lived lists, the
+    registry keeps a reference so the identity stays valid.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # network -> key -> value
+        self._contracts: Dict[str, Dict[tuple, Any]] = {}
+        self._values: Dict[str, Dict[Any, Any]] = {}
+        self._abis: Dict[int, AbiInfo] = {}
+
+    def contract(self, name: str, address: str, abi: List[dict]):
+        net = network.show_active()
+        key = (str(address).lower(), id(abi))
+        with self._lock:
+            contracts = self._contracts.setdefault(net, {})
+            if key not in contracts:
+                contracts[key] = (Contract.from_abi(name, address, abi), abi)
+            return contracts[key][0]
+
+    def cached(self, key, factory: Callable[[], Any]):
+        """Memoize `factory()` for the active network, e.g. config lookups"""
+        net = network.show_active()
+        with self._lock:
+            values = self._values.setdefault(net, {})
+            if key not in values:
+                values[key] = factory()
+            return values[key]
+
+    def abi_info(self, abi: List[dict]) -> AbiInfo:
+        """Not network specific"""
+        with self._lock:
+            if id(abi) not in self._abis:
+                self._abis[id(abi)] = AbiInfo(abi)
+            return self._abis[id(abi)]
+
+    def clear(self, net: str = None):
+        """Drop the entries of `net`, or of every network"""
+        with self._lock:
+            if net is None:
+                self._contracts.clear()
+                self._values.clear()
+            else:
+                self._contracts.pop(net, None)
+                self._values.pop(net, None)
+
+
+_registry = ContractRegistry()
+
+
+def get_contract_registry() -> ContractRegistry:
+    return _registry
+
+
+def get_contract(name: str, address: str, abi: List[dict]):
+    """Cached `Contract.from_abi(name, address, abi)` for the active network"""
+    return _registry.contract(name, address, abi)
+
+
+def get_abi_info(abi: List[dict]) -> AbiInfo:
+    return _registry.abi_info(abi)
@@ -4,7 +4,6 @@
 import contextlib
 import functools
 import json
-import multiprocessing
 import os
 import traceback
 from pathlib import Path
@@ -22,8 +21,6 @@ try:
         GenericSwapFacet,
         CoreBridgeFacet,
         interface,
-        Contract,
-        ERC20,
         LibSwap,
         config,
         LibSoFeeStargateV1,
@@ -42,6 +39,7 @@ except:
     pass
 from sui_brownie.parallelism import ProcessExecutor
 
+from scripts.contract_registry import get_contract
 from scripts.helpful_scripts import (
     change_network,
     get_wormhole_bridge,
@@ -53,6 +51,13 @@ from scripts.helpful_scripts import (
     get_swap_info,
     get_stargate_chain_id,
 )
+from scripts.stargate_topology import (
+    crawl_chain_paths,
+    crawl_pools,
+    get_stargate_factory,
+    stargate_chains,
+)
+from scripts.token_metadata import get_token_metadata_cache
 
 from scripts.wormhole import (
     get_all_warpped_token,
@@ -68,13 +73,14 @@ stragate_file = os.path.join(root_path, "export/StargateInfo.json")
 deployed_file = os.path.join(root_path, "export/ContractDeployed.json")
 
 mainnet_swap_file = os.path.join(root_path, "export/mainnet/OmniSwapInfo.json")
-lock = multiprocessing.Lock()
 
 
 def write_file(file: str, data):
     print("save to:", file)
-    with open(file, "w") as f:
+    tmp = f"{file}.{os.getpid()}"
+    with open(tmp, "w") as f:
         json.dump(data, f, indent=4, sort_keys=True)
+    os.replace(tmp, file)
 
 
 def fit_mainnet_stargate_chain_path():
@@ -93,29 +99,28 @@ def fit_mainnet_stargate_chain_path():
     write_file(omni_swap_file, omni_swap_infos)
 
 
-def get_stragate_pool_infos():
+def get_stragate_pool_infos(save=True):
     omni_swap_infos = read_json(mainnet_swap_file)
     stargate_router_address = get_stargate_router()
     if stargate_router_address == "":
         return [], []
 
-    stargate_router = Contract.from_abi(
+    stargate_router = get_contract(
         "IStargate", stargate_router_address, interface.IStargate.abi
     )
     bridge_address = stargate_router.bridge()
-    bridge = Contract.from_abi(
+    bridge = get_contract(
         "IStargateBridge", bridge_address, interface.IStargateBridge.abi
     )
     endpoint_address = bridge.layerZeroEndpoint()
-    endpoint = Contract.from_abi(
+    endpoint = get_contract(
         "ILayerZeroEndpoint", endpoint_address, interface.ILayerZeroEndpoint.abi
     )
     ultra_light_node_address = endpoint.defaultSendLibrary()
     factory_address = stargate_router.factory()
-    factory = Contract.from_abi(
+    factory = get_contract(
         "IStargateFactory", factory_address, interface.IStargateFactory.abi
     )
-    pools_length = factory.allPoolsLength()
     all_stragate_info = {
         "router": stargate_router_address,
         "bridge": bridge_address,
@@ -123,107 +128,114 @@ def get_stragate_pool_infos():
         "ultra_light_node": ultra_light_node_address,
         "factory": factory_address,
     }
-    pool_info = []
-    for i in range(pools_length):
-        pool_address = factory.allPools(i)
-        if pool_address == zero_address():
-            continue
-        pool = Contract.from_abi(
-            "IStargatePool", pool_address, interface.IStargatePool.abi
-        )
-        pool_id = pool.poolId()
-        token_address = pool.token()
-        token = Contract.from_abi("ERC20", token_address, ERC20.abi)
-        pool_info.append(
-            {
-                "TokenAddress": token_address,
-                "TokenName": token.symbol(),
-                "Decimal": token.decimals(),
-                "PoolId": pool_id,
-            }
-        )
+    net = network.show_active()
+    known_pools = omni_swap_infos[net].get("StargatePool", []) if net in omni_swap_infos else []
+    pool_info, changed = crawl_pools(factory, known_pools)
     all_stragate_info["pools"] = pool_info
     pprint(all_stragate_info)
-    omni_swap_infos[network.show_active()]["StargatePool"] = pool_info
-    write_file(mainnet_swap_file, omni_swap_infos)
+    if changed and save and net in omni_swap_infos:
+        omni_swap_infos[net]["StargatePool"] = pool_info
+        write_file(mainnet_swap_file, omni_swap_infos)
     return pool_info, all_stragate_info
 
 
-def get_stargate_pair_chain_path(omni_swap_infos, net1, net2):
-    from brownie import project, Contract
+def load_project():
+    from brownie import project
     p = project.load(project_path=Path(__file__).parent.parent, raise_if_loaded=False)
     p.load_config()
-    if "aptos" in net1 or "aptos" in net2:
-        return
-    change_network(net1)
-    stargate_router_address = get_stargate_router()
-    if stargate_router_address == "":
-        return
-    stargate_router = Contract.from_abi(
-        "IStargate", stargate_router_address, p.interface.IStargate.abi
-    )
-    factory_address = stargate_router.factory()
-    factory = Contract.from_abi(
-        "IStargateFactory", factory_address, p.interface.IStargateFactory.abi
-    )
-    for src_pool_info in omni_swap_infos[net1]["StargatePool"]:
-        pool_address = factory.getPool(src_pool_info["PoolId"])
-        pool = Contract.from_abi(
-            "IStargatePool", pool_address, p.interface.IStargatePool.abi
+
+
+def crawl_net_stargate_pools(omni_swap_infos, net):
+    load_project()
+    try:
+        change_network(net)
+        factory = get_stargate_factory()
+        if factory is None:
+            return net, None, set()
+        pool_info, changed = crawl_pools(factory, omni_swap_infos[net].get("StargatePool", []))
+        return net, pool_info, changed
+    except Exception:
+        print(f"Crawl {net} stargate pools err:{traceback.format_exc()}")
+        return net, None, set()
+
+
+def crawl_net_stargate_chain_paths(omni_swap_infos, net1, chains, changed):
+    load_project()
+    try:
+        change_network(net1)
+        factory = get_stargate_factory()
+        if factory is None:
+            return net1, None
+        dst_chains = {
+            chain_id: omni_swap_infos[net2]["StargatePool"]
+            for net2, chain_id in chains.items()
+            if net2 != net1
+        }
+        if changed is None:
+            src_changed, dst_changed = None, None
+        else:
+            src_changed = changed.get(net1, set())
+            dst_changed = {chains[net2]: v for net2, v in changed.items() if net2 in dst_chains}
+        pool_info = crawl_chain_paths(
+            factory, omni_swap_infos[net1]["StargatePool"], dst_chains, src_changed, dst_changed
         )
-        if "ChainPath" not in src_pool_info:
-            src_pool_info["ChainPath"] = []
-        src_pool_info["ChainPath"] = [tuple(d) for d in src_pool_info["ChainPath"]]
-        for dst_pool_info in omni_swap_infos[net2]["StargatePool"]:
-            flag = False
-            try:
-                result = pool.getChainPath(
-                    omni_swap_infos[net2]["StargateChainId"], dst_pool_info["PoolId"]
-                )
-                flag = result[0]
-            except:
-                pass
-            if not flag:
-                continue
-            tp = (omni_swap_infos[net2]["StargateChainId"], dst_pool_info["PoolId"])
-            if tp not in src_pool_info["ChainPath"]:
-                src_pool_info["ChainPath"].append(
-                    tp
-                )
-    with lock:
-        data = read_json(mainnet_swap_file)
-        data[net1]["StargatePool"] = omni_swap_infos[net1]["StargatePool"]
-        write_file(mainnet_swap_file, data)
+        return net1, pool_info
+    except Exception:
+        print(f"Crawl {net1} stargate chain path err:{traceback.format_exc()}")
+        return net1, None
 
 
-def get_stargate_net_chain_path(omni_swap_infos, net1, nets):
-    for net2 in nets:
-        if "StargateChainId" not in omni_swap_infos[net1]:
-            continue
-        if "StargateChainId" not in omni_swap_infos[net2]:
-            continue
-        if net1 == net2:
-            continue
-        print(f"Get stargate pair chain path net1:{net1}, net2:{net2}")
-        try:
-            get_stargate_pair_chain_path(omni_swap_infos, net1, net2)
-        except:
-            import traceback
-            err = traceback.format_exc()
-            print(f"{net1} -- {net2} err:{err}")
+def run_per_net(funcs):
+    if len(funcs) == 0:
+        return []
+    pt = ProcessExecutor(executor=len(funcs))
+    pt.run(funcs)
+    return pt.get_result() or []
+
+
+def refresh_stargate_chain_paths(omni_swap_infos, chains, changed=None):
+    funcs = [
+        functools.partial(crawl_net_stargate_chain_paths, omni_swap_infos, net1, chains, changed)
+        for net1 in chains
+    ]
+    for net1, pool_info in run_per_net(funcs):
+        if pool_info is not None:
+            omni_swap_infos[net1]["StargatePool"] = pool_info
 
 
 # step1: brownie run --network avax-main scripts/export.py get_stragate_pool_infos
 # step2: brownie run --network arbitrum-main scripts/export.py get_stargate_chain_path
 def get_stargate_chain_path():
     omni_swap_infos = read_json(mainnet_swap_file)
-    nets = list(omni_swap_infos.keys())
-    pt = ProcessExecutor(executor=len(nets))
-    funcs = []
-    for net1 in nets:
-        funcs.append(functools.partial(get_stargate_net_chain_path, omni_swap_infos, net1, nets))
-    pt.run(funcs)
-    # write_file(mainnet_swap_file, omni_swap_infos)
+    chains = stargate_chains(omni_swap_infos, omni_swap_infos.keys())
+    refresh_stargate_chain_paths(omni_swap_infos, chains)
+    write_file(mainnet_swap_file, omni_swap_infos)
+
+
+# Both steps for every net, only reading the paths of new or changed pools,
+# full=True reads the whole chain path matrix again:
+# brownie run --network arbitrum-main scripts/export.py refresh_stargate_topology
+def refresh_stargate_topology(full=False):
+    omni_swap_infos = read_json(mainnet_swap_file)
+    chains = stargate_chains(omni_swap_infos, omni_swap_infos.keys())
+    funcs = [
+        functools.partial(crawl_net_stargate_pools, omni_swap_infos, net)
+        for net in chains
+    ]
+    changed = {}
+    for net, pool_info, net_changed in run_per_net(funcs):
+        if pool_info is None:
+            continue
+        omni_swap_infos[net]["StargatePool"] = pool_info
+        if net_changed:
+            changed[net] = net_changed
+    full = full in (True, "True", "true", "1")
+    if not full and not changed:
+        print("Stargate pools not changed")
+        return
+    print(f"Stargate pools changed: {changed}")
+    refresh_stargate_chain_paths(omni_swap_infos, chains, None if full else changed)
+    write_file(mainnet_swap_file, omni_swap_infos)
 
 
 def get_wormhole_chain_path(net, wormhole_chain_path):
@@ -296,22 +308,25 @@ def get_wormhole_chain_path(net, wormhole_chain_path):
         }
     )
 
+    token_infos = get_token_metadata_cache().token_infos(
+        current_net, [v["SrcTokenAddress"] for v in wrapped_chain_path]
+    )
     wrapped_tokens = []
     for wrapped_token in wrapped_chain_path:
-        erc20 = Contract.from_abi("ERC20", wrapped_token["SrcTokenAddress"], ERC20.abi)
+        symbol, decimals = token_infos[wrapped_token["SrcTokenAddress"]]
         if not wrapped_tokens:
             wrapped_tokens.append(
                 {
                     "ChainPath": [wrapped_token],
-                    "Decimal": erc20.decimals(),
+                    "Decimal": decimals,
                     "NativeToken": False,
-                    "TokenName": erc20.symbol(),
+                    "TokenName": symbol,
                 }
             )
         else:
             exist_wrapped = False
             for token in wrapped_tokens:
-                if token["TokenName"] == erc20.symbol():
+                if token["TokenName"] == symbol:
                     token["ChainPath"].append(wrapped_token)
                     exist_wrapped = True
 
@@ -319,9 +334,9 @@ def get_wormhole_chain_path(net, wormhole_chain_path):
                 wrapped_tokens.append(
                     {
                         "ChainPath": [wrapped_token],
-                        "Decimal": erc20.decimals(),
+                        "Decimal": decimals,
                         "NativeToken": False,
-                        "TokenName": erc20.symbol(),
+                        "TokenName": symbol,
                     }
                 )
 
@@ -330,21 +345,46 @@ def get_wormhole_chain_path(net, wormhole_chain_path):
     return net_support_token
 
 
+def collect_wrapped_chain_path(net):
+    load_project()
+    print(f"[export_wormhole_chain_path] current net: {net}")
+    try:
+        change_network(net)
+        return net, get_all_warpped_token()
+    except Exception:
+        return net, None
+
+
+def collect_wormhole_support_token(net, wormhole_chain_path):
+    load_project()
+    try:
+        return net, get_wormhole_chain_path(net, wormhole_chain_path)
+    except Exception:
+        print(f"Collect {net} wormhole support token err:{traceback.format_exc()}")
+        return net, None
+
+
+def in_net_order(results, networks):
+    """Results of `run_per_net` come back as they finish"""
+    return sorted(results, key=lambda v: networks.index(v[0]))
+
+
 def export_wormhole_chain_path(networks):
     wormhole_chain_path = []
-    for net in networks:
-        print(f"[export_wormhole_chain_path] current net: {net}")
-        try:
-            change_network(net)
-            wormhole_chain_path.extend(get_all_warpped_token())
-        except Exception:
-            continue
+    funcs = [functools.partial(collect_wrapped_chain_path, net) for net in networks]
+    for _net, chain_path in in_net_order(run_per_net(funcs), networks):
+        if chain_path is not None:
+            wormhole_chain_path.extend(chain_path)
 
     omni_swap_infos = read_json(omni_swap_file)
-    for net in networks:
-        if "aptos" in net:
+    funcs = [
+        functools.partial(collect_wormhole_support_token, net, wormhole_chain_path)
+        for net in networks
+        if "aptos" not in net
+    ]
+    for net, net_support_token in run_per_net(funcs):
+        if net_support_token is None:
             continue
-        net_support_token = get_wormhole_chain_path(net, wormhole_chain_path)
         try:
             omni_swap_infos[net]["WormholeSupportToken"] = net_support_token
         except Exception:
@@ -495,99 +535,123 @@ def export_deployed():
     return out
 
 
+def export_net_infos(net):
+    """Deployed contracts and OmniSwap info of one net, run in a worker process
+
+    Errors are caught here, an exception escaping a worker makes the
+    executor drop the results of every net.
+    """
+    load_project()
+    print(f"current net: {net}")
+    try:
+        return net, get_net_infos(net)
+    except Exception:
+        print(f"Export {net} err:{traceback.format_exc()}")
+        return net, None
+
+
+def get_net_infos(net):
+    change_network(net)
+
+    try:
+        # Nets without a wormhole bridge are skipped
+        get_all_warpped_token()
+    except Exception:
+        return None
+
+    try:
+        so_diamond = SoDiamond[-1]
+    except Exception:
+        return None
+    deployed_contracts = export_deployed()
+
+    # Saved to the mainnet file by `export`, not by every worker
+    pool_info, _stargate_info = get_stragate_pool_infos(save=False)
+    try:
+        weth = get_token_address("weth")
+    except Exception:
+        weth = ""
+    swap_router = []
+    swap_types = []
+    with contextlib.suppress(Exception):
+        swap_info = get_swap_info()
+        for swap_type in swap_info:
+            cur_swap = swap_info[swap_type]
+            swap_router_address = cur_swap["router"]
+            swap_token_list = cur_swap.get("token_list", "")
+            quoter_address = cur_swap.get("quoter", "")
+            swap_name = cur_swap.get("name", "")
+            swap_router.append(
+                {
+                    "Name": swap_name,
+                    "RouterAddress": swap_router_address,
+                    "Type": swap_type,
+                    "TokenList": swap_token_list,
+                    "QuoterAddressForUniswapV3": quoter_address,
+                }
+            )
+            swap_types.append(swap_type)
+    omni_swap_info = {
+        "OmniBtcChainId": config["networks"][net]["omnibtc_chainid"],
+        "SoDiamond": so_diamond.address,
+        "ChainId": config["networks"][net]["chainid"],
+        "WormholeBridge": get_wormhole_bridge(),
+        "WormholeChainId": get_wormhole_chainid(),
+        "WormholeSupportToken": get_wormhole_support_token(net),
+        "StargateRouter": get_stargate_router(),
+        "StargateChainId": get_stargate_chain_id(),
+        "StargatePool": pool_info,
+        "WETH": weth,
+        "UniswapRouter": swap_router,
+    }
+    return deployed_contracts, omni_swap_info, swap_types
+
+
+# Nets are exported in parallel worker processes, token metadata and wrapped
+# assets come from the token metadata cache, and the export files are merged
+# and written once, only when their content changed.
 def export(*arg):
     if not arg:
         arg = list(config["networks"].keys())
         del arg[arg.index("default")]
         del arg[arg.index("live")]
         del arg[arg.index("development")]
+    arg = list(arg)
     omni_swap_infos = read_json(omni_swap_file)
-    stargate_infos = read_json(stragate_file)
     deployed_contracts = read_json(deployed_file)
+    mainnet_swap_infos = read_json(mainnet_swap_file)
+    old_mainnet_swap_infos = json.loads(json.dumps(mainnet_swap_infos))
+    old_omni_swap_infos = json.loads(json.dumps(omni_swap_infos))
+    old_deployed_contracts = json.loads(json.dumps(deployed_contracts))
     swap_types = {}
-    wormhole_chain_path = []
-
-    for net in arg:
-        print(f"current net: {net}")
-        change_network(net)
 
-        try:
-            wormhole_chain_path.extend(get_all_warpped_token())
-        except Exception:
+    funcs = [functools.partial(export_net_infos, net) for net in arg]
+    for net, result in in_net_order(run_per_net(funcs), arg):
+        if result is None:
             continue
+        deployed_contracts[net], omni_swap_infos[net], net_swap_types = result
+        if net in mainnet_swap_infos and omni_swap_infos[net]["StargatePool"]:
+            mainnet_swap_infos[net]["StargatePool"] = omni_swap_infos[net]["StargatePool"]
+        for swap_type in net_swap_types:
+            swap_types[swap_type] = True
+
+    for swap_type in swap_types:
+        write_file(
+            os.path.join(root_path, f"export/abi/{swap_type}.json"),
+            getattr(interface, swap_type).abi,
+        )
+    if swap_types:
+        write_file(
+            os.path.join(root_path, "export/abi/IQuoter.json"),
+            getattr(interface, "IQuoter").abi,
+        )
 
-        try:
-            so_diamond = SoDiamond[-1]
-        except Exception:
-            continue
-        deployed_contracts[net] = export_deployed()
-
-        pool_info, stargate_info = get_stragate_pool_infos()
-        stargate_infos[net] = stargate_info
-        try:
-            weth = get_token_address("weth")
-        except Exception:
-            weth = ""
-        swap_router = []
-        with contextlib.suppress(Exception):
-            swap_info = get_swap_info()
-            for swap_type in swap_info:
-                cur_swap = swap_info[swap_type]
-                swap_router_address = cur_swap["router"]
-                swap_token_list = cur_swap.get("token_list", "")
-                quoter_address = cur_swap.get("quoter", "")
-                swap_name = cur_swap.get("name", "")
-                swap_router.append(
-                    {
-                        "Name": swap_name,
-                        "RouterAddress": swap_router_address,
-                        "Type": swap_type,
-                        "TokenList": swap_token_list,
-                        "QuoterAddressForUniswapV3": quoter_address,
-                    }
-                )
-                if swap_type not in swap_types:
-                    write_file(
-                        os.path.join(root_path, f"export/abi/{swap_type}.json"),
-                        getattr(interface, swap_type).abi,
-                    )
-                swap_types[swap_type] = True
-            write_file(
-                os.path.join(root_path, "export/abi/IQuoter.json"),
-                getattr(interface, "IQuoter").abi,
-            )
-        omni_swap_infos[net] = {
-            "OmniBtcChainId": config["networks"][net]["omnibtc_chainid"],
-            "SoDiamond": so_diamond.address,
-            "ChainId": config["networks"][net]["chainid"],
-            "WormholeBridge": get_wormhole_bridge(),
-            "WormholeChainId": get_wormhole_chainid(),
-            "WormholeSupportToken": get_wormhole_support_token(net),
-            "StargateRouter": get_stargate_router(),
-            "StargateChainId": get_stargate_chain_id(),
-            "StargatePool": pool_info,
-            "WETH": weth,
-            "UniswapRouter": swap_router,
-        }
-    facets = [
-        DiamondCutFacet,
-        DiamondLoupeFacet,
-        DexManagerFacet,
-        StargateFacet,
-        WithdrawFacet,
-        OwnershipFacet,
-        GenericSwapFacet,
-        WormholeFacet,
-        SerdeFacet,
-        CelerFacet,
-        MultiChainFacet,
-    ]
-    libs = [LibSwap]
-    so_diamond_abi = []
-    for f in facets + libs:
-        so_diamond_abi += f.abi
-
-    write_file(deployed_file, deployed_contracts)
+    if omni_swap_infos != old_omni_swap_infos:
+        write_file(omni_swap_file, omni_swap_infos)
+    if deployed_contracts != old_deployed_contracts:
+        write_file(deployed_file, deployed_contracts)
+    if mainnet_swap_infos != old_mainnet_swap_infos:
+        write_file(mainnet_swap_file, mainnet_swap_infos)
 
 
 def new_export(*args):
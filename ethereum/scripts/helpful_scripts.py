@@ -1,17 +1,21 @@
 import functools
+import itertools
 import json
 import os
-import random
+import pickle
+import threading
+from concurrent.futures import Future
 from multiprocessing import Queue, Process, set_start_method
 from pathlib import Path
-from typing import Union, List
+from typing import Dict, Union, List
 
-import brownie
 from brownie import network, accounts, config, project, web3
 from brownie.network import priority_fee, max_fee
 from brownie.network.web3 import Web3
 from brownie.project import get_loaded_projects
 
+from scripts.rpc_pool import ensure_rpc
+
 NON_FORKED_LOCAL_BLOCKCHAIN_ENVIRONMENTS = ["hardhat", "development", "ganache"]
 LOCAL_BLOCKCHAIN_ENVIRONMENTS = NON_FORKED_LOCAL_BLOCKCHAIN_ENVIRONMENTS + [
     "mainnet-fork",
@@ -147,9 +151,62 @@ def find_loaded_projects(name):
 class TaskType:
     Execute = "execute"
     ExecuteWithProject = "execute_with_project"
+    Batch = "batch"
+
+
+def _run_task(task_type, task, p):
+    if task_type == TaskType.Execute:
+        return task()
+    elif task_type == TaskType.ExecuteWithProject:
+        return task(p=p)
+    else:
+        return [_run_task(sub_type, sub_task, p) for sub_type, sub_task in task]
+
+
+def _picklable_error(e: Exception) -> Exception:
+    try:
+        pickle.dumps(e)
+        return e
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+
+
+def _session_work(
+    net: str,
+    project_path,
+    name,
+    task_queue: Queue,
+    result_queue: Queue,
+    **kwargs,
+):
+    p = project.load(project_path, name=name)
+    p.load_config()
+    change_network(net)
+    if "arbitrum-test" in network.show_active():
+        priority_fee("1 gwei")
+        max_fee("1.25 gwei")
+    print(f"network {net} is connected!")
+    while True:
+        item = task_queue.get()
+        if item is None:
+            return
+        task_id, task_type, task = item
+        try:
+            result_queue.put((task_id, True, _run_task(task_type, task, p)))
+        except Exception as e:
+            result_queue.put((task_id, False, _picklable_error(e)))
+
+
+class Session:
+    """Brownie worker processes connected to one network
 
+    Tasks are tagged with an id and queued without waiting, so several can
+    be in flight; `put_task_async` returns a Future resolved by a collector
+    thread. With one worker (the default) tasks run in submission order,
+    which matters for transactions from the same account. More `workers`
+    only suit read only tasks.
+    """
 
-class Session(Process):
     def __init__(
         self,
         net: str,
@@ -159,48 +216,88 @@ class Session(Process):
         kwargs={},
         *,
         daemon=None,
+        workers: int = 1,
     ):
         self.net = net
         self.project_path = project_path
+        self.name = name
         try:
             set_start_method("spawn")
         except:
             pass
-        self.task_queue = Queue(maxsize=1)
-        self.result_queue = Queue(maxsize=1)
-
-        super().__init__(
-            group=group,
-            target=self.work,
-            name=name,
-            args=(self.task_queue, self.result_queue),
-            kwargs=kwargs,
-            daemon=daemon,
-        )
-        self.start()
-
-    def work(self, task_queue: Queue, result_queue: Queue):
-        p = project.load(self.project_path, name=self.name)
-        p.load_config()
-        change_network(self.net)
-        if "arbitrum-test" in network.show_active():
-            priority_fee("1 gwei")
-            max_fee("1.25 gwei")
-        print(f"network {self.net} is connected!")
+        self.task_queue = Queue()
+        self.result_queue = Queue()
+        self._task_ids = itertools.count()
+        self._futures: Dict[int, Future] = {}
+        self._futures_lock = threading.Lock()
+        self.processes = [
+            Process(
+                group=group,
+                target=_session_work,
+                name=name if workers == 1 else f"{name}-{i}",
+                args=(net, project_path, name, self.task_queue, self.result_queue),
+                kwargs=kwargs,
+                daemon=daemon,
+            )
+            for i in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
         while True:
-            task_type, task = task_queue.get()
-            if task_type == TaskType.Execute:
-                result_queue.put(task())
+            task_id, ok, result = self.result_queue.get()
+            with self._futures_lock:
+                future = self._futures.pop(task_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
             else:
-                result_queue.put(task(p=p))
-
-    def put_task(self, func, args=(), with_project=False):
+                future.set_exception(result)
+
+    def _submit(self, task_type, task) -> Future:
+        future = Future()
+        with self._futures_lock:
+            task_id = next(self._task_ids)
+            self._futures[task_id] = future
+        self.task_queue.put((task_id, task_type, task))
+        return future
+
+    @staticmethod
+    def _make_task(func, args=(), with_project=False):
         task = functools.partial(func, *args)
         if with_project:
-            self.task_queue.put((TaskType.ExecuteWithProject, task))
-        else:
-            self.task_queue.put((TaskType.Execute, task))
-        return self.result_queue.get()
+            return TaskType.ExecuteWithProject, task
+        return TaskType.Execute, task
+
+    def put_task_async(self, func, args=(), with_project=False) -> Future:
+        return self._submit(*self._make_task(func, args, with_project))
+
+    def put_task(self, func, args=(), with_project=False):
+        return self.put_task_async(func, args, with_project).result()
+
+    def put_tasks_async(self, tasks) -> Future:
+        """Run (func, args, with_project) tasks in one round trip, the Future gives their results in order"""
+        return self._submit(
+            TaskType.Batch, [self._make_task(*task) for task in tasks]
+        )
+
+    def put_tasks(self, tasks) -> list:
+        return self.put_tasks_async(tasks).result()
+
+    def terminate(self):
+        for process in self.processes:
+            process.terminate()
+
+    def join(self, timeout=None):
+        for process in self.processes:
+            process.join(timeout)
+
+    def is_alive(self) -> bool:
+        return any(process.is_alive() for process in self.processes)
 
 
 class PersistentDictionary:
@@ -467,16 +564,5 @@ def get_account_address():
 
 
 def reconnect_random_rpc(net=None):
-    if net is None:
-        net = network.show_active()
-    endpoints: list = config["networks"][net]["endpoints"]
-    while True:
-        try:
-            brownie.web3.eth.get_block_number()
-            break
-        except:
-            pass
-        brownie.web3.disconnect()
-        rpc_url = random.choice(endpoints)
-        print("rpc_url", rpc_url)
-        brownie.web3.connect(rpc_url)
+    """Keep the connection while healthy, else move to the best endpoint of the pool"""
+    ensure_rpc(net)
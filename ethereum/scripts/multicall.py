@@ -0,0 +1,67 @@
+from typing import Any, List, Sequence, Tuple
+
+from brownie import Contract, Multicall3
+
+# Same address on most evm chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+def get_multicall():
+    """Multicall3 deployed by this project on the active network, else the canonical one"""
+    try:
+        return Multicall3[-1]
+    except IndexError:
+        return Contract.from_abi("Multicall3", MULTICALL3_ADDRESS, Multicall3.abi)
+
+
+def multicall(
+        calls: Sequence[Tuple[Any, tuple]],
+        batch_size: int = 500,
+        block_identifier=None,
+) -> List[Tuple[bool, Any]]:
+    """Run view calls with Multicall3.aggregate3, one eth_call per `batch_size`
+
+    `calls` are (brownie ContractCall, args) pairs, e.g.
+    (fee.getPriceRatio, (chain_id,)). Return (success, decoded output) per
+    call, a reverted call gives (False, None).
+    """
+    mc = get_multicall()
+    result = []
+    for start in range(0, len(calls), batch_size):
+        batch = calls[start: start + batch_size]
+        encoded = [
+            (fn._address, True, fn.encode_input(*args))
+            for fn, args in batch
+        ]
+        outputs = mc.aggregate3.call(encoded, block_identifier=block_identifier)
+        for (fn, _), (success, data) in zip(batch, outputs):
+            if not success:
+                result.append((False, None))
+                continue
+            try:
+                result.append((True, fn.decode_output(data)))
+            except Exception:
+                result.append((False, None))
+    return result
+
+
+def multicall_transaction(
+        calls: Sequence[Tuple[Any, tuple]],
+        tx_params: dict,
+        batch_size: int = 20,
+) -> list:
+    """Send calls through Multicall3.aggregate3, one transaction per `batch_size`
+
+    Failing calls do not revert the batch. Multicall3 is msg.sender, so only
+    for calls anyone may make, e.g. a Celer bridge withdraw. Return the
+    transaction of every batch.
+    """
+    mc = get_multicall()
+    txs = []
+    for start in range(0, len(calls), batch_size):
+        encoded = [
+            (fn._address, True, fn.encode_input(*args))
+            for fn, args in calls[start: start + batch_size]
+        ]
+        txs.append(mc.aggregate3(encoded, tx_params))
+    return txs
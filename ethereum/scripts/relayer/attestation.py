@@ -0,0 +1,297 @@
+import functools
+import heapq
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from .processed_store import ProcessedStore, get_processed_store
+
+logger = logging.getLogger()
+
+IRIS_MAINNET_URL = "https://iris-api.circle.com/v1/attestations/"
+IRIS_SANDBOX_URL = "https://iris-api-sandbox.circle.com/v1/attestations/"
+
+ATTESTATION_NAMESPACE = "cctp_attestation"
+
+# (msg_hash, attestation), attestation is None when the poller gave up
+ReadyCallback = Callable[[str, Optional[str]], None]
+
+
+def get_iris_url(net: str) -> str:
+    return IRIS_SANDBOX_URL if "test" in net else IRIS_MAINNET_URL
+
+
+def is_attestation(data) -> bool:
+    if not isinstance(data, str) or not data.startswith("0x") or len(data) % 2 != 0:
+        return False
+    try:
+        bytes.fromhex(data[2:])
+        return True
+    except ValueError:
+        return False
+
+
+class RateLimiter:
+    """Token bucket shared by the polling threads"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(int(rate), 1)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Tracked:
+    __slots__ = ("msg_hash", "delay", "deadline", "callbacks")
+
+    def __init__(self, msg_hash: str, delay: float, deadline: float):
+        self.msg_hash = msg_hash
+        self.delay = delay
+        self.deadline = deadline
+        self.callbacks: List[ReadyCallback] = []
+
+
+class AttestationPoller:
+    """Poll Circle's Iris api for outstanding CCTP message hashes
+
+    `track` registers a message hash and returns at once. A scheduler thread
+    polls due hashes on a worker pool under a shared rate limit; a hash
+    still pending, rate limited or failing is polled again after an
+    exponential backoff from `min_delay` up to `max_delay`, and dropped
+    after `max_age` seconds. Attestations are persisted in the processed
+    store, so they are served without a request after a restart, and
+    handed to the callbacks given to `track`. `close` stops the polling.
+    """
+
+    def __init__(
+            self,
+            base_url: str,
+            store: ProcessedStore = None,
+            max_workers: int = 4,
+            rate: float = 10,
+            min_delay: float = 2,
+            max_delay: float = 5 * 60,
+            max_age: float = 24 * 60 * 60,
+            timeout: float = 10,
+    ):
+        self.base_url = base_url
+        self.store = store if store is not None else get_processed_store()
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        self._cache: Dict[str, str] = {}
+        self._tracked: Dict[str, _Tracked] = {}
+        # (next poll time, msg_hash)
+        self._schedule = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="iris")
+        self._scheduler = threading.Thread(target=self._schedule_loop, daemon=True)
+        self._scheduler.start()
+
+    def close(self):
+        """Stop polling, hashes still tracked are dropped without callback"""
+        self._closed.set()
+        self._wake.set()
+        self._scheduler.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def get(self, msg_hash: str) -> Optional[str]:
+        """Known attestation of `msg_hash`, never sends a request"""
+        msg_hash = msg_hash.lower()
+        if msg_hash in self._cache:
+            return self._cache[msg_hash]
+        attestation = self.store.get(ATTESTATION_NAMESPACE, msg_hash)
+        if attestation:
+            self._cache[msg_hash] = attestation
+            return attestation
+        return None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._tracked)
+
+    def track(self, msg_hash: str, on_ready: ReadyCallback = None):
+        """Poll `msg_hash` until attested
+
+        `on_ready` runs on a poller thread, or at once when the attestation
+        is already known.
+        """
+        msg_hash = msg_hash.lower()
+        attestation = self.get(msg_hash)
+        if attestation is not None:
+            if on_ready is not None:
+                on_ready(msg_hash, attestation)
+            return
+        with self._lock:
+            tracked = self._tracked.get(msg_hash, None)
+            if tracked is None:
+                tracked = _Tracked(msg_hash, self.min_delay, time.time() + self.max_age)
+                self._tracked[msg_hash] = tracked
+                heapq.heappush(self._schedule, (time.time(), msg_hash))
+            if on_ready is not None:
+                tracked.callbacks.append(on_ready)
+        self._wake.set()
+
+    def request(self, msg_hash: str) -> Optional[str]:
+        """One rate limited request, None while the attestation is not ready"""
+        self.limiter.acquire()
+        response = self.session.get(self.base_url + msg_hash, timeout=self.timeout)
+        if response.status_code == 200:
+            attestation = response.json().get("attestation", None)
+            if is_attestation(attestation):
+                return attestation
+            # PENDING until enough confirmations
+            return None
+        if response.status_code not in (404, 429) and response.status_code < 500:
+            logger.warning(f"Get cctp attestation {msg_hash} status {response.status_code}: {response.text}")
+        # 404 until Iris has seen the message, 429 when rate limited
+        return None
+
+    def fetch(self, msg_hash: str) -> Optional[str]:
+        """Cached attestation or one request now, for one-off scripts"""
+        msg_hash = msg_hash.lower()
+        attestation = self.get(msg_hash)
+        if attestation is None:
+            attestation = self.request(msg_hash)
+            if attestation is not None:
+                self._save(msg_hash, attestation)
+        return attestation
+
+    def _save(self, msg_hash: str, attestation: str):
+        self._cache[msg_hash] = attestation
+        self.store.put(ATTESTATION_NAMESPACE, msg_hash, attestation)
+
+    def _finish(self, msg_hash: str, attestation: Optional[str]):
+        with self._lock:
+            tracked = self._tracked.pop(msg_hash, None)
+        if tracked is None:
+            return
+        for callback in tracked.callbacks:
+            try:
+                callback(msg_hash, attestation)
+            except Exception as e:
+                logger.error(f"Attestation callback for {msg_hash} error: {e}")
+
+    def _poll(self, msg_hash: str):
+        if self._closed.is_set():
+            return
+        try:
+            attestation = self.request(msg_hash)
+        except Exception as e:
+            logger.warning(f"Get cctp attestation {msg_hash} error: {e}")
+            attestation = None
+        if attestation is not None:
+            self._save(msg_hash, attestation)
+            self._finish(msg_hash, attestation)
+            return
+        with self._lock:
+            tracked = self._tracked.get(msg_hash, None)
+            if tracked is None:
+                return
+            expired = time.time() + tracked.delay > tracked.deadline
+            if not expired:
+                heapq.heappush(self._schedule, (time.time() + tracked.delay, msg_hash))
+                tracked.delay = min(tracked.delay * 2, self.max_delay)
+        if expired:
+            logger.warning(f"Give up cctp attestation {msg_hash}")
+            self._finish(msg_hash, None)
+        else:
+            self._wake.set()
+
+    def _schedule_loop(self):
+        while not self._closed.is_set():
+            with self._lock:
+                now = time.time()
+                due = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    due.append(heapq.heappop(self._schedule)[1])
+                wait = self._schedule[0][0] - now if self._schedule else None
+            for msg_hash in due:
+                self._executor.submit(self._poll, msg_hash)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+@functools.lru_cache()
+def get_attestation_poller(net: str) -> AttestationPoller:
+    """One poller per process and Iris environment"""
+    return AttestationPoller(get_iris_url(net))
+
+
+class StubIrisServer:
+    """Local Iris api for tests and dry runs
+
+    Serves GET /v1/attestations/<hash>: 404 until `publish`, then
+    "PENDING" for `pending_polls` requests, then the attestation.
+    """
+
+    def __init__(self, pending_polls: int = 0, host: str = "127.0.0.1", port: int = 0):
+        self.pending_polls = pending_polls
+        self.attestations: Dict[str, str] = {}
+        self.polls: Dict[str, int] = {}
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                msg_hash = self.path.rstrip("/").split("/")[-1].lower()
+                if msg_hash not in stub.attestations:
+                    self._reply(404, {"error": "Message hash not found"})
+                    return
+                stub.polls[msg_hash] = stub.polls.get(msg_hash, 0) + 1
+                if stub.polls[msg_hash] <= stub.pending_polls:
+                    self._reply(200, {"attestation": "PENDING", "status": "pending_confirmations"})
+                else:
+                    self._reply(200, {"attestation": stub.attestations[msg_hash], "status": "complete"})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/attestations/"
+
+    def publish(self, msg_hash: str, attestation: str):
+        self.attestations[msg_hash.lower()] = attestation
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,25 +1,28 @@
 import logging
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import wait, FIRST_COMPLETED
 from datetime import datetime
 from multiprocessing import Process, set_start_method
 from pathlib import Path
 
-import ccxt
-import pandas as pd
 from brownie import project, network, web3
 import threading
 
-from brownie.network.transaction import TransactionReceipt
-from retrying import retry
 from scripts.helpful_scripts import get_account, change_network, reconnect_random_rpc, PersistentDictionary
 from scripts.relayer.select_evm import (
     get_pending_data,
     get_signed_vaa_by_wormhole,
+    submit_signed_vaa_by_wormhole,
     get_chain_id_to_net,
     NET
 )
-from scripts.relayer.wormhole_serder import parseTransferWithPayloadVaa
+from scripts.relayer.gas_ledger import get_gas_ledger
+from scripts.relayer.processed_store import ProcessedStore, get_processed_store
+from scripts.relayer.price_feed import get_net_symbol, get_price_feed
+from scripts.relayer.scheduler import PollTimer
+from scripts.relayer.tx_pipeline import get_tx_pipeline
+from scripts.relayer.wormhole_serder import parse_many
 from scripts.serde import parse_vaa_to_wormhole_payload, get_wormhole_facet
 
 FORMAT = "%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s"
@@ -59,74 +62,143 @@ else:
     ]
 
 
-def get_pending_data_from_solana(dstWormholeChainId):
-    evm_net = network.show_active()
-    if evm_net is None:
-        evm_net = "bsc-test"
-    local_logger = logger.getChild(f"[{evm_net}]")
-    sequence_dict = PersistentDictionary(f"./cache/solana_{evm_net}_sequence.json")
-    dst_diamond = list(filter(lambda d: d["dstNet"] == evm_net, SUPPORTED_EVM))[0]["dstSoDiamond"]
-    dst_diamond = dst_diamond.replace("0x", "").lower()
-    if NET == "mainnet":
-        solana_net = "solana-mainnet"
-    else:
-        solana_net = "solana-testnet"
-    default_value = 25508
-    sequence = sequence_dict.get(solana_net, default_value)
-    emitter_chain_id = 1
-    while True:
-        sequence += 1
-        while True:
-            vaa = get_signed_vaa_by_wormhole(sequence, emitter_chain_id)
-            if vaa is None:
-                local_logger.info(f"Query sequence {sequence} is None, waiting")
-                time.sleep(10)
+class SolanaSequenceScanner:
+    """Scan solana wormhole sequences for vaa redeemed on the active evm network
+
+    Up to `window` sequences are fetched concurrently. Fetched vaa are decoded
+    in order as the contiguous watermark advances, and the watermark is saved
+    every `checkpoint_interval` sequences or `checkpoint_seconds`. The window
+    shrinks to 1 while the next sequence is not signed yet, so an up to date
+    scanner polls a single sequence every `retry_delay` seconds.
+    """
+
+    def __init__(
+            self,
+            dstWormholeChainId: int,
+            window: int = 32,
+            retry_delay: float = 10,
+            checkpoint_interval: int = 100,
+            checkpoint_seconds: float = 60,
+    ):
+        evm_net = network.show_active()
+        if evm_net is None:
+            evm_net = "bsc-test"
+        self.local_logger = logger.getChild(f"[{evm_net}]")
+        self.dstWormholeChainId = dstWormholeChainId
+        self.sequence_dict = PersistentDictionary(f"./cache/solana_{evm_net}_sequence.json")
+        dst_diamond = list(filter(lambda d: d["dstNet"] == evm_net, SUPPORTED_EVM))[0]["dstSoDiamond"]
+        self.dst_diamond = dst_diamond.replace("0x", "").lower()
+        if NET == "mainnet":
+            self.solana_net = "solana-mainnet"
+        else:
+            self.solana_net = "solana-testnet"
+        default_value = 25508
+        self.emitter_chain_id = 1
+        self.window = window
+        self.retry_delay = retry_delay
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_seconds = checkpoint_seconds
+
+        # All sequences <= watermark have been fetched and filtered
+        self.watermark = self.sequence_dict.get(self.solana_net, default_value)
+        self.checkpoint_sequence = self.watermark
+        self.checkpoint_time = time.time()
+        self.span = 1
+        self.in_flight = {}
+        self.fetched = {}
+        self.retry_at = {}
+        self.ready = deque()
+
+    def checkpoint(self, force=False):
+        if self.watermark == self.checkpoint_sequence:
+            return
+        if (
+                force
+                or self.watermark - self.checkpoint_sequence >= self.checkpoint_interval
+                or time.time() - self.checkpoint_time >= self.checkpoint_seconds
+        ):
+            self.sequence_dict.set(self.solana_net, self.watermark)
+            self.checkpoint_sequence = self.watermark
+            self.checkpoint_time = time.time()
+
+    def _fill(self):
+        now = time.time()
+        for sequence in range(self.watermark + 1, self.watermark + self.span + 1):
+            if sequence in self.in_flight or sequence in self.fetched:
+                continue
+            if self.retry_at.get(sequence, 0) > now:
                 continue
+            self.in_flight[sequence] = submit_signed_vaa_by_wormhole(
+                sequence, self.emitter_chain_id
+            )
+
+    def _collect(self):
+        if len(self.in_flight) == 0:
+            retry = [t for s, t in self.retry_at.items() if s <= self.watermark + self.span]
+            time.sleep(max(min(retry, default=time.time()) - time.time(), 0))
+            return
+        done, _ = wait(list(self.in_flight.values()), return_when=FIRST_COMPLETED)
+        for sequence in [s for s, f in self.in_flight.items() if f in done]:
+            future = self.in_flight.pop(sequence)
+            try:
+                vaa = future.result()
+            except Exception as e:
+                self.local_logger.warning(f"Query sequence {sequence} error: {e}")
+                vaa = None
+            if vaa is None:
+                self.retry_at[sequence] = time.time() + self.retry_delay
             else:
-                local_logger.info(f"Query sequence {sequence} finish")
-            break
-        sequence_dict.set(solana_net, sequence)
+                self.retry_at.pop(sequence, None)
+                self.fetched[sequence] = vaa
+
+    def _advance(self):
+        vaas = []
+        while self.watermark + 1 in self.fetched:
+            self.watermark += 1
+            vaas.append(self.fetched.pop(self.watermark))
+        if len(vaas) > 0:
+            self.span = min(self.span * 2, self.window)
+            self.local_logger.info(f"Query sequence to {self.watermark} finish")
+        elif self.watermark + 1 in self.retry_at:
+            if self.span > 1:
+                self.local_logger.info(f"Query sequence {self.watermark + 1} is None, waiting")
+            self.span = 1
+        if len(vaas) == 0:
+            return
+
         try:
-            parsed_vaa, parsed_transfer, parsed_transfer_payload = parseTransferWithPayloadVaa(vaa)
-            parsed_vaa = parsed_vaa.format_json()
-            parsed_transfer = parsed_transfer.format_json()
-            _parsed_transfer_payload = parsed_transfer_payload.format_json()
-        except:
-            continue
-        if dst_diamond not in parsed_transfer["redeemer"].lower():
-            continue
-        if parsed_transfer["redeemerChain"] != dstWormholeChainId:
-            continue
-        info = {'chainName': solana_net,
-                'extrinsicHash': parsed_vaa["hash"],
-                'srcWormholeChainId': parsed_vaa["emitterChain"],
-                'dstWormholeChainId': parsed_transfer["redeemerChain"],
-                'sequence': parsed_vaa["sequence"],
-                'blockTimestamp': parsed_vaa["timestamp"]
-                }
-        return info, vaa
+            batch = parse_many(vaas)
+        except Exception as e:
+            self.local_logger.error(f"Parse sequence to {self.watermark} error: {e}")
+            return
+        for i in batch.mask(redeemer_chain=self.dstWormholeChainId, redeemer=self.dst_diamond).nonzero()[0]:
+            try:
+                parsed_vaa, parsed_transfer, _ = batch.parse(i)
+                info = {'chainName': self.solana_net,
+                        'extrinsicHash': "0x" + parsed_vaa.hash.hex(),
+                        'srcWormholeChainId': parsed_vaa.emitter_chain,
+                        'dstWormholeChainId': parsed_transfer.redeemer_chain,
+                        'sequence': parsed_vaa.sequence,
+                        'blockTimestamp': parsed_vaa.timestamp
+                        }
+            except:
+                continue
+            self.ready.append((info, vaas[i]))
+
+    def next_pending(self):
+        """Block until the next vaa for the destination chain, return (info, vaa)"""
+        while len(self.ready) == 0:
+            self._fill()
+            self._collect()
+            self._advance()
+            self.checkpoint()
+        return self.ready.popleft()
 
 
-@retry
 def get_token_price():
-    kucoin = ccxt.kucoin()
-    result = {}
-    for v in SUPPORTED_EVM:
-        if v["dstNet"] in ["mainnet", "goerli",
-                           "arbitrum-main", "arbitrum-test",
-                           "optimism-main", "optimism-test",
-                           "base-main", "base-test",
-                           ]:
-            result[v["dstWormholeChainId"]] = float(kucoin.fetch_ticker("ETH/USDT")['close'])
-        elif v["dstNet"] in ["bsc-main", "bsc-test"]:
-            result[v["dstWormholeChainId"]] = float(kucoin.fetch_ticker("BNB/USDT")['close'])
-        elif v["dstNet"] in ["polygon-main", "polygon-test"]:
-            result[v["dstWormholeChainId"]] = float(kucoin.fetch_ticker("POL/USDT")['close'])
-        elif v["dstNet"] in ["avax-main", "avax-test"]:
-            result[v["dstWormholeChainId"]] = float(kucoin.fetch_ticker("AVAX/USDT")['close'])
-        else:
-            raise ValueError(f"{v['dstNet']} not found")
-    return result
+    symbols = {v["dstWormholeChainId"]: get_net_symbol(v["dstNet"]) for v in SUPPORTED_EVM}
+    prices = get_price_feed().get(symbols.values())
+    return {k: prices[s] for k, s in symbols.items()}
 
 
 def process_vaa(
@@ -137,11 +209,13 @@ def process_vaa(
         extrinsicHash: str,
         local_logger,
         limit_gas_price=True,
-        price=0
+        price=0,
+        processed_key=None
 ) -> bool:
     try:
-        # Use bsc-test to decode, too slow may need to change bsc-mainnet
-        vaa_data, transfer_data, wormhole_data = parse_vaa_to_wormhole_payload(vaa_str)
+        vaa_data, transfer_data, wormhole_data = parse_vaa_to_wormhole_payload(
+            vaa_str, offline=True
+        )
         dst_max_gas = wormhole_data[1]
         dst_max_gas_price = int(wormhole_data[0])
         if "main" in network.show_active() and dst_max_gas_price == 0:
@@ -178,43 +252,56 @@ def process_vaa(
         local_logger.info(
             f"Start execute emitterChainId:{emitterChainId}, sequence:{sequence}"
         )
-        acc = get_account()
-        if limit_gas_price:
-            result = get_wormhole_facet().completeSoSwap(
-                vaa_str,
-                {"from": acc, "nonce": acc.nonce, "gas_price": dst_max_gas_price},
-            )
-        else:
-            result: TransactionReceipt = get_wormhole_facet().completeSoSwap(
-                vaa_str, {"from": acc, "nonce": acc.nonce}
-            )
-        if isinstance(result.gas_used, int) and isinstance(result.gas_price, int):
+        src_net = get_chain_id_to_net()[vaa_data["emitterChainId"]] \
+            if int(vaa_data["emitterChainId"]) in get_chain_id_to_net() else 0
+        dst_net = network.show_active()
+
+        def on_confirmed(txid, gas_used, gas_price):
             record_gas(
                 dst_max_gas,
                 dst_max_gas_price,
-                result.gas_used,
-                result.gas_price,
-                src_net=get_chain_id_to_net()[vaa_data["emitterChainId"]]
-                if int(vaa_data["emitterChainId"]) in get_chain_id_to_net()
-                else 0,
-                dst_net=network.show_active(),
+                gas_used,
+                gas_price,
+                src_net=src_net,
+                dst_net=dst_net,
                 payload_len=int(len(vaa_str) / 2 - 1),
                 swap_len=len(wormhole_data[3]),
                 sequence=sequence,
                 src_txid=extrinsicHash,
-                dst_txid=result.txid,
+                dst_txid=txid,
                 price=price
             )
+            if processed_key is not None:
+                get_processed_store().put(*processed_key, txid)
             local_logger.info(
-                f"Process emitterChainId:{emitterChainId}, sequence:{sequence}, txid:{result.txid}"
+                f"Process emitterChainId:{emitterChainId}, sequence:{sequence}, txid:{txid}"
                 f" success!"
             )
-        else:
-            local_logger.info(
-                f"Process emitterChainId:{emitterChainId}, sequence:{sequence}, txid:{result.txid}"
-                f" pending!"
+
+        def on_failed(txid, error):
+            local_logger.error(
+                f"Complete so swap for emitterChainId:{emitterChainId}, "
+                f"sequence:{sequence}, txid:{txid} fail: {error}"
             )
-            return False
+
+        def on_pending(txid):
+            # Keep the vaa claimed while its transaction is in flight
+            if processed_key is not None:
+                get_processed_store().renew(*processed_key, 10 * 60)
+
+        tx_params = {"gas_price": dst_max_gas_price} if limit_gas_price else {}
+        txid = get_tx_pipeline(get_account()).submit(
+            get_wormhole_facet().completeSoSwap,
+            vaa_str,
+            tx_params=tx_params,
+            on_confirmed=on_confirmed,
+            on_failed=on_failed,
+            on_pending=on_pending,
+        )
+        local_logger.info(
+            f"Process emitterChainId:{emitterChainId}, sequence:{sequence}, txid:{txid}"
+            f" pending!"
+        )
     except Exception as e:
         local_logger.error(
             f"Complete so swap for emitterChainId:{emitterChainId}, "
@@ -237,7 +324,9 @@ def process_v1(
     last_price_update = 0
     interval_price = 3 * 60
     price_info = {}
-    has_process = {}
+    processed_store = get_processed_store()
+    processed_namespace = f"wormhole_{network.show_active()}"
+    scanner = SolanaSequenceScanner(dstWormholeChainId)
     while True:
         try:
             if time.time() >= interval_price + last_price_update:
@@ -248,7 +337,7 @@ def process_v1(
             local_logger.error(f'Get token price error: {e}')
             continue
         try:
-            d, vaa = get_pending_data_from_solana(dstWormholeChainId)
+            d, vaa = scanner.next_pending()
         except Exception as e:
             local_logger.error(
                 f'Get pending data from solana for {network.show_active()} error: {e}'
@@ -259,17 +348,9 @@ def process_v1(
                 reconnect_random_rpc()
                 local_logger.info(f"Update rpc")
                 last_update_endpoint = time.time()
-            vaa = get_signed_vaa_by_wormhole(int(d["sequence"]), int(d["srcWormholeChainId"]))
-            if vaa is None:
-                local_logger.info(
-                    f'Waiting vaa for emitterChainId: {d["srcWormholeChainId"]}, sequence:{d["sequence"]}')
-                continue
         except Exception as e:
-            local_logger.error(
-                f'Get signed vaa for: emitterChainId: {d["srcWormholeChainId"]}, '
-                f'sequence:{d["sequence"]} error: {e}'
-            )
-            continue
+            # Keep the current rpc, the vaa is already taken from the scanner
+            local_logger.error(f'Update rpc for {network.show_active()} error: {e}')
         try:
             # If gas price not enough, pending 7 day to manual process
             if (time.time() - d["blockTimestamp"]) >= 7 * 24 * 60 * 60 or NET != "mainnet":
@@ -278,18 +359,13 @@ def process_v1(
                 limit_gas_price = True
         except:
             limit_gas_price = True
-        has_key = (int(d["srcWormholeChainId"]), int(d["sequence"]))
-        if (
-                has_key in has_process
-                and (time.time() - has_process[has_key]) <= 10 * 60
-        ):
+        has_key = ProcessedStore.key(int(d["srcWormholeChainId"]), int(d["sequence"]))
+        if not processed_store.claim(processed_namespace, has_key, 10 * 60):
             local_logger.warning(
                 f'emitterChainId:{d["srcWormholeChainId"]} sequence:{d["sequence"]} '
                 f"inner 10min has process!"
             )
             continue
-        else:
-            has_process[has_key] = time.time()
         process_vaa(
             dstSoDiamond=dstSoDiamond,
             vaa_str=vaa,
@@ -298,7 +374,8 @@ def process_v1(
             extrinsicHash=d["extrinsicHash"],
             local_logger=local_logger,
             limit_gas_price=limit_gas_price,
-            price=price_info[d["dstWormholeChainId"]]
+            price=price_info[d["dstWormholeChainId"]],
+            processed_key=(processed_namespace, has_key)
         )
 
 
@@ -315,27 +392,25 @@ def process_v2(
     last_price_update = 0
     interval_price = 3 * 60
     price_info = {}
-    has_process = {}
+    processed_store = get_processed_store()
+    processed_namespace = f"wormhole_{network.show_active()}"
     if "test" in network.show_active() or "test" == "goerli":
         _pending_url = "https://crossswap-pre.coming.chat/v1/getUnSendTransferFromWormhole"
         local_logger.info("Not process v2, end")
         return
     else:
         pending_url = "https://crossswap.coming.chat/v1/getUnSendTransferFromWormhole"
-    last_pending_time = 0
-    pending_interval = 30
+    poll_timer = PollTimer(30, max_interval=5 * 60)
     while True:
+        poll_timer.wait()
         try:
-            if time.time() < last_pending_time + pending_interval:
-                continue
-            else:
-                last_pending_time = time.time()
             pending_data = get_pending_data(url=pending_url, dstWormholeChainId=dstWormholeChainId)
             local_logger.info(f"Get signed vaa length: {len(pending_data)}")
         except Exception as e:
             local_logger.error(
                 f'Get pending data for {network.show_active()} error: {e}'
             )
+            poll_timer.fail()
             continue
 
         try:
@@ -345,7 +420,9 @@ def process_v2(
                 last_price_update = time.time()
         except Exception as e:
             local_logger.error(f'Get token price error: {e}')
+            poll_timer.fail()
             continue
+        poll_timer.succeed()
 
         for d in pending_data:
             try:
@@ -372,18 +449,13 @@ def process_v2(
                     limit_gas_price = True
             except:
                 limit_gas_price = True
-            has_key = (int(d["srcWormholeChainId"]), int(d["sequence"]))
-            if (
-                    has_key in has_process
-                    and (time.time() - has_process[has_key]) <= 10 * 60
-            ):
+            has_key = ProcessedStore.key(int(d["srcWormholeChainId"]), int(d["sequence"]))
+            if not processed_store.claim(processed_namespace, has_key, 10 * 60):
                 local_logger.warning(
                     f'emitterChainId:{d["srcWormholeChainId"]} sequence:{d["sequence"]} '
                     f"inner 10min has process!"
                 )
                 continue
-            else:
-                has_process[has_key] = time.time()
             process_vaa(
                 dstSoDiamond=dstSoDiamond,
                 vaa_str=vaa,
@@ -392,7 +464,8 @@ def process_v2(
                 extrinsicHash=d["extrinsicHash"],
                 local_logger=local_logger,
                 limit_gas_price=limit_gas_price,
-                price=price_info[d["dstWormholeChainId"]]
+                price=price_info[d["dstWormholeChainId"]],
+                processed_key=(processed_namespace, has_key)
             )
 
 
@@ -465,16 +538,7 @@ def record_gas(
         actual_gas = sender_gas
     if not isinstance(actual_gas_price, int):
         actual_gas_price = sender_gas_price
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"{dst_net}_{period1}_{period2}_v1.csv")
     sender_value = sender_gas * sender_gas_price
     actual_value = actual_gas * actual_gas_price
     data = OrderedDict({
@@ -495,13 +559,7 @@ def record_gas(
         "diff_gas": sender_value - actual_value,
         "diff_value": round((sender_value - actual_value) / 1e18 * price, 4)
     })
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode="a")
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode="w")
+    get_gas_ledger(str(file_path), "{dst_net}_{period1}_{period2}_v1.csv").record(data, cur_timestamp)
 
 
 def main():
@@ -6,21 +6,24 @@ import time
 from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 
 import requests
-import ccxt
-import pandas as pd
 
-from brownie import project, network, chain, web3, Contract
+from brownie import project, network, chain, web3
 import threading
 
-from brownie.network.transaction import TransactionReceipt
-from retrying import retry
-from web3._utils.events import get_event_data
-
-from scripts.helpful_scripts import get_account, change_network, get_cctp_message_transmitter, Process, \
-    set_start_method, Queue, reconnect_random_rpc
+from scripts.contract_registry import get_abi_info
+from scripts.helpful_scripts import get_account, change_network, Process, \
+    set_start_method, reconnect_random_rpc
+from scripts.relayer.attestation import get_attestation_poller
+from scripts.relayer.gas_ledger import get_gas_ledger
+from scripts.relayer.log_decoder import LogDecoder
+from scripts.relayer.processed_store import get_processed_store
+from scripts.relayer.price_feed import get_net_symbol, get_price_feed
+from scripts.relayer.scheduler import PollTimer
+from scripts.relayer.tx_pipeline import get_tx_pipeline
+from scripts.relayer.work_queue import WorkQueue
 from scripts.serde import get_cctp_facet
 
 FORMAT = "%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s"
@@ -73,26 +76,10 @@ DOMAIN_TO_NET = {
 }
 
 
-@retry
 def get_token_price():
-    kucoin = ccxt.kucoin()
-    result = {}
-    for v in SUPPORTED_EVM:
-        if v["dstNet"] in ["mainnet", "goerli",
-                           "arbitrum-main", "arbitrum-test",
-                           "optimism-main", "optimism-test",
-                           "base-main", "base-test",
-                           ]:
-            result[v["destinationDomain"]] = float(kucoin.fetch_ticker("ETH/USDT")['close'])
-        elif v["dstNet"] in ["bsc-main", "bsc-test"]:
-            result[v["destinationDomain"]] = float(kucoin.fetch_ticker("BNB/USDT")['close'])
-        elif v["dstNet"] in ["polygon-main", "polygon-test"]:
-            result[v["destinationDomain"]] = float(kucoin.fetch_ticker("POL/USDT")['close'])
-        elif v["dstNet"] in ["avax-main", "avax-test"]:
-            result[v["destinationDomain"]] = float(kucoin.fetch_ticker("AVAX/USDT")['close'])
-        else:
-            raise ValueError(f"{v['dstNet']} not found")
-    return result
+    symbols = {v["destinationDomain"]: get_net_symbol(v["dstNet"]) for v in SUPPORTED_EVM}
+    prices = get_price_feed().get(symbols.values())
+    return {k: prices[s] for k, s in symbols.items()}
 
 
 class CCTPMessage:
@@ -180,84 +167,47 @@ def is_hex(data: str):
         return False
 
 
-@retry
 def get_cctp_attestation(msg_hash):
-    net = network.show_active()
-    if 'test' in net:
-        url = "https://iris-api-sandbox.circle.com/v1/attestations/"
-    else:
-        url = "https://iris-api.circle.com/v1/attestations/"
-
-    url += msg_hash
-    result = requests.get(url)
-    if result.status_code == 200:
-        attestation = result.json()['attestation']
-        if not is_hex(attestation):
-            logger.warning(f"Get cctp attestation: {attestation}")
-            attestation = None
-        return attestation
-    else:
-        logger.warning(f"Get cctp attestation failed: {result.json()['status']}")
-        return None
+    """Cached attestation or one Iris request, None while not attested"""
+    return get_attestation_poller(network.show_active()).fetch(msg_hash)
 
 
-@functools.lru_cache()
 def get_event_abi_by_interface(interface_name, event_name):
     p = project.get_loaded_projects()[-1]
-    for v in getattr(p.interface, interface_name).abi:
-        if v["type"] == "event" and v["name"] == event_name:
-            return v
-    return None
+    return get_abi_info(getattr(p.interface, interface_name).abi).event_abi(event_name)
 
 
-@functools.lru_cache()
 def get_event_abi_by_contract(contract_name, event_name):
     p = project.get_loaded_projects()[-1]
-    for v in getattr(p, contract_name).abi:
-        if v["type"] == "event" and v["name"] == event_name:
-            return v
-    return None
+    return get_abi_info(getattr(p, contract_name).abi).event_abi(event_name)
 
 
-def get_facet_message(tx_hash) -> CCTPFacetMessage:
-    p = project.get_loaded_projects()[-1]
-    cctp_facet = get_cctp_facet()
-    Contract.from_abi("MessageTransmitter",
-                      get_cctp_message_transmitter(),
-                      getattr(p.interface, "IMessageTransmitter").abi
-                      )
-    tx = chain.get_transaction(tx_hash)
-    try:
-        tx_timestamp = tx.timestamp
-    except:
-        tx_timestamp = None
-
-    receipt = web3.eth.get_transaction_receipt(tx_hash)
-    logs = receipt["logs"]
-    message_abi = get_event_abi_by_interface("IMessageTransmitter", "MessageSent")
-    relay_abi = get_event_abi_by_contract("CCTPFacet", "RelayEvent")
-    events = {"MessageSent": [], "RelayEvent": {}}
+@functools.lru_cache()
+def get_cctp_log_decoder() -> LogDecoder:
+    return LogDecoder([
+        get_event_abi_by_interface("IMessageTransmitter", "MessageSent"),
+        get_event_abi_by_contract("CCTPFacet", "RelayEvent"),
+    ])
 
-    for log in logs:
-        try:
-            data = get_event_data(web3.codec, message_abi, log)
-            events["MessageSent"].append(data["args"])
-        except:
-            pass
-        try:
-            data = get_event_data(web3.codec, relay_abi, log)
-            events["RelayEvent"] = data["args"]
-        except:
-            pass
 
+def build_facet_message(
+        tx_hash, events: Dict[str, list], tx_timestamp=None, fetch_attestation=False
+) -> CCTPFacetMessage:
+    """Attestations are only looked up in the poller cache unless `fetch_attestation`"""
+    cctp_facet = get_cctp_facet()
+    poller = get_attestation_poller(network.show_active())
     messages = []
     for event in events.get("MessageSent", []):
-        message = event["message"].hex()
+        message = event["args"]["message"].hex()
         msg_hash = web3.keccak(hexstr=message)
         cctp_message = CCTPMessage(*cctp_facet.decodeCCTPMessage(message))
         cctp_message.message = format_hex(message)
         cctp_message.msgHash = format_hex(msg_hash.hex())
-        cctp_message.attestation = format_hex(get_cctp_attestation(cctp_message.msgHash))
+        if fetch_attestation:
+            attestation = poller.fetch(cctp_message.msgHash)
+        else:
+            attestation = poller.get(cctp_message.msgHash)
+        cctp_message.attestation = format_hex(attestation)
         messages.append(cctp_message)
     result = CCTPFacetMessage()
     result.src_timestamp = tx_timestamp
@@ -266,8 +216,9 @@ def get_facet_message(tx_hash) -> CCTPFacetMessage:
         result.token_message = messages[0]
     if len(messages) > 1:
         result.payload_message = messages[1]
-    relay_event = events.get("RelayEvent", {})
-    if len(relay_event) > 0:
+    relay_events = events.get("RelayEvent", [])
+    if len(relay_events) > 0:
+        relay_event = relay_events[-1]["args"]
         result.transactionId = format_hex(str(relay_event["transactionId"].hex()))
         result.fee = relay_event["fee"]
     else:
@@ -275,6 +226,43 @@ def get_facet_message(tx_hash) -> CCTPFacetMessage:
     return result
 
 
+def get_facet_messages(tx_hashes: List[str]) -> Dict[str, CCTPFacetMessage]:
+    """MessageSent and RelayEvent of every tx, receipts are fetched concurrently
+
+    A tx whose receipt can not be fetched is left out.
+    """
+    decoder = get_cctp_log_decoder()
+    receipts = decoder.fetch_receipts(tx_hashes)
+    block_timestamps = {}
+    result = {}
+    for tx_hash in tx_hashes:
+        receipt = receipts.get(tx_hash, None)
+        if receipt is None:
+            continue
+        block_number = receipt["blockNumber"]
+        if block_number not in block_timestamps:
+            try:
+                block_timestamps[block_number] = web3.eth.get_block(block_number)["timestamp"]
+            except:
+                block_timestamps[block_number] = None
+        result[tx_hash] = build_facet_message(
+            tx_hash, decoder.decode_logs(receipt["logs"]), block_timestamps[block_number]
+        )
+    return result
+
+
+def get_facet_message(tx_hash) -> CCTPFacetMessage:
+    tx = chain.get_transaction(tx_hash)
+    try:
+        tx_timestamp = tx.timestamp
+    except:
+        tx_timestamp = None
+    receipt = web3.eth.get_transaction_receipt(tx_hash)
+    return build_facet_message(
+        tx_hash, get_cctp_log_decoder().decode_logs(receipt["logs"]), tx_timestamp, fetch_attestation=True
+    )
+
+
 def get_pending_data(url: str = None, src_chain_id: int = None) -> list:
     """
     Get data for pending relayer
@@ -300,18 +288,10 @@ def get_pending_data(url: str = None, src_chain_id: int = None) -> list:
         return []
 
 
-def clear_queue(q: Queue):
-    while not q.empty():
-        try:
-            q.get_nowait()
-        except:
-            break
-
-
 def process_v1(
         _destinationDomain: int,
         _dstSoDiamond: str,
-        dst_storage: Dict[int, Queue],
+        dst_storage: Dict[int, WorkQueue],
 ):
     """
     Used to get the message and send it to the corresponding consumer
@@ -319,24 +299,51 @@ def process_v1(
     local_logger = logger.getChild(f"[v1|{network.show_active()}]")
     local_logger.info("Starting process v1...")
     src_chain_id = None
-    has_process = {}
     last_process = {}
     interval = 30
 
     last_update_endpoint = 0
     endpoint_interval = 30
-    last_pending_time = 0
-    pending_interval = 30
+    poll_timer = PollTimer(30, max_interval=5 * 60)
+
+    # Messages waiting for attestations by src txid, completed by the poller threads
+    poller = get_attestation_poller(network.show_active())
+    waiting: Dict[str, CCTPFacetMessage] = {}
+    waiting_lock = threading.Lock()
+
+    def dispatch(data: CCTPFacetMessage, dst_domain: int):
+        # Also runs on the poller threads, so it never blocks. A message not
+        # queued because the destination is behind is queued by a later
+        # scan, its attestations are cached by then.
+        if dst_storage[dst_domain].put(data.src_txid, data.to_dict(), block=False):
+            local_logger.info(f"Put {DOMAIN_TO_NET[dst_domain]} item for txid: {data.src_txid}")
+        else:
+            local_logger.warning(f"{data.src_txid} is queued already or {DOMAIN_TO_NET[dst_domain]} queue is full")
+
+    def on_attestation(data: CCTPFacetMessage, message: CCTPMessage, dst_domain: int, msg_hash, attestation):
+        with waiting_lock:
+            if attestation is None:
+                local_logger.warning(f"Get attestation fail for {msg_hash} from {data.src_txid}")
+                waiting.pop(data.src_txid, None)
+                return
+            message.attestation = format_hex(attestation)
+            if data.token_message.attestation is None or data.payload_message.attestation is None:
+                return
+            if waiting.pop(data.src_txid, None) is None:
+                return
+        dispatch(data, dst_domain)
 
     while True:
+        poll_timer.wait()
 
-        if time.time() < last_pending_time + pending_interval:
+        try:
+            result = get_pending_data(src_chain_id=src_chain_id)
+            local_logger.info(f"Get pending data len:{len(result)}")
+        except Exception as e:
+            local_logger.error(f"Get pending data error: {e}")
+            poll_timer.fail()
             continue
-        else:
-            last_pending_time = time.time()
-
-        result = get_pending_data(src_chain_id=src_chain_id)
-        local_logger.info(f"Get pending data len:{len(result)}")
+        poll_timer.succeed()
         try:
             if time.time() > last_update_endpoint + endpoint_interval:
                 reconnect_random_rpc()
@@ -346,11 +353,20 @@ def process_v1(
             if src_chain_id is None:
                 src_chain_id = chain.id
 
+            result = [
+                v for v in result
+                if v["extrinsicHash"] not in last_process
+                   or (time.time() - last_process[v["extrinsicHash"]]) >= interval
+            ]
             for v in result:
-                if v["extrinsicHash"] in last_process and (time.time() - last_process[v["extrinsicHash"]]) < interval:
-                    continue
                 last_process[v["extrinsicHash"]] = time.time()
-                data = get_facet_message(v["extrinsicHash"])
+            facet_messages = get_facet_messages([v["extrinsicHash"] for v in result])
+
+            for v in result:
+                if v["extrinsicHash"] not in facet_messages:
+                    local_logger.warning(f"Get receipt fail from {v['extrinsicHash']}")
+                    continue
+                data = facet_messages[v["extrinsicHash"]]
                 if data.token_message is None:
                     local_logger.warning(f"Get token message is None from {v['extrinsicHash']}")
                     continue
@@ -362,43 +378,32 @@ def process_v1(
                 dst_net = DOMAIN_TO_NET[dst_domain]
 
                 local_logger.info(f"Process from src net:{src_net} src txid:{v['extrinsicHash']} to dst net:{dst_net}")
-                if data.token_message.attestation is None:
-                    local_logger.warning(f"Get token message attestation fail from {v['extrinsicHash']}")
-                    continue
-
                 if data.payload_message is None:
                     local_logger.warning(f"Get payload message is None from {v['extrinsicHash']}")
                     continue
-                if data.payload_message.attestation is None:
-                    local_logger.warning(f"Get payload message attestation fail from {v['extrinsicHash']}")
-                    continue
 
-                # Reduce rpc use
-                has_key = v["extrinsicHash"]
-                if (
-                        has_key in has_process
-                        and (time.time() - has_process[has_key]) <= 10 * 60
-                ):
-                    local_logger.warning(
-                        f'{v["extrinsicHash"]} has process in recent 10min '
-                    )
+                missing = [
+                    m for m in [data.token_message, data.payload_message]
+                    if m.attestation is None
+                ]
+                if len(missing) == 0:
+                    dispatch(data, dst_domain)
                     continue
-                else:
-                    has_process[has_key] = time.time()
-
-                if dst_storage[dst_domain].qsize() > 1000:
-                    # Avoid mem leak
-                    clear_queue(dst_storage[dst_domain])
-
-                dst_storage[dst_domain].put(data.to_dict())
-                local_logger.info(f"Put {dst_net} item for txid: {data.src_txid}")
+                with waiting_lock:
+                    if data.src_txid in waiting:
+                        continue
+                    waiting[data.src_txid] = data
+                local_logger.info(f"Wait {len(missing)} attestation for {v['extrinsicHash']}")
+                for m in missing:
+                    poller.track(
+                        m.msgHash,
+                        functools.partial(on_attestation, data, m, dst_domain)
+                    )
         except:
             import traceback
             err = traceback.format_exc()
             local_logger.error(f"Get error:{err}")
 
-        time.sleep(3)
-
 
 def format_hex(data):
     data = str(data)
@@ -413,7 +418,7 @@ def format_hex(data):
 def process_v2(
         destinationDomain: int,
         dstSoDiamond: str,
-        dst_storage: Dict[int, Queue],
+        dst_storage: Dict[int, WorkQueue],
         is_compensate
 ):
     local_logger = logger.getChild(f"[v2|{network.show_active()}]")
@@ -430,9 +435,15 @@ def process_v2(
     last_update_endpoint = 0
     endpoint_interval = 30
 
+    work_queue = dst_storage[destinationDomain]
+    processed_store = get_processed_store()
+    # Retry later an item that can not be relayed now
+    retry_delay = 10 * 60
+
     while True:
         local_logger.info("Get item from queue")
         data = None
+        key = None
         try:
             if time.time() > last_update_endpoint + endpoint_interval:
                 reconnect_random_rpc()
@@ -441,14 +452,23 @@ def process_v2(
             if cctp_facet is None:
                 cctp_facet = get_cctp_facet()
             try:
-                data = dst_storage[destinationDomain].get()
+                leased = work_queue.get(timeout=60)
             except Exception as e:
                 local_logger.warning(f"Get item fail:{e}, wait...")
                 continue
+            if leased is None:
+                local_logger.info(f"Queue metrics: {work_queue.metrics()}")
+                continue
+            key, data = leased
             data = CCTPFacetMessage.from_dict(data)
+            if processed_store.get("cctp", data.src_txid):
+                # Delivered again after its transaction confirmed
+                work_queue.ack(key)
+                continue
             if format_hex(data.payload_message.msgRecipient) != format_hex(dstSoDiamond):
                 local_logger.warning(f"Payload message recipient {data.payload_message.msgRecipient} not "
                                      f"equal dstSoDiamond {dstSoDiamond}")
+                work_queue.ack(key)
                 continue
             if time.time() >= interval_price + last_price_update:
                 local_logger.info("Get token price")
@@ -475,6 +495,8 @@ def process_v2(
                 )
             except Exception as e:
                 local_logger.warning(f"Src txid:{data.src_txid} estimate gas err:{e}")
+                # Counted, a message received already or with a used nonce reverts forever
+                work_queue.nack(key, retry_delay)
                 continue
 
             if time.time() > data.src_timestamp + tx_max_interval:
@@ -489,6 +511,7 @@ def process_v2(
                 if relayer_value < min_relayer_value:
                     local_logger.warning(f"Src txid:{data.src_txid} relayer value:{relayer_value} "
                                          f"< min_relayer_value: {min_relayer_value}")
+                    work_queue.nack(key, retry_delay, count=False)
                     continue
                 else:
                     gas_limit = None
@@ -499,44 +522,67 @@ def process_v2(
             elif estimate_gas > gas_limit:
                 local_logger.warning(f"Src txid:{data.src_txid} estimate gas:{estimate_gas} > "
                                      f"gas limit:{gas_limit}, refuse relay")
+                work_queue.nack(key, retry_delay, count=False)
                 continue
             else:
                 local_logger.info(f"Gas limit is {gas_limit} for transaction")
+            def on_confirmed(txid, gas_used, gas_price, key=key, data=data, relayer_value=relayer_value,
+                             src_domain=src_domain, dst_domain=dst_domain, dst_price=dst_price):
+                actual_value = round(gas_used * gas_price / 1e18 * dst_price, 4)
+                if destinationDomain == 2:
+                    actual_value *= 2
+                record_gas(
+                    send_value=relayer_value,
+                    actual_value=actual_value,
+                    src_net=DOMAIN_TO_NET[src_domain],
+                    dst_net=DOMAIN_TO_NET[dst_domain],
+                    src_txid=data.src_txid,
+                    dst_txid=txid,
+                )
+                processed_store.put("cctp", data.src_txid, txid)
+                work_queue.ack(key)
+                local_logger.info(
+                    f"Process src txid:{data.src_txid}, dst txid: {txid}"
+                    f" success!"
+                )
+
+            def on_failed(txid, error, key=key, data=data):
+                local_logger.error(f"Src txid:{data.src_txid}, dst txid: {txid} fail: {error}")
+                work_queue.nack(key, 60)
+
+            def on_pending(txid, key=key):
+                # Keep the item leased while its transaction is in flight
+                work_queue.renew(key)
+
             if not is_compensate:
-                account_info = {"from": account} if gas_limit is None else {"from": account, "gas_limit": gas_limit}
-                result: TransactionReceipt = cctp_facet.receiveCCTPMessage(
+                tx_params = {} if gas_limit is None else {"gas_limit": gas_limit}
+                txid = get_tx_pipeline(account).submit(
+                    cctp_facet.receiveCCTPMessage,
                     format_hex(data.token_message.message),
                     format_hex(data.token_message.attestation),
                     format_hex(data.payload_message.message),
                     format_hex(data.payload_message.attestation),
-                    account_info
+                    tx_params=tx_params,
+                    on_confirmed=on_confirmed,
+                    on_failed=on_failed,
+                    on_pending=on_pending,
                 )
             else:
-                result: TransactionReceipt = cctp_facet.receiveCCTPMessageByOwner(
+                txid = get_tx_pipeline(account).submit(
+                    cctp_facet.receiveCCTPMessageByOwner,
                     format_hex(data.token_message.message),
                     format_hex(data.token_message.attestation),
-                    {"from": account
-                     }
+                    on_confirmed=on_confirmed,
+                    on_failed=on_failed,
+                    on_pending=on_pending,
                 )
-            actual_value = round(result.gas_used * result.gas_price / 1e18 * dst_price, 4)
-            if destinationDomain == 2:
-                actual_value *= 2
-            record_gas(
-                send_value=relayer_value,
-                actual_value=actual_value,
-                src_net=DOMAIN_TO_NET[src_domain],
-                dst_net=DOMAIN_TO_NET[dst_domain],
-                src_txid=data.src_txid,
-                dst_txid=result.txid,
-            )
-            local_logger.info(
-                f"Process src txid:{data.src_txid}, dst txid: {result.txid}"
-                f" success!"
-            )
+            local_logger.info(f"Process src txid:{data.src_txid}, dst txid: {txid} pending!")
         except:
             import traceback
             err = traceback.format_exc()
-            local_logger.error(f"Src txid:{getattr(data, '', None)}, get error:{err}")
+            local_logger.error(f"Src txid:{getattr(data, 'src_txid', None)}, get error:{err}")
+            if key is not None:
+                work_queue.nack(key, 60)
 
 
 class Session(Process):
@@ -604,16 +650,7 @@ def record_gas(
         dst_txid=None,
         file_path=Path(__file__).parent.parent.parent.parent.joinpath("gas"),
 ):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"cctp_{dst_net}_{period1}_{period2}.csv")
     data = OrderedDict({
         "record_time": str(datetime.fromtimestamp(cur_timestamp))[:19],
         "src_net": src_net,
@@ -624,13 +661,7 @@ def record_gas(
         "dst_txid": dst_txid,
         "diff_value": send_value - actual_value
     })
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode="a")
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode="w")
+    get_gas_ledger(str(file_path), "cctp_{dst_net}_{period1}_{period2}.csv").record(data, cur_timestamp)
 
 
 def main():
@@ -640,7 +671,7 @@ def main():
     except:
         logger.warning("Set start method spawn fail")
     dst_storage = {
-        v["destinationDomain"]: Queue()
+        v["destinationDomain"]: WorkQueue(f"cctp_{v['destinationDomain']}")
         for v in SUPPORTED_EVM
     }
 
@@ -0,0 +1,201 @@
+import atexit
+import csv
+import functools
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from collections import deque, OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from .scheduler import PollTimer
+
+logger = logging.getLogger()
+
+WEEK = 7 * 24 * 60 * 60
+
+
+def week_period(timestamp: int):
+    uid = int(timestamp / WEEK) * WEEK
+    period1 = str(datetime.fromtimestamp(uid))[:13]
+    period2 = str(datetime.fromtimestamp(uid + WEEK))[:13]
+    return period1, period2
+
+
+class GasLedger:
+    """Buffered gas records, appended to weekly csv files per destination
+
+    `record` only appends to an in-memory buffer. A background thread
+    writes the buffer every `flush_interval` seconds, or as soon as
+    `batch_size` records are waiting, opening each weekly file once per
+    batch. The buffer holds at most `capacity` records and drops the oldest
+    when the disk can not keep up. The buffer is flushed again at interpreter
+    exit and on SIGTERM.
+
+    Files keep the `file_format` name, e.g. "{dst_net}_{period1}_{period2}_v1.csv",
+    and the column order of the first record written to them.
+    """
+
+    def __init__(
+            self,
+            directory: Path,
+            file_format: str,
+            flush_interval: float = 5,
+            batch_size: int = 256,
+            capacity: int = 100000,
+    ):
+        self.directory = Path(directory)
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = PollTimer(flush_interval, jitter=0)
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def file_name(self, dst_net: str, timestamp: int) -> Path:
+        period1, period2 = week_period(timestamp)
+        return self.directory.joinpath(
+            self.file_format.format(dst_net=dst_net, period1=period1, period2=period2)
+        )
+
+    def record(self, row: OrderedDict, timestamp: int = None):
+        """Queue one record, `row` must contain dst_net"""
+        if timestamp is None:
+            timestamp = int(time.time())
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append((self.file_name(row["dst_net"], timestamp), row))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._timer.wake()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if len(batch) == 0:
+                return
+            files: Dict[Path, List[OrderedDict]] = OrderedDict()
+            for file_name, row in batch:
+                files.setdefault(file_name, []).append(row)
+            written = set()
+            try:
+                if not self.directory.exists():
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                for file_name, rows in files.items():
+                    new_file = not file_name.exists() or file_name.stat().st_size == 0
+                    with open(file_name, "a", newline="") as f:
+                        writer = csv.writer(f)
+                        if new_file:
+                            writer.writerow(list(rows[0].keys()))
+                        writer.writerows([list(r.values()) for r in rows])
+                    written.add(file_name)
+            except Exception:
+                # Keep unwritten records for the next flush
+                with self._lock:
+                    self._buffer.extendleft(reversed([b for b in batch if b[0] not in written]))
+                raise
+
+    def _writer_loop(self):
+        while True:
+            self._timer.wait()
+            try:
+                self.flush()
+                if self.dropped > 0:
+                    logger.warning(f"Gas ledger dropped {self.dropped} records")
+                    self.dropped = 0
+            except Exception as e:
+                logger.error(f"Flush gas ledger to {self.directory} error: {e}")
+
+    def files(self, dst_net: str = None) -> List[Path]:
+        pattern = re.escape(self.file_format).replace(r"\{dst_net\}", "(?P<dst_net>.+)") \
+            .replace(r"\{period1\}", r"\d{4}-\d{2}-\d{2} \d{2}") \
+            .replace(r"\{period2\}", r"\d{4}-\d{2}-\d{2} \d{2}")
+        pattern = re.compile(f"^{pattern}$")
+        result = []
+        if not self.directory.exists():
+            return result
+        for file_name in sorted(self.directory.iterdir()):
+            m = pattern.match(file_name.name)
+            if m is None:
+                continue
+            if dst_net is not None and m.group("dst_net") != dst_net:
+                continue
+            result.append(file_name)
+        return result
+
+    def query(
+            self,
+            dst_net: str = None,
+            src_net: str = None,
+            start: str = None,
+            end: str = None,
+    ) -> Iterable[dict]:
+        """Written records, `start` and `end` compare with record_time"""
+        self.flush()
+        for file_name in self.files(dst_net):
+            with open(file_name, "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    if src_net is not None and row.get("src_net") != src_net:
+                        continue
+                    if start is not None and row["record_time"] < start:
+                        continue
+                    if end is not None and row["record_time"] >= end:
+                        continue
+                    yield row
+
+    def summary(
+            self,
+            group_by=("src_net", "dst_net"),
+            columns=("diff_gas", "diff_value"),
+            **kwargs,
+    ) -> Dict[tuple, dict]:
+        """Count and sum of `columns` per group, filters as in `query`"""
+        result = OrderedDict()
+        for row in self.query(**kwargs):
+            key = tuple(row.get(k) for k in group_by)
+            total = result.setdefault(key, OrderedDict([("count", 0)] + [(c, 0) for c in columns]))
+            total["count"] += 1
+            for c in columns:
+                try:
+                    total[c] += float(row[c])
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return result
+
+
+_ledgers: List[GasLedger] = []
+
+
+def _flush_on_sigterm(signum, frame):
+    for ledger in _ledgers:
+        try:
+            ledger.flush()
+        except Exception as e:
+            logger.error(f"Flush gas ledger to {ledger.directory} error: {e}")
+    # Terminate as without the handler, relayer threads never return
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+if threading.current_thread() is threading.main_thread() \
+        and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, _flush_on_sigterm)
+
+
+@functools.lru_cache()
+def get_gas_ledger(directory: str, file_format: str) -> GasLedger:
+    """One ledger per file layout and process"""
+    ledger = GasLedger(Path(directory), file_format)
+    _ledgers.append(ledger)
+    return ledger
@@ -0,0 +1,169 @@
+import base64
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .vaa_cache import VaaCache, get_vaa_cache
+
+
+class GuardianEndpoint:
+    """One guardian rpc mirror with a keep-alive connection pool and health stats"""
+
+    def __init__(self, url: str, pool_size: int = 8, window: int = 50):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._latency = deque(maxlen=window)
+        self._errors = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._latency.append(latency)
+            self._errors.append(0 if ok else 1)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latency) == 0:
+                return None
+            latency = sorted(self._latency)
+        return latency[int(0.95 * (len(latency) - 1))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if len(self._errors) == 0:
+                return 0
+            return sum(self._errors) / len(self._errors)
+
+    def score(self, timeout: float) -> float:
+        """Lower is better, errors count as timeouts. Unknown mirrors rank first"""
+        p95 = self.p95()
+        if p95 is None:
+            return 0
+        error_rate = self.error_rate()
+        return p95 * (1 - error_rate) + timeout * error_rate
+
+
+class GuardianFetcher:
+    """Fetch signed vaa from several guardian rpc mirrors
+
+    The fastest healthy mirror is asked first. If it has not answered after
+    its p95 latency, the same request is hedged to the next mirror and the
+    first answer wins. Failed mirrors are skipped until every mirror failed.
+    Answers go through `cache` when given.
+    """
+
+    def __init__(
+            self,
+            urls: List[str],
+            timeout: float = 10,
+            min_hedge_delay: float = 0.2,
+            default_hedge_delay: float = 1,
+            max_workers: int = 16,
+            cache: Optional[VaaCache] = None,
+    ):
+        assert len(urls) > 0, "empty guardian rpc"
+        self.endpoints = [GuardianEndpoint(url, pool_size=max_workers) for url in urls]
+        self.timeout = timeout
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="guardian_rpc"
+        )
+        # Separate pool so that background fetches never wait on their own workers
+        self.task_executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="guardian_task"
+        )
+
+    def ranked(self) -> List[GuardianEndpoint]:
+        return sorted(self.endpoints, key=lambda e: e.score(self.timeout))
+
+    def hedge_delay(self, endpoint: GuardianEndpoint) -> float:
+        p95 = endpoint.p95()
+        if p95 is None:
+            return self.default_hedge_delay
+        return min(max(p95, self.min_hedge_delay), self.timeout)
+
+    def _request(self, endpoint: GuardianEndpoint, path: str) -> Optional[str]:
+        start = time.time()
+        try:
+            response = endpoint.session.get(endpoint.url + path, timeout=self.timeout)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            vaa_bytes = response.json().get("vaaBytes", None)
+        except Exception:
+            endpoint.record(time.time() - start, False)
+            raise
+        endpoint.record(time.time() - start, True)
+        return vaa_bytes
+
+    def get(self, path: str) -> Optional[str]:
+        """Hedged request, return `vaaBytes` or None when the vaa is not signed yet"""
+        endpoints = self.ranked()
+        pending = {self.executor.submit(self._request, endpoints[0], path)}
+        delay = self.hedge_delay(endpoints[0])
+        index = 1
+        last_error = None
+        while len(pending) > 0:
+            timeout = delay if index < len(endpoints) else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    return f.result()
+                except Exception as e:
+                    last_error = e
+            if index < len(endpoints):
+                # Hedge when the mirror is slow, fail over when one failed
+                pending.add(self.executor.submit(self._request, endpoints[index], path))
+                delay = self.hedge_delay(endpoints[index])
+                index += 1
+        raise last_error
+
+    def get_signed_vaa(
+            self,
+            emitter_chain_id: int,
+            emitter_address: str,
+            sequence: int,
+    ) -> Optional[str]:
+        def load():
+            vaa_bytes = self.get(f"/v1/signed_vaa/{emitter_chain_id}/{emitter_address}/{sequence}")
+            if vaa_bytes is None:
+                return None
+            vaa = base64.b64decode(vaa_bytes).hex()
+            return f"0x{vaa}"
+
+        if self.cache is None:
+            return load()
+        return self.cache.fetch(emitter_chain_id, emitter_address, sequence, load)
+
+    def submit(
+            self,
+            emitter_chain_id: int,
+            emitter_address: str,
+            sequence: int,
+    ) -> Future:
+        """Fetch in the background, for scanning many sequences concurrently"""
+        return self.task_executor.submit(
+            self.get_signed_vaa, emitter_chain_id, emitter_address, sequence
+        )
+
+    def health(self) -> List[dict]:
+        return [
+            {"url": e.url, "p95": e.p95(), "error_rate": e.error_rate()}
+            for e in self.ranked()
+        ]
+
+
+@functools.lru_cache()
+def get_guardian_fetcher(urls: tuple) -> GuardianFetcher:
+    """One fetcher per relayer process, shared by all of its threads"""
+    return GuardianFetcher(list(urls), cache=get_vaa_cache())
@@ -0,0 +1,127 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from eth_utils import event_abi_to_log_topic
+from web3._utils.events import get_event_data
+
+logger = logging.getLogger()
+
+
+def _hex(value) -> str:
+    if not isinstance(value, str):
+        value = value.hex()
+    if not value.startswith("0x"):
+        value = "0x" + value
+    return value.lower()
+
+
+class LogDecoder:
+    """Decode receipt logs of a fixed set of events by topic0
+
+    The topic0 -> abi index is built once, a log is only decoded against the
+    abis sharing its topic0, other logs are skipped without raising. Events
+    with the same signature but different indexed inputs (ERC20 and ERC721
+    Transfer) share a topic0, the first abi that decodes wins.
+    """
+
+    def __init__(self, event_abis: Iterable[dict], codec=None):
+        self._codec = codec
+        self.topics: Dict[str, List[dict]] = defaultdict(list)
+        for abi in event_abis:
+            if abi is None:
+                continue
+            self.topics["0x" + event_abi_to_log_topic(abi).hex()].append(abi)
+        self.topics = dict(self.topics)
+
+    @property
+    def codec(self):
+        if self._codec is None:
+            from brownie import web3
+            self._codec = web3.codec
+        return self._codec
+
+    def decode(self, log) -> Optional[Tuple[str, dict]]:
+        """(event name, decoded event) or None when the log is not indexed"""
+        if len(log["topics"]) == 0:
+            return None
+        for abi in self.topics.get(_hex(log["topics"][0]), []):
+            try:
+                return abi["name"], get_event_data(self.codec, abi, log)
+            except Exception:
+                continue
+        return None
+
+    def decode_ordered(self, logs: Iterable) -> List[Tuple[str, dict]]:
+        """(event name, decoded event) of the indexed logs, in log order"""
+        return [result for result in map(self.decode, logs) if result is not None]
+
+    def decode_logs(self, logs: Iterable) -> Dict[str, list]:
+        """Decoded events by name, in log order"""
+        events = defaultdict(list)
+        for name, event in self.decode_ordered(logs):
+            events[name].append(event)
+        return dict(events)
+
+    def decode_receipts(self, receipts: Iterable) -> Dict[str, Dict[str, list]]:
+        """Decoded events by transaction hash then by name"""
+        return {
+            _hex(receipt["transactionHash"]): self.decode_logs(receipt["logs"])
+            for receipt in receipts
+            if receipt is not None
+        }
+
+    @staticmethod
+    def fetch_receipts(tx_hashes: List[str], max_workers: int = 8) -> Dict[str, Optional[dict]]:
+        """Receipts of `tx_hashes` fetched concurrently, None when a fetch fails"""
+        from brownie import web3
+
+        def fetch(tx_hash):
+            try:
+                return web3.eth.get_transaction_receipt(tx_hash)
+            except Exception as e:
+                logger.warning(f"Get receipt {tx_hash} fail: {e}")
+                return None
+
+        if len(tx_hashes) == 0:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tx_hashes))) as executor:
+            return dict(zip(tx_hashes, executor.map(fetch, tx_hashes)))
+
+    def events_for_txs(self, tx_hashes: List[str], max_workers: int = 8) -> Dict[str, Optional[Dict[str, list]]]:
+        """Decoded events of every tx by name, None when its receipt can not be fetched"""
+        return {
+            tx_hash: None if receipt is None else self.decode_logs(receipt["logs"])
+            for tx_hash, receipt in self.fetch_receipts(tx_hashes, max_workers).items()
+        }
+
+    def get_logs(
+            self,
+            from_block: int,
+            to_block: int,
+            address=None,
+            chunk_size: int = 2000,
+    ) -> Dict[str, Dict[str, list]]:
+        """Decoded events of the indexed topics in a block range, by transaction hash
+
+        One eth_getLogs per `chunk_size` blocks, filtered on every indexed
+        topic0 at once.
+        """
+        from brownie import web3
+
+        result: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+        topics = [list(self.topics)]
+        for start in range(from_block, to_block + 1, chunk_size):
+            params = {
+                "fromBlock": start,
+                "toBlock": min(start + chunk_size - 1, to_block),
+                "topics": topics,
+            }
+            if address is not None:
+                params["address"] = address
+            for log in web3.eth.get_logs(params):
+                decoded = self.decode(log)
+                if decoded is not None:
+                    result[_hex(log["transactionHash"])][decoded[0]].append(decoded[1])
+        return {k: dict(v) for k, v in result.items()}
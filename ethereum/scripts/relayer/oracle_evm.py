@@ -1,5 +1,3 @@
-import functools
-
 from brownie import (
     network,
     Contract,
@@ -9,9 +7,12 @@ from brownie import (
     StargateFacet,
     LibSoFeeCelerV1,
 )
-import ccxt
+import numpy as np
 
 from scripts.helpful_scripts import get_wormhole_info, get_account, change_network
+from scripts.multicall import multicall
+from scripts.relayer.price_feed import get_price_feed
+from scripts.relayer.tx_pipeline import close_tx_pipeline, get_tx_pipeline
 import aptos_brownie
 
 
@@ -118,18 +119,12 @@ def set_so_gas():
         )
 
 
-@functools.lru_cache()
 def get_prices(
         symbols=("ETH/USDT", "BNB/USDT", "POL/USDT", "AVAX/USDT", "APT/USDT", "SUI/USDT", "SOL/USDT")
 ):
-    api = ccxt.kucoin()
-    prices = {}
-
-    for symbol in symbols:
-        result = api.fetch_ticker(symbol=symbol)
-        price = result["close"]
+    prices = get_price_feed().get(symbols)
+    for symbol, price in prices.items():
         print(f"Symbol:{symbol}, price:{price}")
-        prices[symbol] = price
     return prices
 
 
@@ -281,223 +276,146 @@ def calc_percent(new_ratio, old_ratio):
         return new_ratio / old_ratio
 
 
-def set_so_price_for_celer_zkevm():
-    change_network("zkevm-main")
-    celer_so_fee = "0x66F440252fe99454df8F8e1EB7743EA08FE7D8e2"
-    prices = get_prices()
+# Gas token and fee library price ratios to keep up to date, per source network.
+# A target without address uses the library deployed by this project.
+SO_PRICE_CONFIG = {
+    "avax-main": {
+        "symbol": "AVAX/USDT",
+        "multiply": 1.2,
+        "targets": [
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 4, "symbol": "BNB/USDT", "name": "bsc-main"},
+            {"lib": "LibSoFeeCelerV1", "chain_id": 56, "symbol": "BNB/USDT", "name": "bsc-main"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 22, "symbol": "APT/USDT", "name": "aptos-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 21, "symbol": "SUI/USDT", "name": "sui-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 1, "symbol": "SOL/USDT", "name": "solana-mainnet"},
+        ],
+    },
+    "mainnet": {
+        "symbol": "ETH/USDT",
+        "multiply": 1.2,
+        "targets": [
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 22, "symbol": "APT/USDT", "name": "aptos-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 21, "symbol": "SUI/USDT", "name": "sui-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 1, "symbol": "SOL/USDT", "name": "solana-mainnet"},
+        ],
+    },
+    "polygon-main": {
+        "symbol": "POL/USDT",
+        "multiply": 1.2,
+        "targets": [
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 22, "symbol": "APT/USDT", "name": "aptos-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 21, "symbol": "SUI/USDT", "name": "sui-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 1, "symbol": "SOL/USDT", "name": "solana-mainnet"},
+        ],
+    },
+    "bsc-main": {
+        "symbol": "BNB/USDT",
+        "multiply": 1.2,
+        "targets": [
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 22, "symbol": "APT/USDT", "name": "aptos-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 21, "symbol": "SUI/USDT", "name": "sui-mainnet"},
+            {"lib": "LibSoFeeWormholeV1", "chain_id": 1, "symbol": "SOL/USDT", "name": "solana-mainnet"},
+        ],
+    },
+    "zkevm-main": {
+        "symbol": "ETH/USDT",
+        "multiply": 1,
+        "targets": [
+            {"lib": "LibSoFeeCelerV1", "address": "0x66F440252fe99454df8F8e1EB7743EA08FE7D8e2",
+             "chain_id": 56, "symbol": "BNB/USDT", "name": "bsc-main"},
+            {"lib": "LibSoFeeCelerV1", "address": "0x66F440252fe99454df8F8e1EB7743EA08FE7D8e2",
+             "chain_id": 137, "symbol": "POL/USDT", "name": "polygon-main"},
+            {"lib": "LibSoFeeCelerV1", "address": "0x66F440252fe99454df8F8e1EB7743EA08FE7D8e2",
+             "chain_id": 43114, "symbol": "AVAX/USDT", "name": "avax-main"},
+        ],
+    },
+}
+
+FEE_LIBRARIES = {
+    "LibSoFeeWormholeV1": LibSoFeeWormholeV1,
+    "LibSoFeeCelerV1": LibSoFeeCelerV1,
+}
+
+
+def get_fee_library(target):
+    container = FEE_LIBRARIES[target["lib"]]
+    if target.get("address", None) is None:
+        return container[-1]
+    return Contract.from_abi(target["lib"], target["address"], container.abi)
+
+
+def price_ratio_matrix(prices):
+    """Symbols and matrix of price[column] / price[row]"""
+    symbols = sorted(prices)
+    values = np.array([float(prices[s]) for s in symbols])
+    return symbols, values[np.newaxis, :] / values[:, np.newaxis]
+
+
+def set_so_price(dry_run=False, hysteresis=0.03):
+    """Reconcile the price ratios of the active network with SO_PRICE_CONFIG
+
+    All current ratios are read with one multicall. A ratio is raised as
+    soon as it is too low and lowered only when it is more than
+    `hysteresis` too high. A target whose ratio can not be read is skipped.
+    Changed ratios are sent back to back and waited for. With `dry_run`
+    only the diff is printed.
+    """
+    net = network.show_active()
+    if net not in SO_PRICE_CONFIG:
+        print(f"Price ratio for {net} not configured")
+        return []
+    config = SO_PRICE_CONFIG[net]
+    targets = config["targets"]
     decimal = 1e27
-    multiply = 1
-
-    proxy_celer_so_fee = Contract.from_abi(
-        "LibSoFeeCelerV1", celer_so_fee, LibSoFeeCelerV1.abi
-    )
-
-    # call once
-    # proxy_celer_fee.setPriceRatio(1, 1e27, {"from": account})
-    # proxy_celer_fee.setPriceRatio(10, 1e27, {"from": account})
-    # proxy_celer_fee.setPriceRatio(324, 1e27, {"from": account})
-    # proxy_celer_fee.setPriceRatio(42161, 1e27, {"from": account})
-
-    # bnb/eth
-    dst_celer_id = 56
-    ratio = int(prices["BNB/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-    old_ratio = int(proxy_celer_so_fee.getPriceRatio(dst_celer_id)[0])
-    print(
-        f"[set_bnb_eth_price_ratio]: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-    )
-
-    if old_ratio < ratio or ratio * 1.03 < old_ratio:
-        proxy_celer_so_fee.setPriceRatio(dst_celer_id, ratio, {"from": get_account()})
-
-    # matic/eth
-    dst_celer_id = 137
-    ratio = int(prices["POL/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-    old_ratio = int(proxy_celer_so_fee.getPriceRatio(dst_celer_id)[0])
-    print(
-        f"[set_matic_eth_price_ratio]: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-    )
-
-    if old_ratio < ratio or ratio * 1.03 < old_ratio:
-        proxy_celer_so_fee.setPriceRatio(dst_celer_id, ratio, {"from": get_account()})
-
-    # avax/eth
-    dst_celer_id = 43114
-    ratio = int(prices["AVAX/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-    old_ratio = int(proxy_celer_so_fee.getPriceRatio(dst_celer_id)[0])
-    print(
-        f"[set_avax_eth_price_ratio]: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-    )
-
-    if old_ratio < ratio or ratio * 1.03 < old_ratio:
-        proxy_celer_so_fee.setPriceRatio(dst_celer_id, ratio, {"from": get_account()})
-
-
-def set_so_price():
-    prices = get_prices()
-
-    decimal = 1e27
-    multiply = 1.2
-    if network.show_active() == "avax-main":
-        # bnb
-        dst_wormhole_id = 4
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["BNB/USDT"] / prices["AVAX/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for bnb-main: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-        set_celer_bnb_price_on_avax(ratio)
-
-        # aptos
-        dst_wormhole_id = 22
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["APT/USDT"] / prices["AVAX/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for aptos-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-        # sui
-        dst_wormhole_id = 21
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SUI/USDT"] / prices["AVAX/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for sui-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-        # solana
-        dst_wormhole_id = 1
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SOL/USDT"] / prices["AVAX/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for solana-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-    if network.show_active() == "mainnet":
-        # aptos
-        dst_wormhole_id = 22
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["APT/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for aptos-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-        # sui
-        dst_wormhole_id = 21
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SUI/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for sui-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
 
-        # solana
-        dst_wormhole_id = 1
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SOL/USDT"] / prices["ETH/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for solana-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-    if network.show_active() == "polygon-main":
-        # aptos
-        dst_wormhole_id = 22
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["APT/USDT"] / prices["POL/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for aptos-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
-
-        # sui
-        dst_wormhole_id = 21
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SUI/USDT"] / prices["POL/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for sui-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
+    symbols, matrix = price_ratio_matrix(get_prices())
+    src_index = symbols.index(config["symbol"])
+    dst_index = [symbols.index(t["symbol"]) for t in targets]
+    new_ratios = matrix[src_index, dst_index] * decimal * config["multiply"]
+
+    libs = [get_fee_library(t) for t in targets]
+    outputs = multicall([(lib.getPriceRatio, (t["chain_id"],)) for lib, t in zip(libs, targets)])
+    readable = np.array([ok for ok, _ in outputs], dtype=bool)
+    old_ratios = np.array([float(o[0]) if ok else 0 for ok, o in outputs])
+    updates = readable & ((old_ratios < new_ratios) | (new_ratios * (1 + hysteresis) < old_ratios))
+
+    diff = []
+    for i, t in enumerate(targets):
+        old_ratio, ratio = int(old_ratios[i]), int(new_ratios[i])
+        if not readable[i]:
+            print(
+                f"Read price ratio for {t['name']} [{t['lib']}:{t['chain_id']}] fail, skip"
             )
-
-        # solana
-        dst_wormhole_id = 1
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SOL/USDT"] / prices["POL/USDT"] * decimal * multiply)
+            diff.append({**t, "old": None, "new": ratio, "update": False})
+            continue
         print(
-            f"Set price ratio for solana-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
+            f"{'[dry run] ' if dry_run else ''}Set price ratio for {t['name']} "
+            f"[{t['lib']}:{t['chain_id']}]: old: {old_ratio} new: {ratio} "
+            f"percent: {calc_percent(ratio, old_ratio)} update: {bool(updates[i])}"
         )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
+        diff.append({**t, "old": old_ratio, "new": ratio, "update": bool(updates[i])})
+    if dry_run:
+        return diff
 
-    if network.show_active() == "bsc-main":
-        # aptos
-        dst_wormhole_id = 22
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["APT/USDT"] / prices["BNB/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for aptos-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
+    pipeline = get_tx_pipeline(get_account())
+    for lib, d in zip(libs, diff):
+        if not d["update"]:
+            continue
+        pipeline.submit(
+            lib.setPriceRatio,
+            d["chain_id"],
+            d["new"],
+            on_failed=lambda txid, error, d=d: print(
+                f"Set price ratio for {d['name']} [{d['lib']}:{d['chain_id']}] txid:{txid} fail: {error}"
+            ),
         )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
+    pipeline.wait()
+    return diff
 
-        # sui
-        dst_wormhole_id = 21
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SUI/USDT"] / prices["BNB/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for sui-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
 
-        # solana
-        dst_wormhole_id = 1
-        old_ratio = int(LibSoFeeWormholeV1[-1].getPriceRatio(dst_wormhole_id)[0])
-        ratio = int(prices["SOL/USDT"] / prices["BNB/USDT"] * decimal * multiply)
-        print(
-            f"Set price ratio for solana-mainnet: old: {old_ratio} new: {ratio} percent: {calc_percent(ratio, old_ratio)}"
-        )
-        if old_ratio < ratio or ratio * 1.03 < old_ratio:
-            LibSoFeeWormholeV1[-1].setPriceRatio(
-                dst_wormhole_id, ratio, {"from": get_account()}
-            )
+def set_so_price_for_celer_zkevm(dry_run=False):
+    change_network("zkevm-main")
+    return set_so_price(dry_run)
 
 
 def set_so_gass():
@@ -508,12 +426,16 @@ def set_so_gass():
         set_so_gas()
 
 
-def set_so_prices():
+def set_so_prices(dry_run=False):
     nets = ["mainnet", "avax-main", "bsc-main", "polygon-main"]
     for net in nets:
         print(f"Change net into {net}...")
         change_network(net)
-        set_so_price()
+        try:
+            set_so_price(dry_run)
+        finally:
+            # Its monitor reads receipts from the active network
+            close_tx_pipeline(get_account())
 
 
 def allow_sg_receive():
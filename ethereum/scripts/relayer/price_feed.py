@@ -0,0 +1,160 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable
+
+logger = logging.getLogger()
+
+# network name -> symbol of its gas token
+NET_TO_SYMBOL = {
+    "mainnet": "ETH/USDT",
+    "goerli": "ETH/USDT",
+    "arbitrum-main": "ETH/USDT",
+    "arbitrum-test": "ETH/USDT",
+    "optimism-main": "ETH/USDT",
+    "optimism-test": "ETH/USDT",
+    "base-main": "ETH/USDT",
+    "base-test": "ETH/USDT",
+    "bsc-main": "BNB/USDT",
+    "bsc-test": "BNB/USDT",
+    "polygon-main": "POL/USDT",
+    "polygon-test": "POL/USDT",
+    "avax-main": "AVAX/USDT",
+    "avax-test": "AVAX/USDT",
+}
+
+
+def get_net_symbol(net: str) -> str:
+    if net not in NET_TO_SYMBOL:
+        raise ValueError(f"{net} not found")
+    return NET_TO_SYMBOL[net]
+
+
+class FakeExchange:
+    """Offline exchange with fixed prices, the fetch_tickers subset of ccxt"""
+
+    def __init__(self, prices: Dict[str, float]):
+        self.prices = dict(prices)
+        self.calls = 0
+        # Symbols of every fetch_tickers call
+        self.requested = []
+
+    def fetch_tickers(self, symbols=None):
+        self.calls += 1
+        self.requested.append(symbols)
+        if symbols is None:
+            symbols = list(self.prices)
+        timestamp = int(time.time() * 1000)
+        return {
+            s: {"symbol": s, "close": self.prices[s], "timestamp": timestamp}
+            for s in symbols
+            if s in self.prices
+        }
+
+
+class PriceFeed:
+    """Token prices with one batched fetch_tickers call per refresh
+
+    Prices younger than `ttl` seconds are served from memory or from the
+    json file at `path`, which every relayer and oracle process on the host
+    shares, so only one of them hits the exchange per `ttl`. When the
+    exchange fails, prices younger than `max_stale` are still served and
+    the next fetch is delayed with exponential backoff.
+    """
+
+    def __init__(
+            self,
+            exchange=None,
+            ttl: float = 60,
+            max_stale: float = 10 * 60,
+            path: str = "./cache/prices.json",
+            max_backoff: float = 60,
+    ):
+        self._exchange = exchange
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.path = path
+        self.max_backoff = max_backoff
+        # symbol -> (price, fetch time)
+        self._prices: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0
+
+    @property
+    def exchange(self):
+        if self._exchange is None:
+            import ccxt
+            self._exchange = ccxt.kucoin()
+        return self._exchange
+
+    def _load_shared(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        for symbol, (price, fetch_time) in data.items():
+            if symbol not in self._prices or self._prices[symbol][1] < fetch_time:
+                self._prices[symbol] = (price, fetch_time)
+
+    def _save_shared(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            json.dump({k: list(v) for k, v in self._prices.items()}, f)
+        os.replace(tmp, self.path)
+
+    def _expired(self, symbols, age: float):
+        now = time.time()
+        return [s for s in symbols if s not in self._prices or now - self._prices[s][1] > age]
+
+    def _fetch(self, symbols):
+        if time.time() < self._retry_at:
+            raise RuntimeError(f"Fetch prices backoff until {self._retry_at}")
+        try:
+            tickers = self.exchange.fetch_tickers(symbols)
+        except Exception:
+            self._failures += 1
+            self._retry_at = time.time() + min(2 ** self._failures, self.max_backoff)
+            raise
+        self._failures = 0
+        now = time.time()
+        for symbol in symbols:
+            if symbol in tickers and tickers[symbol]["close"] is not None:
+                self._prices[symbol] = (float(tickers[symbol]["close"]), now)
+
+    def get(self, symbols: Iterable[str]) -> Dict[str, float]:
+        symbols = sorted(set(symbols))
+        with self._lock:
+            if self._expired(symbols, self.ttl):
+                self._load_shared()
+            expired = self._expired(symbols, self.ttl)
+            if expired:
+                try:
+                    self._fetch(expired)
+                    self._save_shared()
+                except Exception as e:
+                    logger.warning(f"Fetch prices for {expired} error: {e}")
+            missing = self._expired(symbols, self.max_stale)
+            if missing:
+                raise RuntimeError(f"No fresh price for {missing}")
+            return {s: self._prices[s][0] for s in symbols}
+
+    def price(self, symbol: str) -> float:
+        return self.get([symbol])[symbol]
+
+
+@functools.lru_cache()
+def get_price_feed() -> PriceFeed:
+    """One feed per process, shared by its threads"""
+    return PriceFeed()
@@ -0,0 +1,152 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class ProcessedStore:
+    """Processed message store for all relayers, backed by a sqlite file
+
+    Keys live in a namespace per relayer flavour, e.g. wormhole vaa
+    "{srcChain}|{sequence}" or a stargate message hash. A key is first
+    claimed for `ttl` seconds so that a failed attempt is retried later, and
+    marked done without expiry once its transaction is confirmed. Done keys
+    are kept for `retention` seconds after their last write, long after the
+    backends stop returning them. Every write is a single indexed upsert
+    committed to a WAL journal, so its cost does not depend on the history
+    size and it survives a relayer crash.
+    """
+
+    def __init__(
+            self,
+            path: str = "./cache/processed.sqlite",
+            prune_interval: float = 60 * 60,
+            retention: float = 90 * 24 * 60 * 60,
+    ):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.prune_interval = prune_interval
+        self.retention = retention
+        self._last_prune = 0
+        self._local = threading.local()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "namespace TEXT, key TEXT, value TEXT, updated REAL, expire REAL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._execute(
+            "CREATE INDEX IF NOT EXISTS processed_expire ON processed (expire) "
+            "WHERE expire IS NOT NULL"
+        )
+        self._execute(
+            "CREATE INDEX IF NOT EXISTS processed_done ON processed (updated) "
+            "WHERE expire IS NULL"
+        )
+
+    @staticmethod
+    def key(*parts) -> str:
+        return "|".join(str(p) for p in parts)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, args: tuple = ()):
+        return self._connection().execute(sql, args)
+
+    def _maybe_prune(self):
+        if time.time() >= self._last_prune + self.prune_interval:
+            self._last_prune = time.time()
+            self.prune()
+
+    def __contains__(self, item) -> bool:
+        namespace, key = item
+        return self.get(namespace, key) is not None
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Value of an unexpired key, "" for keys stored without value"""
+        row = self._execute(
+            "SELECT value FROM processed WHERE namespace=? AND key=? "
+            "AND (expire IS NULL OR expire>?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return "" if row[0] is None else row[0]
+
+    def claim(self, namespace: str, key: str, ttl: float) -> bool:
+        """Take the key for `ttl` seconds, False when it is taken or done"""
+        self._maybe_prune()
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO processed VALUES (?, ?, NULL, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET updated=excluded.updated, "
+            "expire=excluded.expire WHERE processed.expire IS NOT NULL AND processed.expire<=?",
+            (namespace, key, now, now + ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    def renew(self, namespace: str, key: str, ttl: float) -> bool:
+        """Extend a claim for `ttl` seconds from now, False when it is not claimed"""
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE processed SET updated=?, expire=? WHERE namespace=? AND key=? AND expire IS NOT NULL",
+            (now, now + ttl, namespace, key),
+        )
+        return cursor.rowcount > 0
+
+    def release(self, namespace: str, key: str):
+        """Drop a claim so that the key is retried at once"""
+        self._execute(
+            "DELETE FROM processed WHERE namespace=? AND key=? AND expire IS NOT NULL",
+            (namespace, key),
+        )
+
+    def put(self, namespace: str, key: str, value: str = None, ttl: float = None):
+        """Mark the key done, for `retention` seconds unless `ttl` is given"""
+        self._maybe_prune()
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, now, None if ttl is None else now + ttl),
+        )
+
+    def put_many(self, namespace: str, items: Dict[str, str]):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO processed VALUES (?, ?, ?, ?, NULL)",
+                [(namespace, k, v, now) for k, v in items.items()],
+            )
+
+    def count(self, namespace: str) -> int:
+        return self._execute(
+            "SELECT COUNT(*) FROM processed WHERE namespace=?", (namespace,)
+        ).fetchone()[0]
+
+    def prune(self):
+        """Drop expired claims and done keys older than `retention`"""
+        now = time.time()
+        self._execute(
+            "DELETE FROM processed WHERE expire IS NOT NULL AND expire<=?", (now,)
+        )
+        self._execute(
+            "DELETE FROM processed WHERE expire IS NULL AND updated<=?", (now - self.retention,)
+        )
+
+
+@functools.lru_cache()
+def get_processed_store(path: str = "./cache/processed.sqlite") -> ProcessedStore:
+    return ProcessedStore(path)
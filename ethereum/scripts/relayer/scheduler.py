@@ -0,0 +1,54 @@
+import random
+import threading
+import time
+from typing import Optional
+
+
+class PollTimer:
+    """Pace a polling loop without spinning
+
+    `wait()` blocks until the next poll is due or another thread calls
+    `wake()`. Each failed poll doubles the delay up to `max_interval`, and
+    every delay is jittered so that relayers started together do not hit the
+    backend in lockstep. The first `wait()` returns immediately.
+    """
+
+    def __init__(
+            self,
+            interval: float,
+            max_interval: Optional[float] = None,
+            jitter: float = 0.1,
+    ):
+        self.interval = interval
+        self.max_interval = interval * 10 if max_interval is None else max_interval
+        self.jitter = jitter
+        self.failures = 0
+        self._next = 0
+        self._event = threading.Event()
+
+    def delay(self) -> float:
+        delay = min(self.interval * 2 ** self.failures, self.max_interval)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule(self):
+        self._next = time.time() + self.delay()
+
+    def wait(self) -> bool:
+        """Block until the next poll, return True when woken early"""
+        timeout = self._next - time.time()
+        woken = self._event.wait(timeout) if timeout > 0 else self._event.is_set()
+        self._event.clear()
+        self._schedule()
+        return woken
+
+    def wake(self):
+        """Run the next poll now, e.g. when new work is known to be waiting"""
+        self._event.set()
+
+    def succeed(self):
+        self.failures = 0
+        self._schedule()
+
+    def fail(self):
+        self.failures += 1
+        self._schedule()
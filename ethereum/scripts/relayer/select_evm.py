@@ -1,9 +1,10 @@
-import base64
 import functools
-import random
+from concurrent.futures import Future
 
 import requests
 
+from scripts.relayer.guardian_rpc import get_guardian_fetcher
+
 
 def get_wormhole_info(package) -> dict:
     """Get token bridge info"""
@@ -96,20 +97,27 @@ def get_signed_vaa_by_wormhole(
         sequence: int,
         emitter_chain_id: str = None,
 ):
-    wormhole_url = random.choice(WORMHOLE_GUARDIAN_RPC)
     src_net = get_chain_id_to_net()[emitter_chain_id]
     emitter = NET_TO_EMITTER[src_net]
     emitter_address = format_emitter_address(emitter)
 
-    url = f"{wormhole_url}/v1/signed_vaa/{emitter_chain_id}/{emitter_address}/{sequence}"
-    response = requests.get(url)
+    return get_guardian_fetcher(tuple(WORMHOLE_GUARDIAN_RPC)).get_signed_vaa(
+        emitter_chain_id, emitter_address, sequence
+    )
+
 
-    if 'vaaBytes' not in response.json():
-        return None
+def submit_signed_vaa_by_wormhole(
+        sequence: int,
+        emitter_chain_id: int = None,
+) -> Future:
+    """Same as get_signed_vaa_by_wormhole, fetched in the background"""
+    src_net = get_chain_id_to_net()[emitter_chain_id]
+    emitter = NET_TO_EMITTER[src_net]
+    emitter_address = format_emitter_address(emitter)
 
-    vaa_bytes = response.json()['vaaBytes']
-    vaa = base64.b64decode(vaa_bytes).hex()
-    return f"0x{vaa}"
+    return get_guardian_fetcher(tuple(WORMHOLE_GUARDIAN_RPC)).submit(
+        emitter_chain_id, emitter_address, sequence
+    )
 
 
 def get_pending_data(url: str = None, dstWormholeChainId=None) -> list:
@@ -9,10 +9,9 @@ import time
 import traceback
 from collections import OrderedDict
 from datetime import datetime
-from multiprocessing import Process, set_start_method, Queue
+from multiprocessing import Process, set_start_method
 from pathlib import Path
 
-import pandas as pd
 import requests
 from brownie import project, network, chain, web3
 import threading
@@ -20,8 +19,12 @@ import threading
 from brownie.network.transaction import TransactionReceipt
 
 from scripts.helpful_scripts import get_account, change_network, reconnect_random_rpc, zero_address
+from scripts.relayer.gas_ledger import get_gas_ledger
+from scripts.relayer.log_decoder import LogDecoder
+from scripts.relayer.processed_store import ProcessedStore, get_processed_store
+from scripts.relayer.scheduler import PollTimer
+from scripts.relayer.work_queue import WorkQueue
 from scripts.serde import get_stargate_facet, get_stargate_helper_facet
-from web3._utils.events import get_event_data
 
 FORMAT = "%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s"
 logging.basicConfig(format=FORMAT)
@@ -111,32 +114,15 @@ def read_json(file) -> dict:
         return {}
 
 
-def write_json(file, data: dict):
-    with open(file, "w") as f:
-        return json.dump(data, f, indent=1, separators=(",", ":"))
-
-
-class RWDict(OrderedDict):
-    def __init__(self, file, *args, **kwargs):
-        file_path = Path(__file__).parent.joinpath("gas")
-        if not file_path.exists():
-            file_path.mkdir()
-        file_file = file_path.joinpath(file)
-        self.file = file_file
-        super(RWDict, self).__init__(*args, **kwargs)
-        self.read_data()
-
-    def read_data(self):
-        data = read_json(self.file)
-        for k in data:
-            self[k] = data[k]
-
-    def __setitem__(self, key, value):
-        super(RWDict, self).__setitem__(key, value)
-        write_json(self.file, self)
-
-
-HAS_PROCESSED = RWDict("processed_stargate.json")
+@functools.lru_cache()
+def get_processed_stargate() -> ProcessedStore:
+    """Processed stargate messages, the old json history is imported once"""
+    store = get_processed_store()
+    if store.count("stargate") == 0:
+        data = read_json(Path(__file__).parent.joinpath("gas").joinpath("processed_stargate.json"))
+        if len(data) > 0:
+            store.put_many("stargate", data)
+    return store
 
 
 def process_v1(
@@ -155,10 +141,10 @@ def process_v1(
 
     last_update_endpoint = 0
     endpoint_interval = 30
-    last_pending_time = 0
-    pending_interval = 30
+    poll_timer = PollTimer(3 * 60, max_interval=15 * 60)
 
     while True:
+        poll_timer.wait()
         try:
             if time.time() > last_update_endpoint + endpoint_interval:
                 reconnect_random_rpc()
@@ -168,11 +154,6 @@ def process_v1(
             if src_chain_id is None:
                 src_chain_id = chain.id
 
-            if time.time() < last_pending_time + pending_interval:
-                continue
-            else:
-                last_pending_time = time.time()
-
             pending_data = get_stargate_pending_data(url=pending_url)
             pending_data = [
                 d for d in pending_data if int(d["srcChainId"]) == int(src_chain_id)
@@ -180,7 +161,9 @@ def process_v1(
             local_logger.info(f"Get length: {len(pending_data)}")
         except:
             traceback.print_exc()
+            poll_timer.fail()
             continue
+        poll_timer.succeed()
 
         for d in pending_data:
             try:
@@ -190,12 +173,11 @@ def process_v1(
                 if dstGas < 160000:
                     local_logger.warning(f"{d['srcTransactionId']} not enough dst gas:{dstGas}!")
                 else:
-                    local_logger.warning(f"Put {d['srcTransactionId']} into queue!")
-                    dst_storage[int(d['dstChainId'])].put(d)
+                    if dst_storage[int(d['dstChainId'])].put(d["srcTransactionId"], d, timeout=60):
+                        local_logger.warning(f"Put {d['srcTransactionId']} into queue!")
             except:
                 traceback.print_exc()
                 continue
-        time.sleep(3 * 60)
 
 
 @functools.lru_cache()
@@ -216,6 +198,15 @@ def get_event_abi_by_contract(contract_name, event_name):
     return None
 
 
+@functools.lru_cache()
+def get_stargate_log_decoder() -> LogDecoder:
+    return LogDecoder([
+        get_event_abi_by_interface("IStargate", "CachedSwapSaved"),
+        get_event_abi_by_interface("IERC20", "Transfer"),
+        get_event_abi_by_interface("IStargateEthVault", "TransferNative"),
+    ])
+
+
 def process_v2(
         dstSoDiamond: str,
         dst_storage,
@@ -232,8 +223,10 @@ def process_v2(
 
     stargate_helper = None
     proxy_diamond = None
+    work_queue = None
 
     while True:
+        key = None
         try:
             if stargate_helper is None:
                 stargate_helper = get_stargate_helper_facet()
@@ -247,7 +240,13 @@ def process_v2(
             if src_chain_id is None:
                 src_chain_id = chain.id
 
-            d = dst_storage[src_chain_id].get()
+            if work_queue is None:
+                work_queue = dst_storage[src_chain_id]
+            leased = work_queue.get(timeout=60)
+            if leased is None:
+                local_logger.info(f"Queue metrics: {work_queue.metrics()}")
+                continue
+            key, d = leased
 
             tx = chain.get_transaction(d["dstTransactionId"])
 
@@ -258,41 +257,31 @@ def process_v2(
 
             if len(payload) == 0:
                 local_logger.warning(f"{d['srcTransactionId']}, Payload not found")
+                work_queue.ack(key)
                 continue
 
             receipt = web3.eth.get_transaction_receipt(d["dstTransactionId"])
-            logs = receipt["logs"]
-            message_abi = get_event_abi_by_interface("IStargate", "CachedSwapSaved")
-            transfer_abi = get_event_abi_by_interface("IERC20", "Transfer")
-            transfer_native_abi = get_event_abi_by_interface("IStargateEthVault", "TransferNative")
             events = {"CachedSwapSaved": {}, "Transfer": {}}
-
-            for log in logs:
-                try:
-                    data = get_event_data(web3.codec, message_abi, log)
+            # The last matching log of the receipt wins
+            for name, data in get_stargate_log_decoder().decode_ordered(receipt["logs"]):
+                if name == "CachedSwapSaved":
                     events["CachedSwapSaved"] = data
-                except:
-                    pass
-                try:
-                    data = get_event_data(web3.codec, transfer_abi, log)
+                elif name == "Transfer":
                     if str(data["args"]["to"]).lower() == str(proxy_diamond.address).lower():
                         events["Transfer"] = data
-                except:
-                    pass
-                try:
-                    data = get_event_data(web3.codec, transfer_native_abi, log)
+                elif name == "TransferNative":
                     if str(data["args"]["dst"]).lower() == str(proxy_diamond.address).lower():
-                        events["Transfer"] = data
+                        events["Transfer"] = dict(data)
                         events["Transfer"]["address"] = zero_address()
-                except:
-                    pass
 
             if len(events["CachedSwapSaved"]) == 0:
                 local_logger.warning(f"{d['srcTransactionId']}, CachedSwapSaved not found")
+                work_queue.ack(key)
                 continue
 
             if len(events["Transfer"]) == 0:
                 local_logger.warning(f"{d['srcTransactionId']}, Transfer not found")
+                work_queue.ack(key)
                 continue
             info = {
                 "chainId": events["CachedSwapSaved"]["args"]["chainId"],
@@ -309,8 +298,9 @@ def process_v2(
                 f'{info["token"]}|{info["amountLD"]}|{info["payload"]}'
             )
             dk = str(hashlib.sha3_256(dv.encode()).digest().hex())
-            if dk in HAS_PROCESSED:
+            if ("stargate", dk) in get_processed_stargate():
                 local_logger.warning(f"{d['srcTransactionId']}, HAS PROCESSED")
+                work_queue.ack(key)
                 continue
             local_logger.info(f"Process {d['srcTransactionId']}")
             result: TransactionReceipt = proxy_diamond.sgReceive(
@@ -331,9 +321,12 @@ def process_v2(
                 d["srcNet"],
                 dst_net=network.show_active(),
             )
-            HAS_PROCESSED[dk] = dv
+            get_processed_stargate().put("stargate", dk, dv)
+            work_queue.ack(key)
         except:
             traceback.print_exc()
+            if key is not None:
+                work_queue.nack(key, 3 * 60)
             continue
         time.sleep(3 * 60)
 
@@ -394,16 +387,7 @@ def record_gas(
         dst_net: str,
         file_path=Path(__file__).parent.parent.parent.parent.joinpath("gas"),
 ):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"stargate_{dst_net}_{period1}_{period2}.csv")
     data = OrderedDict({
         "record_time": str(datetime.fromtimestamp(cur_timestamp))[:19],
         "src_transaction": src_transaction,
@@ -415,13 +399,7 @@ def record_gas(
         "actual_gas_price": actual_gas_price,
         "actual_value": actual_gas * actual_gas_price,
     })
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode="a")
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode="w")
+    get_gas_ledger(str(file_path), "stargate_{dst_net}_{period1}_{period2}.csv").record(data, cur_timestamp)
 
 
 def main():
@@ -429,7 +407,7 @@ def main():
     project_path = Path(__file__).parent.parent.parent
     logger.info(f"Loading project...")
     dst_storage = {
-        v["dstChainId"]: Queue()
+        v["dstChainId"]: WorkQueue(f"stargate_{v['dstChainId']}")
         for v in SUPPORTED_EVM
     }
     for d in SUPPORTED_EVM:
@@ -0,0 +1,276 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from brownie import network, web3
+
+from scripts.relayer.scheduler import PollTimer
+
+logger = logging.getLogger()
+
+# (txid, gas_used, gas_price)
+ConfirmCallback = Callable[[str, int, int], None]
+# (txid, error)
+FailCallback = Callable[[Optional[str], str], None]
+# (txid), the transaction is still not mined
+PendingCallback = Callable[[str], None]
+
+
+class PendingTx:
+    __slots__ = (
+        "nonce", "tx", "txids", "broadcast_time", "replaced", "renewed", "has_slot",
+        "on_confirmed", "on_failed", "on_pending",
+    )
+
+    def __init__(
+            self,
+            nonce: int,
+            tx,
+            on_confirmed: ConfirmCallback,
+            on_failed: FailCallback,
+            on_pending: PendingCallback,
+    ):
+        self.nonce = nonce
+        # Latest brownie receipt, used to replace the transaction
+        self.tx = tx
+        # The original and all replacements, any of them may be mined
+        self.txids: List[str] = [tx.txid]
+        self.broadcast_time = time.time()
+        self.replaced = 0
+        self.renewed = time.time()
+        # Whether the transaction still holds one of the `max_pending` slots
+        self.has_slot = True
+        self.on_confirmed = on_confirmed
+        self.on_failed = on_failed
+        self.on_pending = on_pending
+
+
+class TxPipeline:
+    """Broadcast transactions of one account back to back with local nonces
+
+    Nonces are assigned under a lock while the transaction is broadcast, so a
+    transaction that fails before broadcast (e.g. estimate gas revert) never
+    leaves a gap. Receipts are tracked by a monitor thread which calls
+    `on_confirmed` or `on_failed`, and `on_pending` every `renew_interval`
+    seconds until then, e.g. to extend the claim on the relayed message. A
+    transaction not mined after `replace_after` seconds is replaced with the
+    same nonce and a higher gas price, at most `max_replace` times. After
+    that it gives back its `max_pending` slot but is still watched until it
+    is mined or its nonce is used by another transaction.
+    """
+
+    def __init__(
+            self,
+            account,
+            max_pending: int = 64,
+            replace_after: float = 120,
+            gas_price_increment: float = 1.125,
+            max_replace: int = 3,
+            poll_interval: float = 2,
+            renew_interval: float = 60,
+    ):
+        self.account = account
+        self.replace_after = replace_after
+        self.renew_interval = renew_interval
+        self.gas_price_increment = gas_price_increment
+        self.max_replace = max_replace
+        self.local_logger = logger.getChild(f"[tx|{account.address[:10]}]")
+        self._nonce: Optional[int] = None
+        self._nonce_lock = threading.Lock()
+        self._pending: Dict[int, PendingTx] = {}
+        self._pending_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._timer = PollTimer(poll_interval, max_interval=poll_interval * 5)
+        self._closed = threading.Event()
+        self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor.start()
+
+    def resync(self):
+        """Forget the local nonce, the next submit reads it from the chain"""
+        with self._nonce_lock:
+            self._nonce = None
+
+    def pending_count(self) -> int:
+        with self._pending_lock:
+            return len(self._pending)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until every submitted transaction is finished, False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending_count() > 0:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            self._timer.wake()
+            time.sleep(0.5)
+        return True
+
+    def close(self, timeout: float = None) -> bool:
+        """Wait for the submitted transactions and stop the monitor, False on timeout
+
+        The pipeline reads receipts through the active brownie network, so it
+        is closed before switching to another network.
+        """
+        finished = self.wait(timeout)
+        self._closed.set()
+        self._timer.wake()
+        self._monitor.join(timeout)
+        return finished
+
+    def submit(
+            self,
+            method,
+            *args,
+            tx_params: dict = None,
+            on_confirmed: ConfirmCallback = None,
+            on_failed: FailCallback = None,
+            on_pending: PendingCallback = None,
+    ) -> str:
+        """Broadcast `method(*args, tx_params)` without waiting, return txid
+
+        Blocks while `max_pending` transactions are unconfirmed.
+        """
+        self._slots.acquire()
+        try:
+            with self._nonce_lock:
+                if self._nonce is None:
+                    self._nonce = web3.eth.get_transaction_count(self.account.address, "pending")
+                params = dict(tx_params or {})
+                params.update({"from": self.account, "nonce": self._nonce, "required_confs": 0})
+                tx = method(*args, params)
+                nonce = self._nonce
+                self._nonce += 1
+        except Exception as e:
+            self._slots.release()
+            if "nonce" in str(e).lower():
+                # Another sender used this account, start again from chain state
+                self.resync()
+            raise
+        with self._pending_lock:
+            self._pending[nonce] = PendingTx(nonce, tx, on_confirmed, on_failed, on_pending)
+        return tx.txid
+
+    def _release_slot(self, pending: PendingTx):
+        if pending.has_slot:
+            pending.has_slot = False
+            self._slots.release()
+
+    def _finish(self, pending: PendingTx):
+        with self._pending_lock:
+            self._pending.pop(pending.nonce, None)
+        self._release_slot(pending)
+
+    def _receipt(self, pending: PendingTx):
+        for txid in pending.txids:
+            try:
+                receipt = web3.eth.get_transaction_receipt(txid)
+            except Exception:
+                continue
+            if receipt is not None:
+                return receipt
+        return None
+
+    def _renew(self, pending: PendingTx):
+        if pending.on_pending is None or time.time() - pending.renewed < self.renew_interval:
+            return
+        pending.renewed = time.time()
+        try:
+            pending.on_pending(pending.txids[-1])
+        except Exception as e:
+            self.local_logger.error(f"Pending callback for txid {pending.txids[-1]} error: {e}")
+
+    def _replace(self, pending: PendingTx):
+        if pending.replaced >= self.max_replace:
+            if pending.has_slot:
+                self.local_logger.warning(
+                    f"Nonce {pending.nonce} txid {pending.txids[-1]} not mined after "
+                    f"{pending.replaced} replacements, keep watching it"
+                )
+                self._release_slot(pending)
+            return
+        try:
+            tx = pending.tx.replace(increment=self.gas_price_increment)
+        except Exception as e:
+            self.local_logger.warning(f"Replace nonce {pending.nonce} txid {pending.txids[-1]} fail: {e}")
+            return
+        pending.tx = tx
+        pending.txids.append(tx.txid)
+        pending.broadcast_time = time.time()
+        pending.replaced += 1
+        self.local_logger.info(f"Replace nonce {pending.nonce} with txid {tx.txid}")
+
+    def _check(self):
+        with self._pending_lock:
+            pending_list = sorted(self._pending.values(), key=lambda p: p.nonce)
+        if len(pending_list) == 0:
+            return
+        chain_nonce = None
+        for pending in pending_list:
+            receipt = self._receipt(pending)
+            if receipt is None:
+                if time.time() - pending.broadcast_time < self.replace_after:
+                    self._renew(pending)
+                    continue
+                if chain_nonce is None:
+                    chain_nonce = web3.eth.get_transaction_count(self.account.address)
+                # It may be mined after the first receipt read, only a receipt
+                # read after the nonce tells that the nonce went to another transaction
+                receipt = self._receipt(pending)
+                if receipt is None and chain_nonce > pending.nonce:
+                    self._finish(pending)
+                    if pending.on_failed is not None:
+                        pending.on_failed(pending.txids[-1], f"nonce {pending.nonce} used by other transaction")
+                    continue
+                if receipt is None:
+                    self._replace(pending)
+                    self._renew(pending)
+                    continue
+
+            self._finish(pending)
+            txid = receipt["transactionHash"].hex()
+            try:
+                if receipt["status"] == 1:
+                    if pending.on_confirmed is not None:
+                        gas_price = receipt.get("effectiveGasPrice", None)
+                        if gas_price is None:
+                            gas_price = web3.eth.get_transaction(txid)["gasPrice"]
+                        pending.on_confirmed(txid, receipt["gasUsed"], gas_price)
+                elif pending.on_failed is not None:
+                    pending.on_failed(txid, "reverted")
+            except Exception as e:
+                self.local_logger.error(f"Callback for txid {txid} error: {e}")
+
+    def _monitor_loop(self):
+        while True:
+            self._timer.wait()
+            if self._closed.is_set():
+                return
+            try:
+                self._check()
+                self._timer.succeed()
+            except Exception as e:
+                self.local_logger.error(f"Check pending transactions error: {e}")
+                self._timer.fail()
+
+
+_pipelines: Dict[tuple, TxPipeline] = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_tx_pipeline(account) -> TxPipeline:
+    """One pipeline per network and account, the threads of a relayer share its nonces"""
+    key = (network.show_active(), account.address)
+    with _pipelines_lock:
+        if key not in _pipelines:
+            _pipelines[key] = TxPipeline(account)
+        return _pipelines[key]
+
+
+def close_tx_pipeline(account, timeout: float = None) -> bool:
+    """Drain and forget the pipeline of the active network, see `TxPipeline.close`"""
+    key = (network.show_active(), account.address)
+    with _pipelines_lock:
+        pipeline = _pipelines.pop(key, None)
+    if pipeline is None:
+        return True
+    return pipeline.close(timeout)
@@ -0,0 +1,178 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+# (emitter chain id, emitter address, sequence)
+VaaKey = Tuple[int, str, int]
+
+
+class VaaCache:
+    """Signed vaa cache: in-memory LRU in front of a sqlite file
+
+    A signed vaa never changes for its (emitter chain, emitter, sequence), so
+    a hit is valid until it is evicted: signed vaa not used for `max_age`
+    seconds are dropped, then the least recently used ones above `max_rows`.
+    "Not signed yet" answers are only kept for `negative_ttl` seconds. The
+    sqlite file is opened in WAL mode and can be shared by all relayer
+    processes on one host.
+    """
+
+    def __init__(
+            self,
+            path: str = "./cache/signed_vaa.sqlite",
+            capacity: int = 4096,
+            negative_ttl: float = 10,
+            max_rows: int = 200_000,
+            max_age: float = 30 * 24 * 60 * 60,
+            prune_interval: float = 60 * 60,
+    ):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.capacity = capacity
+        self.negative_ttl = negative_ttl
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._last_prune = 0
+        self._lru = OrderedDict()
+        self._missing = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS signed_vaa ("
+            "emitter_chain INTEGER, emitter TEXT, sequence INTEGER, vaa TEXT, used REAL, "
+            "PRIMARY KEY (emitter_chain, emitter, sequence)) WITHOUT ROWID"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS signed_vaa_used ON signed_vaa (used)")
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS unsigned_vaa ("
+            "emitter_chain INTEGER, emitter TEXT, sequence INTEGER, expire REAL, "
+            "PRIMARY KEY (emitter_chain, emitter, sequence)) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def key(emitter_chain: int, emitter: str, sequence: int) -> VaaKey:
+        return int(emitter_chain), emitter.replace("0x", "").lower(), int(sequence)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, args: tuple = ()):
+        return self._connection().execute(sql, args)
+
+    def _maybe_prune(self):
+        if time.time() >= self._last_prune + self.prune_interval:
+            self._last_prune = time.time()
+            self.prune()
+
+    def _remember(self, key: VaaKey, vaa: str):
+        with self._lock:
+            self._lru[key] = vaa
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+            self._missing.pop(key, None)
+
+    def get(self, key: VaaKey) -> Tuple[bool, Optional[str]]:
+        """Return (hit, vaa), a hit with None vaa means recently not signed"""
+        now = time.time()
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return True, self._lru[key]
+            if self._missing.get(key, 0) > now:
+                return True, None
+
+        row = self._execute(
+            "SELECT vaa FROM signed_vaa WHERE emitter_chain=? AND emitter=? AND sequence=?",
+            key,
+        ).fetchone()
+        if row is not None:
+            self._execute(
+                "UPDATE signed_vaa SET used=? WHERE emitter_chain=? AND emitter=? AND sequence=?",
+                (now,) + key,
+            )
+            self._remember(key, row[0])
+            return True, row[0]
+
+        row = self._execute(
+            "SELECT expire FROM unsigned_vaa WHERE emitter_chain=? AND emitter=? AND sequence=?",
+            key,
+        ).fetchone()
+        if row is not None and row[0] > now:
+            with self._lock:
+                self._missing[key] = row[0]
+            return True, None
+        return False, None
+
+    def put(self, key: VaaKey, vaa: str):
+        self._maybe_prune()
+        self._execute(
+            "INSERT OR REPLACE INTO signed_vaa VALUES (?, ?, ?, ?, ?)", key + (vaa, time.time())
+        )
+        self._execute(
+            "DELETE FROM unsigned_vaa WHERE emitter_chain=? AND emitter=? AND sequence=?",
+            key,
+        )
+        self._remember(key, vaa)
+
+    def put_missing(self, key: VaaKey):
+        self._maybe_prune()
+        expire = time.time() + self.negative_ttl
+        self._execute(
+            "INSERT OR REPLACE INTO unsigned_vaa VALUES (?, ?, ?, ?)", key + (expire,)
+        )
+        with self._lock:
+            self._missing[key] = expire
+            if len(self._missing) > self.capacity:
+                now = time.time()
+                self._missing = {k: v for k, v in self._missing.items() if v > now}
+
+    def prune(self):
+        """Drop expired negative entries and evict stale or least recently used vaa"""
+        now = time.time()
+        self._execute("DELETE FROM unsigned_vaa WHERE expire<=?", (now,))
+        self._execute("DELETE FROM signed_vaa WHERE used<=?", (now - self.max_age,))
+        row = self._execute(
+            "SELECT used FROM signed_vaa ORDER BY used DESC LIMIT 1 OFFSET ?",
+            (self.max_rows,),
+        ).fetchone()
+        if row is not None:
+            self._execute("DELETE FROM signed_vaa WHERE used<=?", (row[0],))
+
+    def fetch(
+            self,
+            emitter_chain: int,
+            emitter: str,
+            sequence: int,
+            loader: Callable[[], Optional[str]],
+    ) -> Optional[str]:
+        """Cached vaa, or call `loader` and cache its answer"""
+        key = self.key(emitter_chain, emitter, sequence)
+        hit, vaa = self.get(key)
+        if hit:
+            return vaa
+        vaa = loader()
+        if vaa is None:
+            self.put_missing(key)
+        else:
+            self.put(key, vaa)
+        return vaa
+
+
+@functools.lru_cache()
+def get_vaa_cache(path: str = "./cache/signed_vaa.sqlite") -> VaaCache:
+    return VaaCache(path)
@@ -0,0 +1,234 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from scripts.relayer.scheduler import PollTimer
+
+PENDING = 0
+LEASED = 1
+DONE = 2
+DEAD = 3
+
+
+class WorkQueue:
+    """Persistent work queue shared by relayer processes, backed by sqlite
+
+    Items are keyed, e.g. by source txid, and `put` ignores a key that is
+    queued, in flight or done within `retention` seconds, so several
+    producers can enqueue the same work. `put` blocks while `capacity`
+    items are outstanding. `get` leases the oldest available item for
+    `lease_time` seconds; the consumer calls `ack` when it is handled or
+    `nack` to retry it later. An item that is neither is delivered again
+    once its lease expires, also after a crash, and is parked as dead after
+    `max_attempts` deliveries.
+
+    A blocked `get` checks the table every `poll_interval` seconds, and is
+    woken at once by a `put` or `nack` through the same queue object, e.g.
+    from another thread of the process.
+
+    The queue only holds its configuration, so it can be passed to spawned
+    processes, each opens its own sqlite connections.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            path: str = "./cache/work_queue.sqlite",
+            capacity: int = 1000,
+            lease_time: float = 10 * 60,
+            max_attempts: int = 10,
+            retention: float = 7 * 24 * 60 * 60,
+            poll_interval: float = 1,
+    ):
+        self.name = str(name)
+        self.path = path
+        self.capacity = capacity
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._timer = PollTimer(poll_interval, jitter=0)
+        self._last_prune = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            "queue TEXT, key TEXT, item TEXT, state INTEGER, enqueued REAL, "
+            "available REAL, attempts INTEGER, updated REAL, "
+            "PRIMARY KEY (queue, key)) WITHOUT ROWID"
+        )
+        self._execute(
+            "CREATE INDEX IF NOT EXISTS work_available ON work (queue, state, available)"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        del state["_timer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._timer = PollTimer(self.poll_interval, jitter=0)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, args: tuple = ()):
+        return self._connection().execute(sql, args)
+
+    def qsize(self) -> int:
+        """Outstanding items, queued or in flight"""
+        return self._execute(
+            "SELECT COUNT(*) FROM work WHERE queue=? AND state IN (?, ?)",
+            (self.name, PENDING, LEASED),
+        ).fetchone()[0]
+
+    def put(self, key: str, item: dict, block: bool = True, timeout: float = None) -> bool:
+        """Enqueue `item` once per key, False when the key is known or on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        data = json.dumps(item)
+        while True:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                known = conn.execute(
+                    "SELECT 1 FROM work WHERE queue=? AND key=?", (self.name, key)
+                ).fetchone()
+                if known is not None:
+                    conn.execute("COMMIT")
+                    return False
+                if self.qsize() < self.capacity:
+                    now = time.time()
+                    conn.execute(
+                        "INSERT INTO work VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                        (self.name, key, data, PENDING, now, now, now),
+                    )
+                    conn.execute("COMMIT")
+                    self._timer.wake()
+                    return True
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if not block or (deadline is not None and time.time() >= deadline):
+                return False
+            time.sleep(self.poll_interval)
+
+    def get(self, block: bool = True, timeout: float = None) -> Optional[Tuple[str, dict]]:
+        """Lease the oldest available item, (key, item) or None on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self._maybe_prune()
+            leased = self._lease()
+            if leased is not None:
+                return leased
+            if not block or (deadline is not None and time.time() >= deadline):
+                return None
+            self._timer.wait()
+
+    def _lease(self) -> Optional[Tuple[str, dict]]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            while True:
+                row = conn.execute(
+                    "SELECT key, item, attempts FROM work WHERE queue=? AND state IN (?, ?) "
+                    "AND available<=? ORDER BY enqueued LIMIT 1",
+                    (self.name, PENDING, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                key, item, attempts = row
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE work SET state=?, updated=? WHERE queue=? AND key=?",
+                        (DEAD, now, self.name, key),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE work SET state=?, available=?, attempts=attempts+1, updated=? "
+                    "WHERE queue=? AND key=?",
+                    (LEASED, now + self.lease_time, now, self.name, key),
+                )
+                conn.execute("COMMIT")
+                return key, json.loads(item)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ack(self, key: str):
+        """The item is handled, its key stays known for `retention` seconds"""
+        self._execute(
+            "UPDATE work SET state=?, updated=? WHERE queue=? AND key=?",
+            (DONE, time.time(), self.name, key),
+        )
+
+    def renew(self, key: str, lease_time: float = None) -> bool:
+        """Extend the lease of an item in flight, False when it is not leased"""
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE work SET available=?, updated=? WHERE queue=? AND key=? AND state=?",
+            (now + (self.lease_time if lease_time is None else lease_time), now, self.name, key, LEASED),
+        )
+        return cursor.rowcount > 0
+
+    def nack(self, key: str, delay: float = 0, count: bool = True):
+        """Deliver the item again after `delay` seconds
+
+        With `count=False` the delivery is not counted against
+        `max_attempts`, for items deferred by business rules (e.g. fee too
+        low for the current gas price) rather than failed.
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE work SET state=?, available=?, attempts=attempts-?, updated=? "
+            "WHERE queue=? AND key=? AND state=?",
+            (PENDING, now + delay, 0 if count else 1, now, self.name, key, LEASED),
+        )
+        if delay <= 0:
+            self._timer.wake()
+
+    def metrics(self) -> Dict[str, float]:
+        """Depth by state and age in seconds of the oldest outstanding item"""
+        now = time.time()
+        result = {"pending": 0, "leased": 0, "done": 0, "dead": 0, "oldest_age": 0}
+        names = {PENDING: "pending", LEASED: "leased", DONE: "done", DEAD: "dead"}
+        for state, count in self._execute(
+                "SELECT state, COUNT(*) FROM work WHERE queue=? GROUP BY state", (self.name,)
+        ):
+            result[names[state]] = count
+        oldest = self._execute(
+            "SELECT MIN(enqueued) FROM work WHERE queue=? AND state IN (?, ?)",
+            (self.name, PENDING, LEASED),
+        ).fetchone()[0]
+        if oldest is not None:
+            result["oldest_age"] = now - oldest
+        return result
+
+    def _maybe_prune(self):
+        if time.time() >= self._last_prune + 60 * 60:
+            self._last_prune = time.time()
+            self.prune()
+
+    def prune(self):
+        """Forget done and dead items older than `retention`"""
+        self._execute(
+            "DELETE FROM work WHERE queue=? AND state IN (?, ?) AND updated<?",
+            (self.name, DONE, DEAD, time.time() - self.retention),
+        )
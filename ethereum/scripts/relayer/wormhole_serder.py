@@ -1,11 +1,70 @@
+import functools
 import json
-from typing import Union
+from typing import List, Union
 
 from base58 import b58encode
-
-from scripts.relayer import omniswap_serde
 from eth_utils import keccak
 
+from . import omniswap_serde
+
+
+class HexString(bytes):
+    """Bytes returned by the offline decoder, printed and compared as hex
+    strings in the same way brownie formats `bytes`/`bytes32` return values,
+    so `HexString(padded_address) == "0x..."` ignores left zero padding.
+    """
+
+    def __eq__(self, other):
+        if isinstance(other, str):
+            other = other[2:] if other[:2] in ("0x", "0X") else other
+            return self.hex().lstrip("0") == other.lower().lstrip("0")
+        return bytes.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = bytes.__hash__
+
+    def __str__(self):
+        return "0x" + self.hex()
+
+    __repr__ = __str__
+
+
+class AbiTuple(tuple):
+    """Tuple with named field access, mirroring brownie's ReturnValue so that
+    offline decode results can be used as `data[-4]` or `data["emitterChainId"]`.
+    """
+
+    def __new__(cls, values, fields):
+        obj = super().__new__(cls, values)
+        obj._fields = tuple(fields)
+        return obj
+
+    def __getnewargs__(self):
+        return tuple(self), self._fields
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._fields.index(key)
+            except ValueError:
+                raise KeyError(key)
+        return super().__getitem__(key)
+
+    def __eq__(self, other):
+        if not isinstance(other, (tuple, list)) or len(other) != len(self):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = tuple.__hash__
+
+    def dict(self):
+        return dict(zip(self._fields, self))
+
 
 class SoData:
     def __init__(
@@ -118,6 +177,29 @@ class SoData:
             amount,
         )
 
+    def format_to_contract(self):
+        """Same layout as ISo.NormalizedSoData returned by the contract"""
+        return AbiTuple(
+            (
+                HexString(self.transactionId),
+                HexString(self.receiver),
+                self.sourceChainId,
+                HexString(self.sendingAssetId),
+                self.destinationChainId,
+                HexString(self.receivingAssetId),
+                self.amount,
+            ),
+            (
+                "transactionId",
+                "receiver",
+                "sourceChainId",
+                "sendingAssetId",
+                "destinationChainId",
+                "receivingAssetId",
+                "amount",
+            ),
+        )
+
     @classmethod
     def padding(cls, transactionId, receiver, receivingAssetId):
         return SoData(transactionId, receiver, 0, b"", 0, receivingAssetId, 0)
@@ -176,6 +258,27 @@ class SwapData:
             "callData": "0x" + self.callData.hex(),
         }
 
+    def format_to_contract(self):
+        """Same layout as LibSwap.NormalizedSwapData returned by the contract"""
+        return AbiTuple(
+            (
+                HexString(self.callTo),
+                HexString(self.approveTo),
+                HexString(self.sendingAssetId),
+                HexString(self.receivingAssetId),
+                self.fromAmount,
+                HexString(self.callData),
+            ),
+            (
+                "callTo",
+                "approveTo",
+                "sendingAssetId",
+                "receivingAssetId",
+                "fromAmount",
+                "callData",
+            ),
+        )
+
     @classmethod
     def encode_normalized(cls, swap_data_list):
         data = bytearray()
@@ -335,32 +438,111 @@ class WormholeData:
         )
 
 
+def to_memoryview(data: Union[bytes, bytearray, memoryview, str]) -> memoryview:
+    """View over the raw bytes, slicing it does not copy the underlying data"""
+    if isinstance(data, str):
+        data = bytes.fromhex(data.replace("0x", ""))
+    if isinstance(data, memoryview):
+        return data
+    return memoryview(data)
+
+
+class GuardianSignature:
+    __slots__ = ("index", "signature")
+
+    def __init__(self, index: int, signature: bytes):
+        self.index = index
+        self.signature = signature
+
+    def format_json(self):
+        return {"index": self.index, "signature": "0x" + self.signature.hex()}
+
+    def format_to_contract(self):
+        """Same layout as IWormhole.Signature"""
+        return AbiTuple(
+            (
+                HexString(self.signature[0:32]),
+                HexString(self.signature[32:64]),
+                self.signature[64] + 27,
+                self.index,
+            ),
+            ("r", "s", "v", "guardianIndex"),
+        )
+
+
 class ParsedVaa:
-    def __init__(
-            self,
-            version,
-            guardian_set_index,
-            guardian_signatures,
-            timestamp,
-            nonce,
-            emitter_chain,
-            emitter_address,
-            sequence,
-            consistency_level,
-            payload,
-            hash,
-    ):
-        self.version = version
-        self.guardian_set_index = guardian_set_index
-        self.guardian_signatures = guardian_signatures
-        self.timestamp = timestamp
-        self.nonce = nonce
-        self.emitter_chain = emitter_chain
-        self.emitter_address = emitter_address
-        self.sequence = sequence
-        self.consistency_level = consistency_level
-        self.payload = payload
-        self.hash = hash
+    """Signed vaa, the header fields are decoded on demand from the raw bytes"""
+
+    __slots__ = ("_vaa", "_body", "_hash", "_guardian_signatures")
+
+    SIG_START = 6
+    SIG_LENGTH = 66
+
+    def __init__(self, vaa: memoryview):
+        self._vaa = vaa
+        self._body = vaa[self.SIG_START + self.SIG_LENGTH * vaa[5]:]
+        self._hash = None
+        self._guardian_signatures = None
+
+    @property
+    def version(self):
+        return self._vaa[0]
+
+    @property
+    def guardian_set_index(self):
+        return int.from_bytes(self._vaa[1:5], byteorder="big")
+
+    @property
+    def guardian_signatures(self):
+        if self._guardian_signatures is None:
+            guardian_signatures = []
+            for i in range(self._vaa[5]):
+                start = self.SIG_START + i * self.SIG_LENGTH
+                guardian_signatures.append(
+                    GuardianSignature(
+                        self._vaa[start], bytes(self._vaa[start + 1: start + self.SIG_LENGTH])
+                    )
+                )
+            self._guardian_signatures = guardian_signatures
+        return self._guardian_signatures
+
+    @property
+    def timestamp(self):
+        return int.from_bytes(self._body[0:4], byteorder="big")
+
+    @property
+    def nonce(self):
+        return int.from_bytes(self._body[4:8], byteorder="big")
+
+    @property
+    def emitter_chain(self):
+        return int.from_bytes(self._body[8:10], byteorder="big")
+
+    @property
+    def emitter_address(self):
+        return bytes(self._body[10:42])
+
+    @property
+    def sequence(self):
+        return int.from_bytes(self._body[42:50], byteorder="big")
+
+    @property
+    def consistency_level(self):
+        return self._body[50]
+
+    @property
+    def payload_view(self):
+        return self._body[51:]
+
+    @property
+    def payload(self):
+        return bytes(self._body[51:])
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = keccak(bytes(self._body))
+        return self._hash
 
     def __str__(self):
         return json.dumps(self.format_json(), indent=2)
@@ -369,88 +551,121 @@ class ParsedVaa:
         return {
             "version": self.version,
             "guardianSetIndex": self.guardian_set_index,
-            "guardianSignatures": [
-                {"index": g["index"], "signature": "0x" + g["signature"].hex()}
-                for g in self.guardian_signatures
-            ],
+            "guardianSignatures": [g.format_json() for g in self.guardian_signatures],
             "timestamp": self.timestamp,
             "nonce": self.nonce,
             "emitterChain": self.emitter_chain,
             "emitterAddress": "0x" + self.emitter_address.hex(),
             "sequence": self.sequence,
             "consistencyLevel": self.consistency_level,
-            "payload": "0x" + self.payload.hex(),
+            "payload": "0x" + self.payload_view.hex(),
             "hash": "0x" + self.hash.hex(),
         }
 
-    @classmethod
-    def parse(cls, vaa: Union[bytes, str]):
-        if isinstance(vaa, str):
-            signed_vaa = bytearray(bytes.fromhex(vaa.replace("0x", "")))
-        else:
-            signed_vaa = bytearray(vaa)
-
-        sig_start = 6
-        num_signers = signed_vaa[5]
-        sig_length = 66
-
-        guardian_signatures = []
-        for i in range(num_signers):
-            start = sig_start + i * sig_length
-            guardian_signatures.append(
-                {
-                    "index": signed_vaa[start],
-                    "signature": bytes(signed_vaa[start + 1: start + 66]),
-                }
-            )
-
-        body = signed_vaa[sig_start + sig_length * num_signers:]
-
-        return ParsedVaa(
-            signed_vaa[0],
-            int.from_bytes(signed_vaa[1:5], byteorder="big"),
-            guardian_signatures,
-            int.from_bytes(body[0:4], byteorder="big"),
-            int.from_bytes(body[4:8], byteorder="big"),
-            int.from_bytes(body[8:10], byteorder="big"),
-            bytes(body[10:42]),
-            int.from_bytes(body[42:50], byteorder="big"),
-            body[50],
-            bytes(body[51:]),
-            keccak(body),
+    def format_to_contract(self):
+        """Same layout as IWormhole.parseVM
+
+        Note: the contract hash is keccak256(keccak256(body)) while `self.hash`
+        is the single body digest.
+        """
+        return AbiTuple(
+            (
+                self.version,
+                self.timestamp,
+                self.nonce,
+                self.emitter_chain,
+                HexString(self.emitter_address),
+                self.sequence,
+                self.consistency_level,
+                HexString(self.payload),
+                self.guardian_set_index,
+                [g.format_to_contract() for g in self.guardian_signatures],
+                HexString(keccak(self.hash)),
+            ),
+            (
+                "version",
+                "timestamp",
+                "nonce",
+                "emitterChainId",
+                "emitterAddress",
+                "sequence",
+                "consistencyLevel",
+                "payload",
+                "guardianSetIndex",
+                "signatures",
+                "hash",
+            ),
         )
 
+    @classmethod
+    def parse(cls, vaa: Union[bytes, memoryview, str]):
+        return ParsedVaa(to_memoryview(vaa))
+
 
 class ParsedTransfer:
+    """Token bridge transfer, the swap payload is only parsed when accessed"""
+
+    __slots__ = ("_payload", "_parsed_transfer_payload")
+
     Transfer = 1
     AttestMeta = 2
     TransferWithPayload = 3
 
-    def __init__(
-            self,
-            payload_type,
-            amount,
-            token_address,
-            token_chain,
-            redeemer,
-            redeemer_chain,
-            fee,
-            from_emitter,
-            transfer_payload,
-    ):
-        self.payload_type = payload_type
-        self.amount = amount
-        self.token_address = token_address
-        self.token_chain = token_chain
-        self.redeemer = redeemer
-        self.redeemer_chain = redeemer_chain
-        self.fee = fee
-        self.from_emitter = from_emitter
-        self.transfer_payload = transfer_payload
-
-        self.parsed_transfer_payload = ParsedTransferPayload.parse(
-            self.transfer_payload
-        )
+    def __init__(self, payload: memoryview):
+        self._payload = payload
+        self._parsed_transfer_payload = None
+
+    @property
+    def payload_type(self):
+        return self._payload[0]
+
+    @property
+    def amount(self):
+        return int.from_bytes(self._payload[1:33], byteorder="big")
+
+    @property
+    def token_address(self):
+        return bytes(self._payload[33:65])
+
+    @property
+    def token_chain(self):
+        return int.from_bytes(self._payload[65:67], byteorder="big")
+
+    @property
+    def redeemer(self):
+        return bytes(self._payload[67:99])
+
+    @property
+    def redeemer_chain(self):
+        return int.from_bytes(self._payload[99:101], byteorder="big")
+
+    @property
+    def fee(self):
+        if self.payload_type == self.Transfer:
+            return int.from_bytes(self._payload[101:133], byteorder="big")
+        return None
+
+    @property
+    def from_emitter(self):
+        if self.payload_type == self.TransferWithPayload:
+            return bytes(self._payload[101:133])
+        return None
+
+    @property
+    def transfer_payload_view(self):
+        return self._payload[133:]
+
+    @property
+    def transfer_payload(self):
+        return bytes(self._payload[133:])
+
+    @property
+    def parsed_transfer_payload(self):
+        if self._parsed_transfer_payload is None:
+            self._parsed_transfer_payload = ParsedTransferPayload.parse(
+                self.transfer_payload_view
+            )
+        return self._parsed_transfer_payload
 
     def __str__(self):
         return json.dumps(self.format_json(), indent=2)
@@ -469,58 +684,47 @@ class ParsedTransfer:
             "redeemerChain": self.redeemer_chain,
             "fee": self.fee,
             "fromEmitter": "0x" + self.from_emitter.hex(),
-            "TransferPayload": "0x" + self.transfer_payload.hex(),
+            "TransferPayload": "0x" + self.transfer_payload_view.hex(),
             "recipient": b58encode(self.recipient()).decode()
             if self.redeemer_chain == 1
             else "0x" + self.recipient().hex(),
         }
 
+    def format_to_contract(self):
+        """Same layout as ITokenBridge.parseTransferWithPayload"""
+        if self.payload_type != self.TransferWithPayload:
+            raise ValueError("not token bridge transfer with payload VAA")
+        return AbiTuple(
+            (
+                self.payload_type,
+                self.amount,
+                HexString(self.token_address),
+                self.token_chain,
+                HexString(self.redeemer),
+                self.redeemer_chain,
+                HexString(self.from_emitter),
+                HexString(self.transfer_payload),
+            ),
+            (
+                "payloadID",
+                "amount",
+                "tokenAddress",
+                "tokenChain",
+                "to",
+                "toChain",
+                "fromAddress",
+                "payload",
+            ),
+        )
+
     @classmethod
-    def parse(cls, payload: Union[bytes, str]):
-        if isinstance(payload, str):
-            payload = bytes.fromhex(payload.replace("0x", ""))
+    def parse(cls, payload: Union[bytes, memoryview, str]):
+        payload = to_memoryview(payload)
 
-        payload_type = payload[0]
-        if payload_type not in (cls.Transfer, cls.TransferWithPayload):
+        if payload[0] not in (cls.Transfer, cls.TransferWithPayload):
             raise ValueError("not token bridge transfer VAA")
 
-        amount_bytes = payload[1:33]
-        amount = int.from_bytes(amount_bytes, byteorder="big")
-
-        token_address = payload[33:65]
-
-        token_chain_bytes = payload[65:67]
-        token_chain = int.from_bytes(token_chain_bytes, byteorder="big")
-
-        redeemer = payload[67:99]
-
-        redeemer_chain_bytes = payload[99:101]
-        redeemer_chain = int.from_bytes(redeemer_chain_bytes, byteorder="big")
-
-        if payload_type == cls.Transfer:
-            fee_bytes = payload[101:133]
-            fee = int.from_bytes(fee_bytes, byteorder="big")
-        else:
-            fee = None
-
-        if payload_type == cls.TransferWithPayload:
-            from_emitter = payload[101:133]
-        else:
-            from_emitter = None
-
-        transfer_payload = payload[133:]
-
-        return ParsedTransfer(
-            payload_type,
-            amount,
-            token_address,
-            token_chain,
-            redeemer,
-            redeemer_chain,
-            fee,
-            from_emitter,
-            transfer_payload,
-        )
+        return ParsedTransfer(payload)
 
     def recipient(self):
         recipient = self.parsed_transfer_payload.so_data.recipient()
@@ -540,11 +744,30 @@ class ParsedTransferPayload:
     # 8. sendingAssetId(SwapData) INTER_DELIMITER
     # 9. receivingAssetId(SwapData) INTER_DELIMITER
     # 10. callData(SwapData)
-    def __init__(self, dst_max_gas_price, dst_max_gas, so_data, swap_data_list):
+    __slots__ = (
+        "dst_max_gas_price",
+        "dst_max_gas",
+        "so_data",
+        "_payload",
+        "_swap_index",
+        "_swap_data_list",
+    )
+
+    def __init__(self, dst_max_gas_price, dst_max_gas, so_data, payload, swap_index):
         self.dst_max_gas_price = dst_max_gas_price
         self.dst_max_gas = dst_max_gas
         self.so_data = so_data
-        self.swap_data_list = swap_data_list
+        self._payload = payload
+        self._swap_index = swap_index
+        self._swap_data_list = None
+
+    @property
+    def swap_data_list(self):
+        if self._swap_data_list is None:
+            self._swap_data_list = self.parse_swap_data_list(
+                self._payload, self._swap_index
+            )
+        return self._swap_data_list
 
     def __str__(self):
         return json.dumps(self.format_json(), indent=2)
@@ -559,24 +782,35 @@ class ParsedTransferPayload:
             ],
         }
 
+    def format_to_contract(self):
+        """Same layout as WormholeFacet.decodeWormholePayload"""
+        return AbiTuple(
+            (
+                self.dst_max_gas_price,
+                self.dst_max_gas,
+                self.so_data.format_to_contract(),
+                [swap_data.format_to_contract() for swap_data in self.swap_data_list],
+            ),
+            ("dstMaxGasPrice", "dstMaxGas", "soData", "swapDataDst"),
+        )
+
     @classmethod
-    def parse(cls, payload: Union[bytes, str]):
-        if isinstance(payload, str):
-            payload = bytes.fromhex(payload.replace("0x", ""))
+    def parse(cls, payload: Union[bytes, memoryview, str]):
+        payload = to_memoryview(payload)
 
         data_len = len(payload)
         assert data_len > 0, "empty payload"
 
         index = 0
 
-        next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+        next_len = payload[index]
         index = index + 1
         dst_max_gas_price = omniswap_serde.deserialize_u256_with_hex_str(
             payload[index: index + next_len]
         )
         index = index + next_len
 
-        next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+        next_len = payload[index]
         index = index + 1
         dst_max_gas = omniswap_serde.deserialize_u256_with_hex_str(
             payload[index: index + next_len]
@@ -584,50 +818,58 @@ class ParsedTransferPayload:
         index = index + next_len
 
         # SoData
-        next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+        next_len = payload[index]
         index = index + 1
-        so_transaction_id = payload[index: index + next_len]
+        so_transaction_id = bytes(payload[index: index + next_len])
         index = index + next_len
 
-        next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+        next_len = payload[index]
         index = index + 1
-        so_receiver = payload[index: index + next_len]
+        so_receiver = bytes(payload[index: index + next_len])
         index = index + next_len
 
-        next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+        next_len = payload[index]
         index = index + 1
-        so_receiving_asset_id = payload[index: index + next_len]
+        so_receiving_asset_id = bytes(payload[index: index + next_len])
         index = index + next_len
 
         so_data = SoData.padding(so_transaction_id, so_receiver, so_receiving_asset_id)
 
         # Skip len
         if index < data_len:
-            next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+            next_len = payload[index]
             index = index + 1
             index = index + next_len
 
+        return ParsedTransferPayload(
+            dst_max_gas_price, dst_max_gas, so_data, payload, index
+        )
+
+    @classmethod
+    def parse_swap_data_list(cls, payload: memoryview, index: int):
+        data_len = len(payload)
+
         # SwapData
         swap_data_list = []
         while index < data_len:
-            next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+            next_len = payload[index]
             index = index + 1
-            swap_call_to = payload[index: index + next_len]
+            swap_call_to = bytes(payload[index: index + next_len])
             index = index + next_len
 
-            next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+            next_len = payload[index]
             index = index + 1
-            swap_sending_asset_id = payload[index: index + next_len]
+            swap_sending_asset_id = bytes(payload[index: index + next_len])
             index = index + next_len
 
-            next_len = omniswap_serde.deserialize_u8(payload[index: index + 1])
+            next_len = payload[index]
             index = index + 1
-            swap_receiving_asset_id = payload[index: index + next_len]
+            swap_receiving_asset_id = bytes(payload[index: index + next_len])
             index = index + next_len
 
             next_len = omniswap_serde.deserialize_u16(payload[index: index + 2])
             index = index + 2
-            swap_call_data = payload[index: index + next_len]
+            swap_call_data = bytes(payload[index: index + next_len])
             index = index + next_len
 
             swap_data_list.append(
@@ -639,16 +881,156 @@ class ParsedTransferPayload:
                 )
             )
 
-        return ParsedTransferPayload(
-            dst_max_gas_price, dst_max_gas, so_data, swap_data_list
-        )
+        return swap_data_list
 
 
 def parseTransferWithPayloadVaa(vaa: Union[bytes, str]):
     parsed_vaa = ParsedVaa.parse(vaa)
-    parsed_transfer = ParsedTransfer.parse(parsed_vaa.payload)
-    parsed_transfer_payload = ParsedTransferPayload.parse(
-        parsed_transfer.transfer_payload
+    parsed_transfer = ParsedTransfer.parse(parsed_vaa.payload_view)
+
+    return parsed_vaa, parsed_transfer, parsed_transfer.parsed_transfer_payload
+
+
+@functools.lru_cache()
+def vaa_header_dtype():
+    """Fixed offset header fields of a token bridge transfer vaa, see `parse_many`
+
+    numpy is only needed by the batch decoder, it is imported on first use
+    so the single vaa decoder works without it.
+    """
+    import numpy as np
+
+    return np.dtype(
+        [
+            ("valid", "?"),
+            ("offset", "i8"),
+            ("length", "i8"),
+            ("timestamp", "u4"),
+            ("nonce", "u4"),
+            ("emitter_chain", "u2"),
+            ("emitter_address", "u1", (32,)),
+            ("sequence", "u8"),
+            ("payload_type", "u1"),
+            # Full u256, a python int
+            ("amount", "O"),
+            ("token_chain", "u2"),
+            ("redeemer", "u1", (32,)),
+            ("redeemer_chain", "u2"),
+        ]
+    )
+
+
+# Longest header: 255 signatures, body header and transfer header
+_MAX_HEADER_LEN = ParsedVaa.SIG_START + ParsedVaa.SIG_LENGTH * 255 + 51 + 133
+
+
+def _gather(buffer, offsets, length: int, dtype: str):
+    """Read a big endian field at every offset"""
+    import numpy as np
+
+    index = offsets[:, None] + np.arange(length)
+    data = np.ascontiguousarray(buffer[index])
+    if dtype is None:
+        return data
+    return data.view(dtype).ravel()
+
+
+class ParsedVaaBatch:
+    """Columnar view over many signed vaa
+
+    `header` is a `vaa_header_dtype()` array, one row per vaa, so filters are array
+    masks. Variable length payloads stay in `buffer` and are only decoded by
+    `parse(i)`.
+    """
+
+    __slots__ = ("buffer", "header")
+
+    def __init__(self, buffer: bytes, header):
+        self.buffer = buffer
+        self.header = header
+
+    def __len__(self):
+        return len(self.header)
+
+    def vaa(self, i: int) -> memoryview:
+        row = self.header[i]
+        return memoryview(self.buffer)[row["offset"]: row["offset"] + row["length"]]
+
+    def parse(self, i: int):
+        return parseTransferWithPayloadVaa(self.vaa(i))
+
+    def mask(self, redeemer_chain: int = None, redeemer: Union[bytes, str] = None):
+        """Valid transfers matching the redeemer chain and address
+
+        :param redeemer_chain: wormhole chain id
+        :param redeemer: address, left padded to 32 bytes like the vaa
+        """
+        import numpy as np
+
+        result = self.header["valid"].copy()
+        if redeemer_chain is not None:
+            result &= self.header["redeemer_chain"] == redeemer_chain
+        if redeemer is not None:
+            if isinstance(redeemer, str):
+                redeemer = bytes.fromhex(redeemer.replace("0x", ""))
+            redeemer = np.frombuffer(redeemer.rjust(32, b"\x00"), dtype="u1")
+            result &= (self.header["redeemer"] == redeemer).all(axis=1)
+        return result
+
+
+def parse_many(vaas: List[Union[bytes, str]]) -> ParsedVaaBatch:
+    """Read the fixed offset header fields of many vaa in one pass
+
+    The vaa are concatenated into one buffer and every field is gathered for
+    all of them at once. Amounts are u256, so they are kept as python ints
+    equal to `ParsedTransfer.amount`. Rows that are not token bridge
+    transfers are marked `valid = False`.
+    """
+    import numpy as np
+
+    vaas = [bytes.fromhex(v.replace("0x", "")) if isinstance(v, str) else bytes(v) for v in vaas]
+    lengths = np.fromiter((len(v) for v in vaas), dtype="i8", count=len(vaas))
+    offsets = np.zeros(len(vaas), dtype="i8")
+    np.cumsum(lengths[:-1], out=offsets[1:])
+
+    # Padding keeps gathers of truncated vaa inside the buffer
+    buffer = b"".join(vaas)
+    data = np.frombuffer(buffer + bytes(_MAX_HEADER_LEN), dtype="u1")
+
+    header = np.zeros(len(vaas), dtype=vaa_header_dtype())
+    header["offset"] = offsets
+    header["length"] = lengths
+    if len(vaas) == 0:
+        return ParsedVaaBatch(buffer, header)
+
+    body = offsets + ParsedVaa.SIG_START + ParsedVaa.SIG_LENGTH * data[offsets + 5].astype("i8")
+    payload = body + 51
+    header["timestamp"] = _gather(data, body, 4, ">u4")
+    header["nonce"] = _gather(data, body + 4, 4, ">u4")
+    header["emitter_chain"] = _gather(data, body + 8, 2, ">u2")
+    header["emitter_address"] = _gather(data, body + 10, 32, None)
+    header["sequence"] = _gather(data, body + 42, 8, ">u8")
+    header["payload_type"] = data[payload]
+    header["amount"] = [int.from_bytes(v.tobytes(), "big") for v in _gather(data, payload + 1, 32, None)]
+    header["token_chain"] = _gather(data, payload + 65, 2, ">u2")
+    header["redeemer"] = _gather(data, payload + 67, 32, None)
+    header["redeemer_chain"] = _gather(data, payload + 99, 2, ">u2")
+    header["valid"] = (
+        (payload + 133 <= offsets + lengths)
+        & np.isin(header["payload_type"], (ParsedTransfer.Transfer, ParsedTransfer.TransferWithPayload))
     )
+    return ParsedVaaBatch(buffer, header)
+
+
+def parse_vaa_to_wormhole_payload(vaa: Union[bytes, str]):
+    """Offline equivalent of `scripts.serde.parse_vaa_to_wormhole_payload`
 
-    return parsed_vaa, parsed_transfer, parsed_transfer_payload
+    Decodes the signed vaa locally instead of calling IWormhole.parseVM,
+    ITokenBridge.parseTransferWithPayload and WormholeFacet.decodeWormholePayload,
+    and returns the results in the same layout as those contract calls.
+    """
+    parsed_vaa, parsed_transfer, parsed_transfer_payload = parseTransferWithPayloadVaa(vaa)
+    vaa_data = parsed_vaa.format_to_contract()
+    transfer_data = parsed_transfer.format_to_contract()
+    wormhole_data = parsed_transfer_payload.format_to_contract()
+    return vaa_data, transfer_data, wormhole_data
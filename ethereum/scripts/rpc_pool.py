@@ -0,0 +1,244 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import brownie
+import requests
+from brownie import config, network
+
+from scripts.relayer.scheduler import PollTimer
+
+logger = logging.getLogger()
+
+
+class RpcEndpoint:
+    """One rpc url with rolling latency, error rate and a circuit breaker
+
+    After `failure_threshold` consecutive failures the circuit opens and the
+    endpoint is skipped for `open_time` seconds, doubled on every trip up to
+    `max_open_time`. Once it expires the next probe decides whether to close
+    it again.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            window: int = 20,
+            failure_threshold: int = 3,
+            open_time: float = 30,
+            max_open_time: float = 10 * 60,
+    ):
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.block_number: Optional[int] = None
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self._latency = deque(maxlen=window)
+        self._errors = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+
+    def record(self, latency: float, ok: bool, block_number: int = None):
+        with self._lock:
+            self._latency.append(latency)
+            self._errors.append(0 if ok else 1)
+            if ok:
+                self.failures = 0
+                self.trips = 0
+                self.open_until = 0
+                if block_number is not None:
+                    self.block_number = block_number
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.time() + min(self.open_time * 2 ** self.trips, self.max_open_time)
+                self.trips += 1
+                self.failures = 0
+
+    def available(self) -> bool:
+        return time.time() >= self.open_until
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latency) == 0:
+                return None
+            latency = sorted(self._latency)
+        return latency[int(0.95 * (len(latency) - 1))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if len(self._errors) == 0:
+                return 0
+            return sum(self._errors) / len(self._errors)
+
+    def score(self, timeout: float) -> float:
+        """Lower is better, errors count as timeouts. Unknown endpoints rank last"""
+        p95 = self.p95()
+        if p95 is None:
+            return timeout
+        error_rate = self.error_rate()
+        return p95 * (1 - error_rate) + timeout * error_rate
+
+    def probe(self, timeout: float):
+        start = time.time()
+        try:
+            response = self.session.post(
+                self.url,
+                json={"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []},
+                timeout=timeout,
+            )
+            block_number = int(response.json()["result"], 16)
+        except Exception:
+            self.record(time.time() - start, False)
+            return
+        self.record(time.time() - start, True, block_number)
+
+
+class RpcPool:
+    """Rpc endpoints of one network for the global brownie web3
+
+    A background thread probes every endpoint each `probe_interval` seconds.
+    `ensure` keeps the current connection while its endpoint is healthy,
+    and reconnects to the fastest healthy endpoint when it failed, lags
+    more than `max_lag` blocks or is several times slower than the best.
+    """
+
+    def __init__(
+            self,
+            net: str,
+            urls: List[str],
+            probe_interval: float = 30,
+            timeout: float = 5,
+            max_lag: int = 20,
+            switch_ratio: float = 3,
+    ):
+        self.net = net
+        self.endpoints = [RpcEndpoint(url) for url in urls]
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.switch_ratio = switch_ratio
+        self.probe_interval = probe_interval
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self.endpoints), 1), thread_name_prefix=f"rpc_probe_{net}"
+        )
+        self._lock = threading.Lock()
+        if len(self.endpoints) > 1:
+            threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def _probe_loop(self):
+        timer = PollTimer(self.probe_interval)
+        while True:
+            timer.wait()
+            try:
+                self.probe()
+            except RuntimeError:
+                # Executor shut down at interpreter exit
+                return
+
+    def probe(self):
+        list(self._executor.map(lambda e: e.probe(self.timeout), self.endpoints))
+
+    def head(self) -> int:
+        blocks = [e.block_number for e in self.endpoints if e.available() and e.block_number is not None]
+        return max(blocks, default=0)
+
+    def healthy(self, endpoint: RpcEndpoint) -> bool:
+        if not endpoint.available():
+            return False
+        if endpoint.block_number is not None and self.head() - endpoint.block_number > self.max_lag:
+            return False
+        return True
+
+    def ranked(self) -> List[RpcEndpoint]:
+        """Healthy endpoints fastest first, then the rest as a last resort"""
+        return sorted(
+            self.endpoints,
+            key=lambda e: (not self.healthy(e), e.score(self.timeout)),
+        )
+
+    def current(self) -> Optional[RpcEndpoint]:
+        uri = getattr(brownie.web3.provider, "endpoint_uri", None)
+        for e in self.endpoints:
+            if e.url == uri:
+                return e
+        return None
+
+    def _check(self, endpoint: Optional[RpcEndpoint]) -> bool:
+        start = time.time()
+        try:
+            block_number = brownie.web3.eth.get_block_number()
+        except Exception:
+            if endpoint is not None:
+                endpoint.record(time.time() - start, False)
+            return False
+        if endpoint is not None:
+            endpoint.record(time.time() - start, True, block_number)
+        return True
+
+    def _should_switch(self, current: RpcEndpoint) -> bool:
+        if not self.healthy(current):
+            return True
+        best = self.ranked()[0]
+        if best is current or best.p95() is None or current.p95() is None:
+            return False
+        return current.score(self.timeout) > self.switch_ratio * best.score(self.timeout) + 0.1
+
+    def ensure(self):
+        """Make sure brownie web3 is connected to a healthy endpoint, block until it is"""
+        with self._lock:
+            current = self.current()
+            if self._check(current):
+                if current is None or not self._should_switch(current):
+                    return
+            if len(self.endpoints) == 0:
+                return
+            backoff = 1
+            while True:
+                for endpoint in self.ranked():
+                    try:
+                        brownie.web3.disconnect()
+                    except Exception:
+                        pass
+                    logger.info(f"Connect {self.net} rpc: {endpoint.url}")
+                    brownie.web3.connect(endpoint.url, timeout=self.timeout * 6)
+                    if self._check(endpoint):
+                        return
+                logger.warning(f"No healthy rpc for {self.net}, retry after {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def report_failure(self):
+        """Count a failed call on the current endpoint, e.g. from a relayer"""
+        current = self.current()
+        if current is not None:
+            current.record(self.timeout, False)
+
+    def health(self) -> List[dict]:
+        return [
+            {
+                "url": e.url,
+                "p95": e.p95(),
+                "error_rate": e.error_rate(),
+                "block_number": e.block_number,
+                "available": e.available(),
+            }
+            for e in self.ranked()
+        ]
+
+
+@functools.lru_cache()
+def get_rpc_pool(net: str) -> RpcPool:
+    return RpcPool(net, list(config["networks"][net].get("endpoints", [])))
+
+
+def ensure_rpc(net: str = None):
+    if net is None:
+        net = network.show_active()
+    get_rpc_pool(net).ensure()
@@ -1,7 +1,9 @@
-import functools
 from pathlib import Path
 
-from brownie import Contract, network, config, project
+from brownie import network, config, project
+
+from scripts.contract_registry import get_contract
+from scripts.relayer import wormhole_serder
 
 omniswap_ethereum_path = Path(__file__).parent.parent
 omniswap_ethereum_project = project.load(
@@ -9,21 +11,19 @@ omniswap_ethereum_project = project.load(
 )
 
 
-@functools.lru_cache()
 def get_serde_facet():
     contract_name = "SerdeFacet"
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][network.show_active()]["SoDiamond"],
         omniswap_ethereum_project[contract_name].abi,
     )
 
 
-@functools.lru_cache()
 def get_wormhole_facet():
     contract_name = "WormholeFacet"
     net = network.show_active()
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["SoDiamond"],
         omniswap_ethereum_project[contract_name].abi,
@@ -33,51 +33,47 @@ def get_wormhole_facet():
 def get_cctp_facet():
     contract_name = "CCTPFacet"
     net = network.show_active()
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["SoDiamond"],
         omniswap_ethereum_project[contract_name].abi,
     )
 
 
-@functools.lru_cache()
 def get_stargate_facet():
     contract_name = "StargateFacet"
     net = network.show_active()
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["SoDiamond"],
         omniswap_ethereum_project[contract_name].abi,
     )
 
 
-@functools.lru_cache()
 def get_stargate_helper_facet():
     contract_name = "StargateHelper"
     net = network.show_active()
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["StargateHelper"],
         omniswap_ethereum_project[contract_name].abi,
     )
 
 
-@functools.lru_cache()
 def get_token_bridge():
     contract_name = "TokenBridge"
     net = network.show_active()
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["wormhole"]["token_bridge"],
         omniswap_ethereum_project.interface.IWormholeBridge.abi,
     )
 
 
-@functools.lru_cache()
 def get_wormhole():
     net = network.show_active()
     contract_name = "Wormhole"
-    return Contract.from_abi(
+    return get_contract(
         contract_name,
         config["networks"][net]["wormhole"]["wormhole"],
         omniswap_ethereum_project.interface.IWormhole.abi,
@@ -183,7 +179,16 @@ def parse_wormhole_payload(transfer_payload: str):
     return get_wormhole_facet().decodeWormholePayload(transfer_payload)
 
 
-def parse_vaa_to_wormhole_payload(vaa: str):
+def parse_vaa_to_wormhole_payload(vaa: str, offline: bool = False):
+    """
+    Decode vaa, transfer and wormhole payload
+    :param vaa:
+    :param offline: decode locally with scripts.relayer.wormhole_serder
+        instead of three eth_call, the result layout is the same
+    :return: (vaa_data, transfer_data, wormhole_data)
+    """
+    if offline:
+        return wormhole_serder.parse_vaa_to_wormhole_payload(vaa)
     vaa_data = parse_vaa(vaa)
     transfer_data = parse_transfer_with_payload(vaa_data[-4])
     wormhole_data = parse_wormhole_payload(transfer_data[-1])
@@ -0,0 +1,166 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from brownie import ERC20, interface
+
+from scripts.contract_registry import get_contract
+from scripts.helpful_scripts import get_stargate_router, zero_address
+from scripts.multicall import multicall
+
+
+def get_stargate_factory():
+    """Factory of the Stargate router on the active network, None when not deployed"""
+    stargate_router_address = get_stargate_router()
+    if stargate_router_address == "":
+        return None
+    stargate_router = get_contract(
+        "IStargate", stargate_router_address, interface.IStargate.abi
+    )
+    return get_contract(
+        "IStargateFactory", stargate_router.factory(), interface.IStargateFactory.abi
+    )
+
+
+def _get_pool(pool_address: str):
+    return get_contract("IStargatePool", pool_address, interface.IStargatePool.abi)
+
+
+def crawl_pools(factory, known_pools: List[dict] = None) -> Tuple[List[dict], Set[int]]:
+    """Pools of a Stargate factory with three Multicall3 rounds
+
+    allPools, then poolId and token of every pool, then symbol and decimals
+    of the tokens not in `known_pools`. The ChainPath of a known pool is
+    kept.
+
+    :return: (pool infos in factory order, ids of the new, changed and removed pools)
+    """
+    known = {int(v["PoolId"]): v for v in known_pools or []}
+    pools_length = factory.allPoolsLength()
+    pool_addresses = [
+        address
+        for ok, address in multicall([(factory.allPools, (i,)) for i in range(pools_length)])
+        if ok and address != zero_address()
+    ]
+    pools = [_get_pool(address) for address in pool_addresses]
+    outputs = multicall([call for pool in pools for call in ((pool.poolId, ()), (pool.token, ()))])
+
+    found = []
+    for i in range(len(pools)):
+        (id_ok, pool_id), (token_ok, token_address) = outputs[2 * i], outputs[2 * i + 1]
+        if not id_ok or not token_ok:
+            raise ValueError(f"Read stargate pool {pool_addresses[i]} fail")
+        found.append((int(pool_id), str(token_address)))
+
+    fresh = [
+        token_address
+        for pool_id, token_address in found
+        if pool_id not in known or known[pool_id]["TokenAddress"] != token_address
+    ]
+    tokens = {address: get_contract("ERC20", address, ERC20.abi) for address in dict.fromkeys(fresh)}
+    metadata = multicall(
+        [call for token in tokens.values() for call in ((token.symbol, ()), (token.decimals, ()))]
+    )
+    token_infos = {}
+    for i, address in enumerate(tokens):
+        (symbol_ok, symbol), (decimals_ok, decimals) = metadata[2 * i], metadata[2 * i + 1]
+        if not symbol_ok or not decimals_ok:
+            raise ValueError(f"Read token {address} fail")
+        token_infos[address] = (symbol, decimals)
+
+    pool_info = []
+    changed = set(known) - {pool_id for pool_id, _ in found}
+    for pool_id, token_address in found:
+        if token_address in token_infos:
+            changed.add(pool_id)
+            symbol, decimals = token_infos[token_address]
+            info = {
+                "TokenAddress": token_address,
+                "TokenName": symbol,
+                "Decimal": decimals,
+                "PoolId": pool_id,
+            }
+            if pool_id in known and "ChainPath" in known[pool_id]:
+                info["ChainPath"] = known[pool_id]["ChainPath"]
+            pool_info.append(info)
+        else:
+            pool_info.append(known[pool_id])
+    return pool_info, changed
+
+
+def crawl_chain_paths(
+        factory,
+        src_pools: List[dict],
+        dst_chains: Dict[int, List[dict]],
+        src_changed: Optional[Set[int]] = None,
+        dst_changed: Optional[Dict[int, Set[int]]] = None,
+) -> List[dict]:
+    """ChainPath of `src_pools` to the pools of every other chain, in one pass
+
+    `dst_chains` maps a stargate chain id to its pools. All getPool and
+    getChainPath reads go through Multicall3 aggregates. With
+    `src_changed` / `dst_changed` given, only the (src pool, dst pool)
+    pairs touching a changed pool are read, other paths are kept.
+
+    :return: copies of `src_pools` with ChainPath updated
+    """
+
+    def selected(src_pool_id, dst_chain_id, dst_pool_id):
+        if src_changed is None and dst_changed is None:
+            return True
+        return (src_changed is not None and src_pool_id in src_changed) or \
+            (dst_changed is not None and dst_pool_id in dst_changed.get(dst_chain_id, ()))
+
+    src_pools = [dict(v) for v in src_pools]
+    pairs = {
+        int(src["PoolId"]): [
+            (int(chain_id), int(dst["PoolId"]))
+            for chain_id, dst_pools in dst_chains.items()
+            for dst in dst_pools
+            if selected(int(src["PoolId"]), int(chain_id), int(dst["PoolId"]))
+        ]
+        for src in src_pools
+    }
+    pairs = {k: v for k, v in pairs.items() if v}
+
+    pool_ids = list(pairs)
+    addresses = multicall([(factory.getPool, (pool_id,)) for pool_id in pool_ids])
+    calls = []
+    keys = []
+    for pool_id, (ok, address) in zip(pool_ids, addresses):
+        if not ok or address == zero_address():
+            continue
+        pool = _get_pool(address)
+        for pair in pairs[pool_id]:
+            calls.append((pool.getChainPath, pair))
+            keys.append((pool_id, pair))
+    ready = {key for key, (ok, result) in zip(keys, multicall(calls)) if ok and result[0]}
+
+    dst_pool_ids = {
+        int(chain_id): {int(dst["PoolId"]) for dst in dst_pools}
+        for chain_id, dst_pools in dst_chains.items()
+    }
+    for src in src_pools:
+        src_pool_id = int(src["PoolId"])
+        checked = {(src_pool_id, pair) for pair in pairs.get(src_pool_id, [])}
+        # Paths to removed pools are dropped
+        paths = [
+            tuple(v) for v in src.get("ChainPath", [])
+            if (src_pool_id, tuple(v)) not in checked
+            and (v[0] not in dst_pool_ids or v[1] in dst_pool_ids[v[0]])
+        ]
+        paths.extend(
+            pair for pair in pairs.get(src_pool_id, [])
+            if (src_pool_id, pair) in ready and pair not in paths
+        )
+        src["ChainPath"] = sorted(paths)
+    return src_pools
+
+
+def stargate_chains(omni_swap_infos: dict, nets: Iterable[str]) -> Dict[str, int]:
+    """net -> stargate chain id of the nets with Stargate pools"""
+    return {
+        net: omni_swap_infos[net]["StargateChainId"]
+        for net in nets
+        if net in omni_swap_infos
+        and "aptos" not in net
+        and omni_swap_infos[net].get("StargateChainId", None) is not None
+    }
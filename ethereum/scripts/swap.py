@@ -6,6 +6,7 @@ from random import choice
 from brownie import Contract, web3, network
 from brownie.network import priority_fee, max_fee, gas_price
 from brownie.project.main import Project
+from scripts.contract_registry import get_contract as get_cached_contract, get_contract_registry
 from scripts.helpful_scripts import (
     get_account,
     get_corebridge_core_chain_id,
@@ -299,17 +300,21 @@ class SoData(View):
             SoData: SoData class
         """
         transactionId = cls.generate_random_bytes32()
+        src_info = src_session.put_tasks_async(
+            [(get_chain_id, ()), (get_token_address, (sendingTokenName,))]
+        )
+        dst_info = dst_session.put_tasks_async(
+            [(get_chain_id, ()), (get_token_address, (receiveTokenName,))]
+        )
+        sourceChainId, sendingAssetId = src_info.result()
+        destinationChainId, receivingAssetId = dst_info.result()
         return SoData(
             transactionId=transactionId,
             receiver=receiver,
-            sourceChainId=src_session.put_task(func=get_chain_id),
-            sendingAssetId=src_session.put_task(
-                func=get_token_address, args=(sendingTokenName,)
-            ),
-            destinationChainId=dst_session.put_task(func=get_chain_id),
-            receivingAssetId=dst_session.put_task(
-                func=get_token_address, args=(receiveTokenName,)
-            ),
+            sourceChainId=sourceChainId,
+            sendingAssetId=sendingAssetId,
+            destinationChainId=destinationChainId,
+            receivingAssetId=receivingAssetId,
             amount=amount,
         )
 
@@ -375,27 +380,38 @@ class StargateData(View):
         Returns:
             StargateData: StargateData class
         """
+        src_info = src_session.put_tasks_async(
+            [
+                (get_stargate_pool_id, (srcStargateToken,)),
+                (get_token_decimal, (srcStargateToken,)),
+            ]
+        )
+        dst_info = dst_session.put_tasks_async(
+            [
+                (get_stargate_chain_id, ()),
+                (get_stargate_pool_id, (dstStargateToken,)),
+                (get_contract_address, ("SoDiamond",), True),
+                (get_token_decimal, (dstStargateToken,)),
+            ]
+        )
+        srcStargatePoolId, srcStargateTokenDecimal = src_info.result()
+        (
+            dstStargateChainId,
+            dstStargatePoolId,
+            dstSoDiamond,
+            dstStargateTokenDecimal,
+        ) = dst_info.result()
         return StargateData(
-            srcStargatePoolId=src_session.put_task(
-                func=get_stargate_pool_id, args=(srcStargateToken,)
-            ),
-            dstStargateChainId=dst_session.put_task(func=get_stargate_chain_id),
-            dstStargatePoolId=dst_session.put_task(
-                func=get_stargate_pool_id, args=(dstStargateToken,)
-            ),
+            srcStargatePoolId=srcStargatePoolId,
+            dstStargateChainId=dstStargateChainId,
+            dstStargatePoolId=dstStargatePoolId,
             minAmount=0,
             dstGasForSgReceive=dstGasForSgReceive,
-            dstSoDiamond=dst_session.put_task(
-                get_contract_address, args=("SoDiamond",), with_project=True
-            ),
+            dstSoDiamond=dstSoDiamond,
             srcStargateToken=srcStargateToken,
-            srcStargateTokenDecimal=src_session.put_task(
-                func=get_token_decimal, args=(srcStargateToken,)
-            ),
+            srcStargateTokenDecimal=srcStargateTokenDecimal,
             dstStargateToken=dstStargateToken,
-            dstStargateTokenDecimal=dst_session.put_task(
-                func=get_token_decimal, args=(dstStargateToken,)
-            ),
+            dstStargateTokenDecimal=dstStargateTokenDecimal,
         )
 
     @staticmethod
@@ -481,6 +497,19 @@ class SwapFunc:
     exactInput = "exactInput"
 
 
+def get_swap_router_info(swapType: str):
+    """Swap config of `swapType` on the active network, cached by the contract registry"""
+
+    def find():
+        swap_info = None
+        for v in get_swap_info():
+            if swapType in v:
+                swap_info = v[swapType]
+        return swap_info
+
+    return get_contract_registry().cached(("swap_info", swapType), find)
+
+
 class SwapData(View):
     """Constructing data for calling UniswapLike"""
 
@@ -731,19 +760,16 @@ class SwapData(View):
             amountOut: final output amount
         """
         account = get_account()
-        swap_info = None
-        for v in get_swap_info():
-            if swapType in v:
-                swap_info = v[swapType]
+        swap_info = get_swap_router_info(swapType)
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountOut = swap_contract.quoteExactInput.call(
                 cls.encode_path_for_uniswap_v3(swapPath), amountIn, {"from": account}
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountOuts = swap_contract.getAmountsOut(
@@ -775,12 +801,9 @@ class SwapData(View):
             amountIn: input amount
         """
         account = get_account()
-        swap_info = None
-        for v in get_swap_info():
-            if swapType in v:
-                swap_info = v[swapType]
+        swap_info = get_swap_router_info(swapType)
         if swapType == "ISwapRouter":
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 "IQuoter", swap_info["quoter"], getattr(p.interface, "IQuoter").abi
             )
             amountIn = swap_contract.quoteExactOutput.call(
@@ -789,7 +812,7 @@ class SwapData(View):
                 {"from": account},
             )
         elif swapType.startswith("IUniswapV2"):
-            swap_contract = Contract.from_abi(
+            swap_contract = get_cached_contract(
                 swapType, swap_info["router"], getattr(p.interface, swapType).abi
             )
             amountIns = swap_contract.getAmountsIn(
@@ -847,6 +870,39 @@ def estimate_for_gas(
     )
 
 
+def estimate_src_final_amount(
+    amount: int, src_swap_data: SwapData, stargate_data, p: Project = None
+):
+    """Source swap then stargate, run in the source session as one task"""
+    if src_swap_data is not None:
+        amount = SwapData.estimate_out(
+            amount, src_swap_data.swapType, src_swap_data.swapPath, p=p
+        )
+    return StargateData.estimate_stargate_final_amount(stargate_data, amount, p=p)
+
+
+def estimate_dst_final_amount(amount: int, dst_swap_data: SwapData, p: Project = None):
+    """So fee then destination swap, run in the destination session as one task"""
+    amount = amount - StargateData.estimate_so_fee(amount, p=p)
+    if dst_swap_data is not None:
+        amount = SwapData.estimate_out(
+            amount, dst_swap_data.swapType, dst_swap_data.swapPath, p=p
+        )
+    return amount
+
+
+def estimate_stargate_min_amount(
+    expect_min_amount: int, dst_swap_data: SwapData, p: Project = None
+):
+    amount = expect_min_amount
+    if dst_swap_data is not None:
+        # note revert!
+        amount = SwapData.estimate_in(
+            amount, dst_swap_data.swapType, dst_swap_data.swapPath, p=p
+        )
+    return StargateData.estimate_before_so_fee(amount, p=p)
+
+
 def estimate_final_token_amount(
     src_session,
     dst_session,
@@ -855,31 +911,20 @@ def estimate_final_token_amount(
     stargate_data,
     dst_swap_data: SwapData,
 ):
-    """Estimate source swap output"""
-    print("Estimate final token amount:")
-    if src_swap_data is not None:
-        amount = src_session.put_task(
-            SwapData.estimate_out,
-            args=(amount, src_swap_data.swapType, src_swap_data.swapPath),
-            with_project=True,
-        )
+    """Estimate source swap output
 
+    Each chain side is one round trip, the calls within a side depend on
+    each other and stay in its session.
+    """
+    print("Estimate final token amount:")
     amount = src_session.put_task(
-        StargateData.estimate_stargate_final_amount,
-        args=(stargate_data, amount),
+        estimate_src_final_amount,
+        args=(amount, src_swap_data, stargate_data),
         with_project=True,
     )
-    so_fee = dst_session.put_task(
-        StargateData.estimate_so_fee, args=(amount,), with_project=True
+    return dst_session.put_task(
+        estimate_dst_final_amount, args=(amount, dst_swap_data), with_project=True
     )
-    amount = amount - so_fee
-    if dst_swap_data is not None:
-        amount = dst_session.put_task(
-            SwapData.estimate_out,
-            args=(amount, dst_swap_data.swapType, dst_swap_data.swapPath),
-            with_project=True,
-        )
-    return amount
 
 
 def estimate_min_amount(
@@ -887,30 +932,12 @@ def estimate_min_amount(
 ):
     print(f"Estimate min amount: slippage {slippage * 100}%")
     expect_min_amount = int(final_amount * (1 - slippage))
-    if dst_swap_data is not None:
-        dst_swap_min_amount = expect_min_amount
-        stargate_min_amount = dst_session.put_task(
-            SwapData.estimate_in,
-            args=(
-                expect_min_amount,
-                dst_swap_data.swapType,
-                # note revert!
-                dst_swap_data.swapPath,
-            ),
-            with_project=True,
-        )
-        stargate_min_amount = dst_session.put_task(
-            StargateData.estimate_before_so_fee,
-            args=(stargate_min_amount,),
-            with_project=True,
-        )
-    else:
-        dst_swap_min_amount = None
-        stargate_min_amount = dst_session.put_task(
-            StargateData.estimate_before_so_fee,
-            args=(expect_min_amount,),
-            with_project=True,
-        )
+    dst_swap_min_amount = expect_min_amount if dst_swap_data is not None else None
+    stargate_min_amount = dst_session.put_task(
+        estimate_stargate_min_amount,
+        args=(expect_min_amount, dst_swap_data),
+        with_project=True,
+    )
     return dst_swap_min_amount, stargate_min_amount
 
 
@@ -931,12 +958,14 @@ def cross_swap_via_wormhole(
         f"{'-' * 100}\nSwap from: network {src_session.net}, token: {sourceTokenName}\n"
         f"{dst_session.net}, token: {destinationTokenName}"
     )
-    src_diamond_address = src_session.put_task(
+    src_diamond_address = src_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
-    dst_diamond_address = dst_session.put_task(
+    dst_diamond_address = dst_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
+    src_diamond_address = src_diamond_address.result()
+    dst_diamond_address = dst_diamond_address.result()
     print(
         f"Source diamond address: {src_diamond_address}. Destination diamond address: {dst_diamond_address}"
     )
@@ -951,17 +980,16 @@ def cross_swap_via_wormhole(
     print("SoData\n", so_data)
 
     if sourceSwapType is not None:
-        src_swap_data = src_session.put_task(
+        src_swap_data = src_session.put_task_async(
             SwapData.create,
             args=(sourceSwapType, sourceSwapFunc, inputAmount, sourceSwapPath),
             with_project=True,
         )
-        print("SourceSwapData:\n", src_swap_data)
     else:
         src_swap_data = None
 
     if destinationSwapType is not None:
-        dst_swap_data: SwapData = dst_session.put_task(
+        dst_swap_data = dst_session.put_task_async(
             SwapData.create,
             args=(
                 destinationSwapType,
@@ -972,7 +1000,13 @@ def cross_swap_via_wormhole(
             with_project=True,
         )
     else:
-        dst_swap_data: SwapData = None
+        dst_swap_data = None
+
+    if src_swap_data is not None:
+        src_swap_data = src_swap_data.result()
+        print("SourceSwapData:\n", src_swap_data)
+    if dst_swap_data is not None:
+        dst_swap_data: SwapData = dst_swap_data.result()
 
     dst_chainid = dst_session.put_task(get_dst_chainid, with_project=True)
 
@@ -995,13 +1029,7 @@ def cross_swap_via_wormhole(
     if sourceTokenName != "eth":
         src_session.put_task(
             token_approve,
-            args=(
-                sourceTokenName,
-                src_session.put_task(
-                    get_contract_address, args=("SoDiamond",), with_project=True
-                ),
-                inputAmount,
-            ),
+            args=(sourceTokenName, src_diamond_address, inputAmount),
             with_project=True,
         )
         input_eth_amount = 0
@@ -1030,12 +1058,14 @@ def cross_swap_via_corebridge(
         f"-> corebridge {sourceTokenName} -> {bridgeTokenName} to: network "
         f"{dst_session.net}, token: {destinationTokenName}"
     )
-    src_diamond_address = src_session.put_task(
+    src_diamond_address = src_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
-    dst_diamond_address = dst_session.put_task(
+    dst_diamond_address = dst_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
+    src_diamond_address = src_diamond_address.result()
+    dst_diamond_address = dst_diamond_address.result()
     print(
         f"Source diamond address: {src_diamond_address}. Destination diamond address: {dst_diamond_address}"
     )
@@ -1066,13 +1096,7 @@ def cross_swap_via_corebridge(
     if sourceTokenName != "eth":
         src_session.put_task(
             token_approve,
-            args=(
-                sourceTokenName,
-                src_session.put_task(
-                    get_contract_address, args=("SoDiamond",), with_project=True
-                ),
-                inputAmount,
-            ),
+            args=(sourceTokenName, src_diamond_address, inputAmount),
             with_project=True,
         )
         input_eth_amount = 0
@@ -1106,12 +1130,14 @@ def cross_swap_via_stargate(
         f"-> stragate {sourceStargateToken} -> {destinationStargateToken} to: network "
         f"{dst_session.net}, token: {destinationTokenName}"
     )
-    src_diamond_address = src_session.put_task(
+    src_diamond_address = src_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
-    dst_diamond_address = dst_session.put_task(
+    dst_diamond_address = dst_session.put_task_async(
         get_contract_address, args=("SoDiamond",), with_project=True
     )
+    src_diamond_address = src_diamond_address.result()
+    dst_diamond_address = dst_diamond_address.result()
     print(
         f"Source diamond address: {src_diamond_address}. Destination diamond address: {dst_diamond_address}"
     )
@@ -1126,17 +1152,16 @@ def cross_swap_via_stargate(
     print("SoData\n", so_data)
 
     if sourceSwapType is not None:
-        src_swap_data = src_session.put_task(
+        src_swap_data = src_session.put_task_async(
             SwapData.create,
             args=(sourceSwapType, sourceSwapFunc, inputAmount, sourceSwapPath),
             with_project=True,
         )
-        print("SourceSwapData:\n", src_swap_data)
     else:
         src_swap_data = None
 
     if destinationSwapType is not None:
-        dst_swap_data: SwapData = dst_session.put_task(
+        dst_swap_data = dst_session.put_task_async(
             SwapData.create,
             args=(
                 destinationSwapType,
@@ -1147,7 +1172,13 @@ def cross_swap_via_stargate(
             with_project=True,
         )
     else:
-        dst_swap_data: SwapData = None
+        dst_swap_data = None
+
+    if src_swap_data is not None:
+        src_swap_data = src_swap_data.result()
+        print("SourceSwapData:\n", src_swap_data)
+    if dst_swap_data is not None:
+        dst_swap_data: SwapData = dst_swap_data.result()
 
     dst_gas_for_sgReceive = dst_session.put_task(
         estimate_for_gas,
@@ -1195,13 +1226,7 @@ def cross_swap_via_stargate(
     if sourceTokenName != "eth":
         src_session.put_task(
             token_approve,
-            args=(
-                sourceTokenName,
-                src_session.put_task(
-                    get_contract_address, args=("SoDiamond",), with_project=True
-                ),
-                inputAmount,
-            ),
+            args=(sourceTokenName, src_diamond_address, inputAmount),
             with_project=True,
         )
         input_eth_amount = 0
@@ -0,0 +1,106 @@
+import functools
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from brownie import ERC20
+
+from scripts.contract_registry import get_contract
+from scripts.helpful_scripts import zero_address
+from scripts.multicall import multicall
+
+
+class TokenMetadataCache:
+    """Immutable token metadata keyed by (net, address), kept in a json file
+
+    ERC20 symbol and decimals, and the wormhole wrapped asset of a foreign
+    token, never change once set, so they are read from chain once with
+    Multicall3 and then served from `path`, shared by the export workers.
+    A zero wrapped asset is not kept, the token may be attested later.
+    Lookups read the active network, which must be `net`.
+    """
+
+    def __init__(self, path: str = "./cache/token_metadata.json"):
+        self.path = path
+        # "net:address" -> [symbol, decimals]
+        self.tokens: Dict[str, list] = {}
+        # "net:wormhole chain id:address" -> wrapped asset
+        self.wrapped: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        self.tokens.update(data.get("tokens", {}))
+        self.wrapped.update(data.get("wrapped", {}))
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            json.dump({"tokens": self.tokens, "wrapped": self.wrapped}, f, indent=4, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _update(self, tokens: dict = None, wrapped: dict = None):
+        with self._lock:
+            # Other workers may have saved meanwhile
+            self._load()
+            self.tokens.update(tokens or {})
+            self.wrapped.update(wrapped or {})
+            self._save()
+
+    def token_infos(self, net: str, addresses: Iterable[str]) -> Dict[str, Tuple[str, int]]:
+        """address -> (symbol, decimals), unknown tokens in one multicall"""
+        addresses = list(dict.fromkeys(addresses))
+        missing = [v for v in addresses if f"{net}:{v.lower()}" not in self.tokens]
+        if missing:
+            tokens = [get_contract("ERC20", v, ERC20.abi) for v in missing]
+            outputs = multicall(
+                [call for token in tokens for call in ((token.symbol, ()), (token.decimals, ()))]
+            )
+            fetched = {}
+            for i, address in enumerate(missing):
+                (symbol_ok, symbol), (decimals_ok, decimals) = outputs[2 * i], outputs[2 * i + 1]
+                if not symbol_ok or not decimals_ok:
+                    raise ValueError(f"Read token {address} on {net} fail")
+                fetched[f"{net}:{address.lower()}"] = [symbol, decimals]
+            self._update(tokens=fetched)
+        return {
+            v: tuple(self.tokens[f"{net}:{v.lower()}"])
+            for v in addresses
+        }
+
+    def wrapped_assets(
+            self,
+            net: str,
+            token_bridge,
+            assets: List[Tuple[int, str]],
+    ) -> Dict[Tuple[int, str], str]:
+        """(wormhole chain id, token) -> wrapped asset on `net`, unknown ones in one multicall"""
+        keys = {asset: f"{net}:{asset[0]}:{asset[1].lower()}" for asset in dict.fromkeys(assets)}
+        missing = [asset for asset, key in keys.items() if key not in self.wrapped]
+        result = {asset: self.wrapped[key] for asset, key in keys.items() if key in self.wrapped}
+        if missing:
+            outputs = multicall([(token_bridge.wrappedAsset, asset) for asset in missing])
+            fetched = {}
+            for asset, (ok, wrapped) in zip(missing, outputs):
+                if not ok:
+                    raise ValueError(f"Read wrapped asset {asset} on {net} fail")
+                result[asset] = wrapped
+                if wrapped != zero_address():
+                    fetched[keys[asset]] = wrapped
+            if fetched:
+                self._update(wrapped=fetched)
+        return result
+
+
+@functools.lru_cache()
+def get_token_metadata_cache() -> TokenMetadataCache:
+    return TokenMetadataCache()
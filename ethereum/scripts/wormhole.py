@@ -11,6 +11,7 @@ from scripts.helpful_scripts import (
     zero_address,
 )
 from scripts.swap import SoData
+from scripts.token_metadata import get_token_metadata_cache
 
 root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
@@ -175,17 +176,25 @@ def get_all_warpped_token():
     current_net = network.show_active()
 
     src_wormhole_chain_id = get_wormhole_chainid()
+    nets = [net for net in support_networks if net != current_net]
+    assets = []
+    for net in nets:
+        wormhole_chain_id = config["networks"][net]["wormhole"]["chainid"]
+        for address in [get_weth_address(net), get_usdc_address(net), get_usdt_address(net)]:
+            if address is not None:
+                assets.append((wormhole_chain_id, address))
+    # All wrappedAsset reads in one multicall, known ones from the cache
+    wrapped = get_token_metadata_cache().wrapped_assets(current_net, token_bridge, assets)
+
     chain_path = []
-    for net in support_networks:
-        if net == current_net:
-            continue
+    for net in nets:
         print(f"{net} --> {current_net}")
 
         wormhole_chain_id = config["networks"][net]["wormhole"]["chainid"]
         weth = get_weth_address(net)
         usdc_address = get_usdc_address(net)
         usdt_address = get_usdt_address(net)
-        wrapped_eth = token_bridge.wrappedAsset(wormhole_chain_id, weth)
+        wrapped_eth = wrapped[(wormhole_chain_id, weth)]
 
         chain_path.append(
             {
@@ -197,9 +206,7 @@ def get_all_warpped_token():
         )
 
         if usdc_address != None:
-            wrapped_usdc_token = token_bridge.wrappedAsset(
-                wormhole_chain_id, usdc_address
-            )
+            wrapped_usdc_token = wrapped[(wormhole_chain_id, usdc_address)]
             if wrapped_usdc_token != zero_address():
                 chain_path.append(
                     {
@@ -214,9 +221,7 @@ def get_all_warpped_token():
                 )
 
         if usdt_address != None:
-            wrapped_usdt_token = token_bridge.wrappedAsset(
-                wormhole_chain_id, usdt_address
-            )
+            wrapped_usdt_token = wrapped[(wormhole_chain_id, usdt_address)]
             if wrapped_usdt_token != zero_address():
                 chain_path.append(
                     {
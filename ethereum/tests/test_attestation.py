@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from scripts.relayer.attestation import AttestationPoller, StubIrisServer
+from scripts.relayer.processed_store import ProcessedStore
+
+ATTESTATION = "0x" + "ab" * 65
+
+
+@pytest.fixture
+def server():
+    server = StubIrisServer(pending_polls=2)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProcessedStore(str(tmp_path / "processed.sqlite"))
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_poll_until_attested(server, store):
+    poller = AttestationPoller(server.url, store, min_delay=0.05, max_delay=0.2)
+    other = None
+    try:
+        ready = []
+        poller.track("0x01", lambda h, a: ready.append((h, a)))
+        poller.track("0x02", lambda h, a: ready.append((h, a)))
+        assert poller.get("0x01") is None
+
+        # Unknown to Iris (404), then PENDING twice, then attested
+        time.sleep(0.3)
+        server.publish("0x01", ATTESTATION)
+        assert wait_until(lambda: len(ready) == 1)
+        assert ready == [("0x01", ATTESTATION)]
+        assert server.polls["0x01"] == 3
+        assert poller.pending_count() == 1
+
+        # Persisted, a new poller answers without a request
+        requests = server.requests
+        other = AttestationPoller(server.url, store)
+        assert other.get("0x01") == ATTESTATION
+        other.track("0x01", lambda h, a: ready.append((h, a)))
+        assert ready[-1] == ("0x01", ATTESTATION)
+        assert other.fetch("0x01") == ATTESTATION
+        time.sleep(0.1)
+        assert server.requests - requests <= 1  # at most one poll of 0x02
+    finally:
+        poller.close()
+        if other is not None:
+            other.close()
+
+    # Closed, 0x02 is not polled any more
+    requests = server.requests
+    time.sleep(0.3)
+    assert server.requests == requests
+
+
+def test_give_up_after_max_age(server, store):
+    poller = AttestationPoller(server.url, store, min_delay=0.05, max_delay=0.05, max_age=0.3)
+    try:
+        ready = []
+        poller.track("0x03", lambda h, a: ready.append((h, a)))
+        assert wait_until(lambda: len(ready) == 1)
+        assert ready == [("0x03", None)]
+        assert poller.pending_count() == 0
+    finally:
+        poller.close()
@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scripts.celer_tracker import CelerTransferTracker
+
+REFUND = {
+    "wd_onchain": "AQI=",
+    "sorted_sigs": ["AwQ="],
+    "signers": ["AAAAAAAAAAAAAAAAAAAAAAAAAAE="],
+    "powers": ["AQ=="],
+}
+
+
+def start_gateway(statuses):
+    """getTransferStatus answering the next status of `statuses[transfer_id]`"""
+    polls = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            transfer_id = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["transfer_id"]
+            index = min(polls.get(transfer_id, 0), len(statuses[transfer_id]) - 1)
+            polls[transfer_id] = polls.get(transfer_id, 0) + 1
+            status = statuses[transfer_id][index]
+            body = {"err": None, "status": status, "refund_reason": 0}
+            if status == 8:
+                body.update(REFUND)
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, polls
+
+
+def test_track_until_final_or_refundable(tmp_path):
+    statuses = {"0x01": [1, 5], "0x02": [6, 8], "0x03": [2]}
+    server, polls = start_gateway(statuses)
+    host, port = server.server_address[:2]
+    path = str(tmp_path / "celer.sqlite")
+    tracker = CelerTransferTracker(path, base_url=f"http://{host}:{port}/v2/getTransferStatus", rate=100)
+    for transfer_id in statuses:
+        tracker.track(transfer_id, "bsc-main")
+    # Tracking again keeps the state
+    tracker.track("0x01", "bsc-main")
+
+    assert tracker.poll_once() == 3
+    # Polled again only once due
+    assert tracker.poll_once() == 0
+    assert tracker.get("0x03")["status"] == "TRANSFER_FAILED"
+    assert tracker.get("0x03")["next_poll"] is None
+
+    tracker._execute("UPDATE transfers SET next_poll=0 WHERE next_poll IS NOT NULL")
+    assert tracker.poll_once() == 2
+    assert tracker.get("0x01")["status"] == "TRANSFER_COMPLETED"
+    assert tracker.waiting() == 0
+    assert [v[0] for v in tracker.transitions("0x02")] == [
+        "TRANSFER_TO_BE_REFUNDED", "TRANSFER_REFUND_TO_BE_CONFIRMED"
+    ]
+
+    # State survives a restart
+    tracker = CelerTransferTracker(path)
+    refunds = tracker.refunds("bsc-main")
+    assert [v["transfer_id"] for v in refunds] == ["0x02"]
+    assert refunds[0]["refund"] == REFUND
+    tracker.mark_withdrawn("0x02", "0xabc")
+    assert tracker.refunds() == []
+    assert tracker.summary()["TRANSFER_COMPLETED"] == 1
+    server.shutdown()
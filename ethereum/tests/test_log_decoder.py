@@ -0,0 +1,85 @@
+from eth_abi import encode_abi
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+
+from scripts.relayer.log_decoder import LogDecoder
+
+ERC20_TRANSFER = {
+    "type": "event",
+    "name": "Transfer",
+    "anonymous": False,
+    "inputs": [
+        {"type": "address", "name": "from", "indexed": True},
+        {"type": "address", "name": "to", "indexed": True},
+        {"type": "uint256", "name": "value", "indexed": False},
+    ],
+}
+# Same topic0 as the ERC20 Transfer, tokenId is indexed
+ERC721_TRANSFER = {
+    "type": "event",
+    "name": "Transfer",
+    "anonymous": False,
+    "inputs": [
+        {"type": "address", "name": "from", "indexed": True},
+        {"type": "address", "name": "to", "indexed": True},
+        {"type": "uint256", "name": "tokenId", "indexed": True},
+    ],
+}
+MESSAGE_SENT = {
+    "type": "event",
+    "name": "MessageSent",
+    "anonymous": False,
+    "inputs": [{"type": "bytes", "name": "message", "indexed": False}],
+}
+
+TX_HASH = b"\x01" * 32
+
+
+def make_log(index, topics, data="0x"):
+    return {
+        "address": "0x" + "11" * 20,
+        "topics": topics,
+        "data": data,
+        "logIndex": index,
+        "transactionIndex": 0,
+        "transactionHash": TX_HASH,
+        "blockHash": b"\x02" * 32,
+        "blockNumber": 1,
+    }
+
+
+def address_topic(address: str):
+    return bytes(12) + bytes.fromhex(address)
+
+
+def test_decode_by_topic():
+    transfer_topic = event_abi_to_log_topic(ERC20_TRANSFER)
+    logs = [
+        make_log(
+            0,
+            [transfer_topic, address_topic("22" * 20), address_topic("33" * 20)],
+            "0x" + encode_abi(["uint256"], [5]).hex(),
+        ),
+        make_log(
+            1,
+            [transfer_topic, address_topic("22" * 20), address_topic("33" * 20), (7).to_bytes(32, "big")],
+        ),
+        make_log(2, [event_abi_to_log_topic(MESSAGE_SENT)], "0x" + encode_abi(["bytes"], [b"hi"]).hex()),
+        # Not indexed
+        make_log(3, [b"\x09" * 32]),
+        make_log(4, []),
+    ]
+    decoder = LogDecoder([ERC20_TRANSFER, MESSAGE_SENT], codec=Web3().codec)
+    events = decoder.decode_logs(logs)
+    # The erc721 log shares the topic0 but does not decode
+    assert [e["args"]["value"] for e in events["Transfer"]] == [5]
+    assert events["MessageSent"][0]["args"]["message"] == b"hi"
+    assert [name for name, _ in decoder.decode_ordered(logs)] == ["Transfer", "MessageSent"]
+
+    decoder = LogDecoder([ERC20_TRANSFER, ERC721_TRANSFER, MESSAGE_SENT], codec=Web3().codec)
+    events = decoder.decode_logs(logs)
+    assert [dict(e["args"]).get("tokenId") for e in events["Transfer"]] == [None, 7]
+
+    by_tx = decoder.decode_receipts([{"transactionHash": TX_HASH, "logs": logs}, None])
+    assert list(by_tx) == ["0x" + TX_HASH.hex()]
+    assert len(by_tx["0x" + TX_HASH.hex()]["Transfer"]) == 2
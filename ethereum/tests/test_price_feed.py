@@ -0,0 +1,46 @@
+import pytest
+from scripts.relayer.price_feed import FakeExchange, PriceFeed, get_net_symbol
+
+
+class BrokenExchange:
+    def fetch_tickers(self, symbols=None):
+        raise ConnectionError("exchange down")
+
+
+def test_batched_fetch_with_ttl(tmp_path):
+    exchange = FakeExchange({"ETH/USDT": 2000, "BNB/USDT": 300, "AVAX/USDT": 20})
+    feed = PriceFeed(exchange, path=str(tmp_path / "prices.json"))
+
+    symbols = [get_net_symbol(net) for net in ["mainnet", "arbitrum-main", "bsc-main", "avax-main"]]
+    assert feed.get(symbols) == {"ETH/USDT": 2000, "BNB/USDT": 300, "AVAX/USDT": 20}
+    assert exchange.calls == 1
+
+    exchange.prices["ETH/USDT"] = 2100
+    assert feed.price("ETH/USDT") == 2000
+    assert exchange.calls == 1
+
+    # Another process reads the shared file instead of the exchange
+    other = FakeExchange({})
+    assert PriceFeed(other, path=str(tmp_path / "prices.json")).price("BNB/USDT") == 300
+    assert other.calls == 0
+
+    feed.ttl = 0
+    assert feed.price("ETH/USDT") == 2100
+    assert exchange.calls == 2
+    # Only the requested symbol is fetched again
+    assert exchange.requested[-1] == ["ETH/USDT"]
+
+
+def test_stale_prices(tmp_path):
+    feed = PriceFeed(FakeExchange({"SUI/USDT": 1.5}), ttl=0, path=str(tmp_path / "prices.json"))
+    assert feed.price("SUI/USDT") == 1.5
+
+    feed._exchange = BrokenExchange()
+    assert feed.price("SUI/USDT") == 1.5
+
+    feed.max_stale = 0
+    with pytest.raises(RuntimeError):
+        feed.price("SUI/USDT")
+
+    with pytest.raises(ValueError):
+        get_net_symbol("unknown-net")
@@ -0,0 +1,17 @@
+from scripts.relayer.processed_store import ProcessedStore
+
+
+def test_prune(tmp_path):
+    store = ProcessedStore(str(tmp_path / "processed.sqlite"), retention=60)
+    assert store.claim("wormhole", "2|1", 0)
+    assert store.claim("wormhole", "2|2", 60)
+    store.put("wormhole", "2|3", "0xa")
+    store.put("wormhole", "2|4", "0xb")
+    store._execute("UPDATE processed SET updated=updated-120 WHERE key='2|3'")
+
+    store.prune()
+    assert store.count("wormhole") == 2
+    # An unexpired claim and a recent done key are kept
+    assert not store.claim("wormhole", "2|2", 60)
+    assert store.get("wormhole", "2|4") == "0xb"
+    assert store.get("wormhole", "2|3") is None
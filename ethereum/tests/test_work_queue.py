@@ -0,0 +1,68 @@
+import pickle
+import threading
+import time
+
+from scripts.relayer.work_queue import WorkQueue
+
+
+def test_idempotent_put_and_ack(tmp_path):
+    queue = WorkQueue("cctp_1", str(tmp_path / "queue.sqlite"), capacity=2)
+    assert queue.put("0xa", {"n": 1})
+    assert not queue.put("0xa", {"n": 2})
+    assert queue.put("0xb", {"n": 3})
+    # Full, backpressure
+    assert not queue.put("0xc", {"n": 4}, timeout=0)
+    assert queue.qsize() == 2
+
+    assert queue.get(timeout=0) == ("0xa", {"n": 1})
+    queue.ack("0xa")
+    # Done keys stay known
+    assert not queue.put("0xa", {"n": 1})
+    assert queue.put("0xc", {"n": 4})
+
+    metrics = queue.metrics()
+    assert metrics["pending"] == 2 and metrics["done"] == 1
+    assert metrics["oldest_age"] >= 0
+
+
+def test_redelivery(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue("stargate_1", path, lease_time=0.2, max_attempts=3, poll_interval=0.05)
+    queue.put("0xa", {"n": 1})
+    assert queue.get(timeout=0) == ("0xa", {"n": 1})
+    assert queue.get(timeout=0) is None
+
+    # A restarted consumer gets the item once its lease expired
+    restarted = pickle.loads(pickle.dumps(queue))
+    assert restarted.get(timeout=1) == ("0xa", {"n": 1})
+
+    restarted.nack("0xa", delay=0.1)
+    assert restarted.get(timeout=0) is None
+    time.sleep(0.15)
+    assert restarted.get(timeout=0) == ("0xa", {"n": 1})
+
+    # Deferred deliveries do not count as attempts
+    for _ in range(5):
+        restarted.nack("0xa", count=False)
+        assert restarted.get(timeout=0) == ("0xa", {"n": 1})
+
+    # Third attempt failed too, parked as dead
+    restarted.nack("0xa")
+    assert restarted.get(timeout=0) is None
+    assert restarted.metrics()["dead"] == 1
+
+    # Queues do not see each other
+    assert WorkQueue("stargate_2", path).get(timeout=0) is None
+
+
+def test_put_wakes_consumer(tmp_path):
+    queue = WorkQueue("cctp_2", str(tmp_path / "queue.sqlite"), poll_interval=30)
+    result = []
+    consumer = threading.Thread(target=lambda: result.append(queue.get(timeout=60)))
+    consumer.start()
+    time.sleep(0.2)
+    start = time.time()
+    queue.put("0xa", {"n": 1})
+    consumer.join(5)
+    assert result == [("0xa", {"n": 1})]
+    assert time.time() - start < 5
@@ -0,0 +1,167 @@
+import pytest
+from scripts.relayer.wormhole_serder import parse_many, parse_vaa_to_wormhole_payload
+
+# Payloads recorded from WormholeFacet.encodeWormholePayload, see test_wormhole_facet
+WORMHOLE_PAYLOAD_NOT_SWAP = "022710013b204450040bc7ea55def9182559ceffc0652d88541538b30a43477364f475f4a4ed142da7e3a7f21cce79efeb66f3b082196ea0a8b9af14957eb0316f02ba4a9de3d308742eefd44a3c1719"
+WORMHOLE_PAYLOAD_WITH_SWAP = "022710013b204450040bc7ea55def9182559ceffc0652d88541538b30a43477364f475f4a4ed142da7e3a7f21cce79efeb66f3b082196ea0a8b9af14957eb0316f02ba4a9de3d308742eefd44a3c17190102204e9fce03284c0ce0b86c88dd5a46f050cad2f4f33c4cdd29d98f501868558c811a3078313a3a6170746f735f636f696e3a3a4170746f73436f696e163078313a3a6f6d6e695f6272696467653a3a5842544300583078346539666365303332383463306365306238366338386464356134366630353063616432663466333363346364643239643938663530313836383535386338313a3a6375727665733a3a556e636f7272656c6174656414957eb0316f02ba4a9de3d308742eefd44a3c1719142514895c72f50d8bd4b4f9b1110f0d6bd2c9752614143db3ceefbdfe5631add3e50f7614b6ba708ba700146ce9e2c8b59bbcf65da375d3d8ab503c8524caf7"
+
+# Signed vaa with one guardian signature, a token bridge transfer with payload
+# from chain 2 to chain 4 and WORMHOLE_PAYLOAD_WITH_SWAP as payload
+SIGNED_VAA = (
+    "01000000030100"
+    + "11" * 32
+    + "22" * 32
+    + "01"
+    + "6422c400"
+    + "00000007"
+    + "0002"
+    + "0000000000000000000000003ee18b2214aff97000d974cf647e7c347e8fa585"
+    + "0000000000003039"
+    + "0f"
+    + "03"
+    + "0000000000000000000000000000000000000000000000000000000005f5e100"
+    + "000000000000000000000000c02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+    + "0002"
+    + "0000000000000000000000002967e7bb9daa5711ac332caf874bd47ef99b3820"
+    + "0004"
+    + "0000000000000000000000002967e7bb9daa5711ac332caf874bd47ef99b3820"
+    + WORMHOLE_PAYLOAD_WITH_SWAP
+)
+
+
+def transfer_payload(wormhole_payload: str) -> str:
+    return SIGNED_VAA[: -len(WORMHOLE_PAYLOAD_WITH_SWAP)] + wormhole_payload
+
+
+def test_parse_vm():
+    vaa_data, _, _ = parse_vaa_to_wormhole_payload(SIGNED_VAA)
+    # IWormhole.parseVM
+    assert vaa_data == [
+        1,
+        1680000000,
+        7,
+        2,
+        "0x0000000000000000000000003ee18b2214aff97000d974cf647e7c347e8fa585",
+        12345,
+        15,
+        "0x" + SIGNED_VAA[-(len(WORMHOLE_PAYLOAD_WITH_SWAP) + 266):],
+        3,
+        [["0x" + "11" * 32, "0x" + "22" * 32, 28, 0]],
+        "0xb1471e07d9b70ad35e677eece207d3517300b07275c851828eaceb7c47dff127",
+    ]
+    assert vaa_data["emitterChainId"] == 2
+    assert vaa_data["sequence"] == 12345
+    assert vaa_data[-4] == vaa_data["payload"]
+
+
+def test_parse_transfer_with_payload():
+    _, transfer_data, _ = parse_vaa_to_wormhole_payload(SIGNED_VAA)
+    # ITokenBridge.parseTransferWithPayload
+    assert transfer_data == [
+        3,
+        100000000,
+        "0x000000000000000000000000c02aaa39b223fe8d0a0e5c4f27ead9083c756cc2",
+        2,
+        "0x0000000000000000000000002967e7bb9daa5711ac332caf874bd47ef99b3820",
+        4,
+        "0x0000000000000000000000002967e7bb9daa5711ac332caf874bd47ef99b3820",
+        "0x" + WORMHOLE_PAYLOAD_WITH_SWAP,
+    ]
+    # Same as brownie, bytes32 compare with address ignore padding
+    assert transfer_data[4] == "0x2967e7bb9daa5711ac332caf874bd47ef99b3820"
+    assert transfer_data[4] != "0x84B7cA95aC91f8903aCb08B27F5b41A4dE2Dc0fc"
+
+
+def test_decode_wormhole_payload():
+    so_data_padding = [
+        "0x4450040bc7ea55def9182559ceffc0652d88541538b30a43477364f475f4a4ed",
+        "0x2da7e3a7f21cce79efeb66f3b082196ea0a8b9af",
+        0,
+        "",
+        0,
+        "0x957eb0316f02ba4a9de3d308742eefd44a3c1719",
+        0,
+    ]
+    swap_data_padding = [
+        [
+            "0x4e9fce03284c0ce0b86c88dd5a46f050cad2f4f33c4cdd29d98f501868558c81",
+            "0x4e9fce03284c0ce0b86c88dd5a46f050cad2f4f33c4cdd29d98f501868558c81",
+            "0x3078313a3a6170746f735f636f696e3a3a4170746f73436f696e",
+            "0x3078313a3a6f6d6e695f6272696467653a3a58425443",
+            0,
+            "0x3078346539666365303332383463306365306238366338386464356134366630353063616432663466333363346364643239643938663530313836383535386338313a3a6375727665733a3a556e636f7272656c61746564",
+        ],
+        [
+            "0x957eb0316f02ba4a9de3d308742eefd44a3c1719",
+            "0x957eb0316f02ba4a9de3d308742eefd44a3c1719",
+            "0x2514895c72f50d8bd4b4f9b1110f0d6bd2c97526",
+            "0x143db3ceefbdfe5631add3e50f7614b6ba708ba7",
+            0,
+            "0x6ce9e2c8b59bbcf65da375d3d8ab503c8524caf7",
+        ],
+    ]
+
+    # WormholeFacet.decodeWormholePayload
+    _, _, wormhole_data = parse_vaa_to_wormhole_payload(
+        transfer_payload(WORMHOLE_PAYLOAD_NOT_SWAP)
+    )
+    assert wormhole_data == [10000, 59, so_data_padding, []]
+
+    _, _, wormhole_data = parse_vaa_to_wormhole_payload(SIGNED_VAA)
+    assert wormhole_data == [10000, 59, so_data_padding, swap_data_padding]
+    assert wormhole_data[2]["receiver"] == "0x2dA7e3a7F21cCE79efeb66f3b082196EA0A8B9af"
+
+
+def test_parse_transfer_without_payload():
+    vaa = bytearray.fromhex(SIGNED_VAA)
+    # payloadID of transfer
+    vaa[6 + 66 + 51] = 1
+    with pytest.raises(ValueError):
+        parse_vaa_to_wormhole_payload(bytes(vaa))
+
+
+def test_parse_many():
+    vaa = bytearray.fromhex(SIGNED_VAA)
+    # Without signature
+    no_signature = vaa[:5] + bytes([0]) + vaa[6 + 66:]
+    # Redeemer chain 5
+    other_chain = bytearray(vaa)
+    other_chain[6 + 66 + 51 + 99: 6 + 66 + 51 + 101] = (5).to_bytes(2, "big")
+    # Truncated transfer
+    truncated = vaa[: 6 + 66 + 51 + 100]
+
+    batch = parse_many([SIGNED_VAA, bytes(no_signature), bytes(other_chain), bytes(truncated)])
+    assert len(batch) == 4
+    assert list(batch.header["valid"]) == [True, True, True, False]
+    assert list(batch.header["timestamp"][:3]) == [1680000000] * 3
+    assert list(batch.header["nonce"][:3]) == [7] * 3
+    assert list(batch.header["emitter_chain"][:3]) == [2] * 3
+    assert list(batch.header["sequence"][:3]) == [12345] * 3
+    assert list(batch.header["amount"][:3]) == [100000000] * 3
+    assert list(batch.header["redeemer_chain"][:3]) == [4, 4, 5]
+    assert bytes(batch.header["emitter_address"][0]).hex() == (
+        "0000000000000000000000003ee18b2214aff97000d974cf647e7c347e8fa585"
+    )
+
+    mask = batch.mask(
+        redeemer_chain=4, redeemer="0x2967e7bb9daa5711ac332caf874bd47ef99b3820"
+    )
+    assert list(mask) == [True, True, False, False]
+    assert not batch.mask(redeemer="0x84B7cA95aC91f8903aCb08B27F5b41A4dE2Dc0fc").any()
+
+    parsed_vaa, parsed_transfer, parsed_transfer_payload = batch.parse(1)
+    assert parsed_vaa.guardian_signatures == []
+    assert parsed_transfer.redeemer_chain == 4
+    assert parsed_transfer_payload.dst_max_gas == 59
+    assert len(parsed_transfer_payload.swap_data_list) == 2
+
+    assert len(parse_many([])) == 0
+
+
+def test_parse_many_u256_amount():
+    vaa = bytearray.fromhex(SIGNED_VAA)
+    amount = 6 + 66 + 51 + 1
+    vaa[amount: amount + 32] = (2 ** 70 + 1).to_bytes(32, "big")
+    batch = parse_many([bytes(vaa)])
+    assert batch.header["amount"][0] == 2 ** 70 + 1
+    assert batch.parse(0)[1].amount == 2 ** 70 + 1
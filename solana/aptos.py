@@ -1,15 +1,11 @@
-import base64
 import functools
 import logging
-import random
 import threading
 import time
 from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
-import ccxt
-import pandas as pd
 import requests
 from brownie import network
 from retrying import retry
@@ -19,8 +15,11 @@ from scripts.serde_struct import (
     omniswap_aptos_path,
     decode_hex_to_ascii,
     hex_str_to_vector_u8,
-    change_network,
 )
+from omniswap_relayer.gas_ledger import get_gas_ledger
+from omniswap_relayer.guardian_rpc import get_guardian_fetcher
+from omniswap_relayer.price_feed import get_price_feed
+from omniswap_relayer.processed_store import ProcessedStore, get_processed_store
 import aptos_brownie
 
 FORMAT = "%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s"
@@ -90,10 +89,9 @@ NET_TO_EMITTER = {
 }
 
 
-@retry
+@retry(wait_exponential_multiplier=1000, wait_exponential_max=60 * 1000)
 def get_token_price():
-    kucoin = ccxt.kucoin()
-    return float(kucoin.fetch_ticker("APT/USDT")["close"])
+    return get_price_feed().price("APT/USDT")
 
 
 @functools.lru_cache()
@@ -106,22 +104,13 @@ def get_chain_id_to_net():
 
 
 def get_signed_vaa_by_wormhole(sequence: int, emitter_chain_id: str = None):
-    wormhole_url = random.choice(WORMHOLE_GUARDIAN_RPC)
     src_net = get_chain_id_to_net()[emitter_chain_id]
     emitter = NET_TO_EMITTER[src_net]
     emitter_address = format_emitter_address(emitter)
 
-    url = (
-        f"{wormhole_url}/v1/signed_vaa/{emitter_chain_id}/{emitter_address}/{sequence}"
+    return get_guardian_fetcher(tuple(WORMHOLE_GUARDIAN_RPC)).get_signed_vaa(
+        emitter_chain_id, emitter_address, sequence
     )
-    response = requests.get(url)
-
-    if "vaaBytes" not in response.json():
-        return None
-
-    vaa_bytes = response.json()["vaaBytes"]
-    vaa = base64.b64decode(vaa_bytes).hex()
-    return f"0x{vaa}"
 
 
 def get_pending_data(url: str = None, dstWormholeChainId=None) -> list:
@@ -165,10 +154,9 @@ def process_vaa(
     price=0,
 ) -> bool:
     try:
-        # Use bsc-test to decode, too slow may need to change bsc-mainnet
         vaa_str = vaa_str if "0x" in vaa_str else "0x" + vaa_str
         vaa_data, transfer_data, wormhole_data = parse_vaa_to_wormhole_payload(
-            package, network.show_active(), vaa_str
+            package, network.show_active(), vaa_str, offline=True
         )
         dst_max_gas = wormhole_data[1]
         dst_max_gas_price = wormhole_data[0] / 1e10
@@ -288,7 +276,8 @@ def process_v2(
         )
     else:
         pending_url = "https://crossswap.coming.chat/v1/getUnSendTransferFromWormhole"
-    has_process = {}
+    processed_store = get_processed_store()
+    processed_namespace = f"wormhole_{package.network}"
     last_price_update = 0
     interval_price = 3 * 60
     price_info = 0
@@ -327,19 +316,16 @@ def process_v2(
                     f'sequence:{d["sequence"]} error: {e}'
                 )
                 continue
-            has_key = (int(d["srcWormholeChainId"]), int(d["sequence"]))
-            if (
-                has_key in has_process
-                and (time.time() - has_process[has_key]) <= 3 * 60
-            ):
+            has_key = ProcessedStore.key(
+                int(d["srcWormholeChainId"]), int(d["sequence"])
+            )
+            if not processed_store.claim(processed_namespace, has_key, 3 * 60):
                 local_logger.warning(
                     f'emitterChainId:{d["srcWormholeChainId"]} sequence:{d["sequence"]} '
                     f"inner 10min has process!"
                 )
                 continue
-            else:
-                has_process[has_key] = time.time()
-            process_vaa(
+            if process_vaa(
                 dstSoDiamond=dstSoDiamond,
                 vaa_str=vaa,
                 emitterChainId=d["srcWormholeChainId"],
@@ -348,7 +334,8 @@ def process_v2(
                 local_logger=local_logger,
                 is_admin=False,
                 price=price_info,
-            )
+            ):
+                processed_store.put(processed_namespace, has_key)
 
 
 def compensate(
@@ -418,16 +405,7 @@ def record_gas(
     dst_txid=None,
     price=0,
 ):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"{dst_net}_{period1}_{period2}_v1.csv")
     sender_value = sender_gas * sender_gas_price
     actual_value = actual_gas * actual_gas_price
     data = OrderedDict(
@@ -450,13 +428,9 @@ def record_gas(
             "diff_value": round((sender_value - actual_value) / 1e8 * price, 4),
         }
     )
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode="a")
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode="w")
+    get_gas_ledger(str(file_path), "{dst_net}_{period1}_{period2}_v1.csv").record(
+        data, cur_timestamp
+    )
 
 
 def main():
@@ -469,7 +443,6 @@ def main():
 
 
 def single_process():
-    change_network("bsc-main")
     process_v2(22, package.network_config["SoDiamond"])
 
 
@@ -1,11 +1,9 @@
-import functools
-
 from brownie import network
-import ccxt
 
 from scripts import sui_project
 from scripts.serde_sui import get_serde_facet, get_price_ratio
 from scripts.struct_sui import hex_str_to_vector_u8
+from omniswap_relayer.price_feed import get_price_feed
 from sui_brownie import SuiPackage
 
 net = sui_project.network
@@ -90,16 +88,10 @@ def set_so_gas():
         )
 
 
-@functools.lru_cache()
 def get_prices(symbols=("ETH/USDT", "BNB/USDT", "POL/USDT", "AVAX/USDT", "APT/USDT", "SUI/USDT", "SOL/USDT")):
-    api = ccxt.kucoin()
-    prices = {}
-
-    for symbol in symbols:
-        result = api.fetch_ticker(symbol=symbol)
-        price = result["close"]
+    prices = get_price_feed().get(symbols)
+    for symbol, price in prices.items():
         print(f"Symbol:{symbol}, price:{price}")
-        prices[symbol] = price
     return prices
 
 
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger()
+
+POOL_TYPE_OPTIONS = {
+    "showType": True,
+    "showOwner": False,
+    "showPreviousTransaction": False,
+    "showDisplay": False,
+    "showContent": False,
+    "showBcs": False,
+    "showStorageRebate": False
+}
+
+
+def parse_type_params(sui_type: str) -> List[str]:
+    """Type parameters of a struct type, nested generics are kept whole
+
+    0x1::pool::Pool<0x2::sui::SUI, 0x3::a::B<0x4::c::D>>
+        -> ["0x2::sui::SUI", "0x3::a::B<0x4::c::D>"]
+    """
+    start = sui_type.find("<")
+    if start == -1:
+        return []
+    params = []
+    depth = 0
+    current = start + 1
+    for i in range(start + 1, len(sui_type)):
+        c = sui_type[i]
+        if c == "<":
+            depth += 1
+        elif c == ">":
+            if depth == 0:
+                params.append(sui_type[current:i])
+                break
+            depth -= 1
+        elif c == "," and depth == 0:
+            params.append(sui_type[current:i])
+            current = i + 1
+    return [v.replace(" ", "") for v in params]
+
+
+class PoolInfo:
+    __slots__ = ("pool_id", "type", "package_id", "coin_types")
+
+    def __init__(self, pool_id: str, sui_type: str):
+        self.pool_id = pool_id
+        self.type = sui_type
+        self.package_id = sui_type.split("::")[0]
+        self.coin_types = parse_type_params(sui_type)
+
+    @property
+    def base_type(self) -> str:
+        return self.coin_types[0]
+
+
+class PoolTypeIndex:
+    """Types of dex pools, fetched once with batched sui_multiGetObjects
+
+    The type of an object never changes, so resolved types are kept for
+    good in memory and in the json file at `path`, shared by the relayer
+    processes of a network.
+    """
+
+    def __init__(self, client, path: str = None, batch_size: int = 50):
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        # pool id -> type
+        self._types: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._types.update(json.load(f))
+        except Exception:
+            return
+
+    def _save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            json.dump(self._types, f)
+        os.replace(tmp, self.path)
+
+    def _fetch(self, pool_ids: List[str]) -> Dict[str, str]:
+        result = {}
+        for i in range(0, len(pool_ids), self.batch_size):
+            batch = pool_ids[i:i + self.batch_size]
+            for pool_id, v in zip(batch, self.client.sui_multiGetObjects(batch, POOL_TYPE_OPTIONS)):
+                if "error" in v or "data" not in v:
+                    logger.warning(f"Get pool {pool_id} type fail: {v.get('error', v)}")
+                    continue
+                result[pool_id] = v["data"]["type"]
+        return result
+
+    def get_many(self, pool_ids: Iterable[str]) -> Dict[str, PoolInfo]:
+        """Pool infos of `pool_ids`, unknown pools are fetched in one round trip per batch"""
+        pool_ids = list(dict.fromkeys(str(v) for v in pool_ids))
+        with self._lock:
+            missing = [v for v in pool_ids if v not in self._types]
+        if missing:
+            fetched = self._fetch(missing)
+            if fetched:
+                with self._lock:
+                    # Other processes may have added pools meanwhile
+                    self._load()
+                    self._types.update(fetched)
+                    self._save()
+        with self._lock:
+            return {v: PoolInfo(v, self._types[v]) for v in pool_ids if v in self._types}
+
+    def get(self, pool_id: str) -> PoolInfo:
+        pool_id = str(pool_id)
+        result = self.get_many([pool_id])
+        if pool_id not in result:
+            raise ValueError(f"Pool {pool_id} not found")
+        return result[pool_id]
@@ -1,15 +1,12 @@
-import base64
+import asyncio
 import functools
 import logging
-import random
 import threading
 import time
 from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
-import ccxt
-import pandas as pd
 import requests
 from brownie import network
 from retrying import retry
@@ -17,7 +14,13 @@ from sui_brownie import SuiPackage, SuiObject, Argument, U16, NestedResult
 
 from scripts import sui_project
 from scripts.serde_sui import parse_vaa_to_wormhole_payload
-from scripts.struct_sui import decode_hex_to_ascii, hex_str_to_vector_u8, change_network
+from scripts.struct_sui import decode_hex_to_ascii, hex_str_to_vector_u8
+from scripts.relayer.pool_index import PoolInfo, PoolTypeIndex
+from omniswap_relayer.gas_ledger import get_gas_ledger
+from omniswap_relayer.guardian_rpc import get_guardian_fetcher
+from omniswap_relayer.price_feed import get_price_feed
+from omniswap_relayer.processed_store import ProcessedStore, get_processed_store
+from omniswap_relayer.scheduler import PollTimer
 
 FORMAT = '%(asctime)s - %(funcName)s - %(levelname)s - %(name)s: %(message)s'
 logging.basicConfig(format=FORMAT)
@@ -81,10 +84,9 @@ NET_TO_EMITTER = {
 }
 
 
-@retry
+@retry(wait_exponential_multiplier=1000, wait_exponential_max=60 * 1000)
 def get_token_price():
-    kucoin = ccxt.kucoin()
-    return float(kucoin.fetch_ticker("SUI/USDT")['close'])
+    return get_price_feed().price("SUI/USDT")
 
 
 @functools.lru_cache()
@@ -100,20 +102,13 @@ def get_signed_vaa_by_wormhole(
         sequence: int,
         emitter_chain_id: str = None
 ):
-    wormhole_url = random.choice(WORMHOLE_GUARDIAN_RPC)
     src_net = get_chain_id_to_net()[emitter_chain_id]
     emitter = NET_TO_EMITTER[src_net]
     emitter_address = format_emitter_address(emitter)
 
-    url = f"{wormhole_url}/v1/signed_vaa/{emitter_chain_id}/{emitter_address}/{sequence}"
-    response = requests.get(url)
-
-    if 'vaaBytes' not in response.json():
-        return None
-
-    vaa_bytes = response.json()['vaaBytes']
-    vaa = base64.b64decode(vaa_bytes).hex()
-    return f"0x{vaa}"
+    return get_guardian_fetcher(tuple(WORMHOLE_GUARDIAN_RPC)).get_signed_vaa(
+        emitter_chain_id, emitter_address, sequence
+    )
 
 
 def get_pending_data(url: str = None, dstWormholeChainId=None) -> list:
@@ -162,6 +157,28 @@ def deepbook_v2_storage():
     return sui_project.network_config['objects']['DeepbookV2Storage']
 
 
+@functools.lru_cache()
+def get_pool_index():
+    return PoolTypeIndex(
+        sui_project.client,
+        path=f"./cache/sui_pool_types_{sui_project.network}.json",
+    )
+
+
+def get_dex_name(pool: PoolInfo) -> str:
+    origin_type = SuiObject.from_type(pool.type)
+    if origin_type.package_id == get_deepbook_package_id():
+        return "deepbook_v2"
+    elif origin_type.package_id == get_cetus_package_id():
+        return "cetus"
+    else:
+        raise ValueError(origin_type.package_id)
+
+
+def get_vaa_pool_ids(wormhole_data) -> list:
+    return [str(d[0]) for d in wormhole_data[3]]
+
+
 def normal_ty_arg(ty):
     if ty[:2] != "0x":
         ty = "0x" + ty
@@ -181,26 +198,9 @@ def multi_swap(
     sending_asset_id = normal_ty_arg(sending_asset_id)
     receiving_asset_id = normal_ty_arg(receiving_asset_id)
 
-    sui_type: str = sui_project.client.sui_getObject(pool_id, {
-        "showType": True,
-        "showOwner": True,
-        "showPreviousTransaction": False,
-        "showDisplay": False,
-        "showContent": False,
-        "showBcs": False,
-        "showStorageRebate": False
-    })["data"]["type"]
-    origin_type = SuiObject.from_type(sui_type)
-    if origin_type.package_id == get_deepbook_package_id():
-        dex_name = "deepbook_v2"
-    elif origin_type.package_id == get_cetus_package_id():
-        dex_name = "cetus"
-    else:
-        raise ValueError(origin_type.package_id)
-
-    start_index = sui_type.find("<")
-    end_index = sui_type.find(",")
-    sui_type = SuiObject.from_type(sui_type[start_index + 1:end_index].replace(" ", ""))
+    pool = get_pool_index().get(pool_id)
+    dex_name = get_dex_name(pool)
+    sui_type = SuiObject.from_type(pool.base_type)
 
     if "2::sui::SUI" in str(sui_type):
         sui_type = "0x0000000000000000000000000000000000000000000000000000000000000002::sui::SUI"
@@ -234,11 +234,10 @@ def process_vaa(
         price=0,
 ) -> bool:
     try:
-        # Use bsc-test to decode, too slow may need to change bsc-mainnet
         vaa_str = vaa_str if "0x" in vaa_str else "0x" + vaa_str
         vaa_data, transfer_data, wormhole_data = parse_vaa_to_wormhole_payload(
             sui_project, network.show_active(),
-            vaa_str)
+            vaa_str, offline=True)
         dst_max_gas = wormhole_data[1]
         dst_max_gas_price = int(wormhole_data[0] / 1e9)
         dst_max_gas_price = min(sui_project.estimate_gas_price(), dst_max_gas_price)
@@ -260,6 +259,8 @@ def process_vaa(
     try:
         final_asset_id = decode_hex_to_ascii(wormhole_data[2][5])
         final_asset_id = final_asset_id if "0x" == final_asset_id[:2] else "0x" + final_asset_id
+        # One batched lookup for every pool of the swap path, usually served by the index
+        pools = get_pool_index().get_many(get_vaa_pool_ids(wormhole_data))
         if len(wormhole_data[3]) == 0:
             ty_args = [final_asset_id]
             cross_asset_id = final_asset_id
@@ -276,26 +277,8 @@ def process_vaa(
             cross_asset_id = s1
             s2 = final_asset_id
             pool_id = str(wormhole_data[3][0][0])
-            sui_type: str = sui_project.client.sui_getObject(pool_id, {
-                "showType": True,
-                "showOwner": True,
-                "showPreviousTransaction": False,
-                "showDisplay": False,
-                "showContent": False,
-                "showBcs": False,
-                "showStorageRebate": False
-            })["data"]["type"]
-            origin_type = SuiObject.from_type(sui_type)
-            if origin_type.package_id == get_deepbook_package_id():
-                dex_name = "deepbook_v2"
-            elif origin_type.package_id == get_cetus_package_id():
-                dex_name = "cetus"
-            else:
-                raise ValueError(origin_type.package_id)
-
-            start_index = sui_type.find("<")
-            end_index = sui_type.find(",")
-            sui_type = SuiObject.from_type(sui_type[start_index + 1:end_index].replace(" ", ""))
+            dex_name = get_dex_name(pools[pool_id])
+            sui_type = SuiObject.from_type(pools[pool_id].base_type)
 
             if str(sui_type).replace("0x", "") == str(SuiObject.from_type(s1)).replace("0x", ""):
                 ty_args = [s1, s2]
@@ -316,22 +299,11 @@ def process_vaa(
             for k, d in enumerate(wormhole_data[3]):
                 if str(d[0]) not in pool_id:
                     pool_id.append(str(d[0]))
-                sui_type: str = sui_project.client.sui_getObject(pool_id[-1], {
-                    "showType": True,
-                    "showOwner": True,
-                    "showPreviousTransaction": False,
-                    "showDisplay": False,
-                    "showContent": False,
-                    "showBcs": False,
-                    "showStorageRebate": False
-                })["data"]["type"]
-
-                start_index = sui_type.find("<")
-                end_index = sui_type.find(",")
-                ty_args.append(SuiObject.from_type(sui_type[start_index + 1:end_index].replace(" ", "")))
-
-                origin_type = SuiObject.from_type(sui_type)
-                if origin_type.package_id == get_deepbook_package_id():
+                pool = pools[pool_id[-1]]
+                ty_args.append(SuiObject.from_type(pool.base_type))
+
+                dex_name = get_dex_name(pool)
+                if dex_name == "deepbook_v2":
                     try:
                         dex_index = dex_config.index(deepbook_v2_storage())
                     except:
@@ -339,7 +311,7 @@ def process_vaa(
                     if dex_index == -1:
                         dex_config.append(deepbook_v2_storage())
                         dex_index = len(dex_config) - 1
-                elif origin_type.package_id == get_cetus_package_id():
+                else:
                     try:
                         dex_index = dex_config.index(get_cetus_config())
                     except:
@@ -347,8 +319,6 @@ def process_vaa(
                     if dex_index == -1:
                         dex_config.append(get_cetus_config())
                         dex_index = len(dex_config) - 1
-                else:
-                    raise ValueError(origin_type.package_id)
                 multi.append({
                     "pool_id": str(d[0]),
                     "sending_asset_id": normal_ty_arg(str(decode_hex_to_ascii(d[2]))),
@@ -544,6 +514,46 @@ def process_vaa(
     return True
 
 
+async def prepare_vaas(pending_data: list, local_logger) -> list:
+    """Fetch the signed vaas of `pending_data` and resolve all of their pools concurrently
+
+    :return: [(pending data, signed vaa)] of the vaas ready to process, in order
+    """
+
+    async def get_vaa(d):
+        try:
+            vaa = await asyncio.to_thread(
+                get_signed_vaa_by_wormhole, int(d["sequence"]), int(d["srcWormholeChainId"])
+            )
+        except Exception as e:
+            local_logger.error(f'Get signed vaa for :{d["srcWormholeChainId"]}, '
+                               f'sequence:{d["sequence"]} error: {e}')
+            return None
+        if vaa is None:
+            local_logger.info(
+                f'Waiting vaa for emitterChainId: {d["srcWormholeChainId"]}, sequence:{d["sequence"]}')
+        return vaa
+
+    vaas = await asyncio.gather(*[get_vaa(d) for d in pending_data])
+    ready = [(d, vaa) for d, vaa in zip(pending_data, vaas) if vaa is not None]
+
+    pool_ids = []
+    for d, vaa in ready:
+        try:
+            _, _, wormhole_data = parse_vaa_to_wormhole_payload(
+                sui_project, network.show_active(), vaa, offline=True)
+            pool_ids.extend(get_vaa_pool_ids(wormhole_data))
+        except Exception:
+            # Reported by process_vaa
+            continue
+    if pool_ids:
+        try:
+            await asyncio.to_thread(get_pool_index().get_many, pool_ids)
+        except Exception as e:
+            local_logger.warning(f"Prefetch pool types error: {e}")
+    return ready
+
+
 def process_v2(
         dstWormholeChainId: int = 21,
         dstSoDiamond: str = None,
@@ -554,24 +564,22 @@ def process_v2(
         pending_url = "https://crossswap-pre.coming.chat/v1/getUnSendTransferFromWormhole"
     else:
         pending_url = "https://crossswap.coming.chat/v1/getUnSendTransferFromWormhole"
-    has_process = {}
+    processed_store = get_processed_store()
+    processed_namespace = f"wormhole_{sui_project.network}"
     last_price_update = 0
     interval_price = 3 * 60
     price_info = 0
-    last_pending_time = 0
-    pending_interval = 30
+    poll_timer = PollTimer(30, max_interval=5 * 60)
     while True:
+        poll_timer.wait()
         try:
-            if time.time() < last_pending_time + pending_interval:
-                continue
-            else:
-                last_pending_time = time.time()
             pending_data = get_pending_data(url=pending_url, dstWormholeChainId=dstWormholeChainId)
             local_logger.info(f"Get signed vaa length: {len(pending_data)}")
         except Exception as e:
             local_logger.error(
                 f'Get pending data for sio error: {e}'
             )
+            poll_timer.fail()
             continue
 
         try:
@@ -581,33 +589,20 @@ def process_v2(
                 last_price_update = time.time()
         except Exception as e:
             local_logger.error(f'Get token price error: {e}')
+            poll_timer.fail()
             continue
+        poll_timer.succeed()
 
-        for d in pending_data:
-            try:
-                vaa = get_signed_vaa_by_wormhole(int(d["sequence"]), int(d["srcWormholeChainId"]))
-                if vaa is None:
-                    local_logger.info(
-                        f'Waiting vaa for emitterChainId: {d["srcWormholeChainId"]}, sequence:{d["sequence"]}')
-                    continue
-            except Exception as e:
-                local_logger.error(f'Get signed vaa for :{d["srcWormholeChainId"]}, '
-                                   f'sequence:{d["sequence"]} error: {e}')
-                continue
-            has_key = (int(d["srcWormholeChainId"]), int(d["sequence"]))
-            if (
-                    has_key in has_process
-                    and (time.time() - has_process[has_key]) <= 3 * 60
-            ):
+        # Transactions from one account are sent one by one, only the lookups run concurrently
+        for d, vaa in asyncio.run(prepare_vaas(pending_data, local_logger)):
+            has_key = ProcessedStore.key(int(d["srcWormholeChainId"]), int(d["sequence"]))
+            if not processed_store.claim(processed_namespace, has_key, 3 * 60):
                 local_logger.warning(
                     f'emitterChainId:{d["srcWormholeChainId"]} sequence:{d["sequence"]} '
                     f"inner 10min has process!"
                 )
                 continue
-            else:
-                has_process[has_key] = time.time()
-
-            process_vaa(
+            if process_vaa(
                 dstSoDiamond=dstSoDiamond,
                 vaa_str=vaa,
                 emitterChainId=d["srcWormholeChainId"],
@@ -616,7 +611,8 @@ def process_v2(
                 local_logger=local_logger,
                 is_admin=False,
                 price=price_info
-            )
+            ):
+                processed_store.put(processed_namespace, has_key)
 
 
 def compensate(
@@ -630,7 +626,9 @@ def compensate(
         pending_url = "https://crossswap-pre.coming.chat/v1/getUnSendTransferFromWormhole"
     else:
         pending_url = "https://crossswap.coming.chat/v1/getUnSendTransferFromWormhole"
+    poll_timer = PollTimer(3 * 60, max_interval=15 * 60)
     while True:
+        poll_timer.wait()
         try:
             pending_data = get_pending_data(url=pending_url, dstWormholeChainId=dstWormholeChainId)
             local_logger.info(f"Get signed vaa length: {len(pending_data)}")
@@ -638,7 +636,9 @@ def compensate(
             local_logger.error(
                 f'Get pending data for sio error: {e}'
             )
+            poll_timer.fail()
             continue
+        poll_timer.succeed()
         for d in pending_data:
             try:
                 vaa = get_signed_vaa_by_wormhole(int(d["sequence"]), int(d["srcWormholeChainId"]))
@@ -662,7 +662,6 @@ def compensate(
                 is_admin=True,
                 price=get_token_price()
             )
-        time.sleep(3 * 60)
 
 
 def record_gas(
@@ -680,16 +679,7 @@ def record_gas(
         dst_txid=None,
         price=0,
 ):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
-    if not file_path.exists():
-        file_path.mkdir()
-    interval = 7 * 24 * 60 * 60
     cur_timestamp = int(time.time())
-    uid = int(cur_timestamp / interval) * interval
-    period1 = str(datetime.fromtimestamp(uid))[:13]
-    period2 = str(datetime.fromtimestamp(uid + interval))[:13]
-    file_name = file_path.joinpath(f"{dst_net}_{period1}_{period2}_v1.csv")
     sender_value = sender_gas * sender_gas_price
     actual_value = actual_gas * actual_gas_price
     data = OrderedDict({
@@ -710,13 +700,7 @@ def record_gas(
         "diff_gas": sender_value - actual_value,
         "diff_value": round((sender_value - actual_value) / 1e9 * price, 4)
     })
-    columns = list(data.keys())
-    data = pd.DataFrame([data])
-    data = data[columns]
-    if file_name.exists():
-        data.to_csv(str(file_name), index=False, header=False, mode='a')
-    else:
-        data.to_csv(str(file_name), index=False, header=True, mode='w')
+    get_gas_ledger(str(file_path), "{dst_net}_{period1}_{period2}_v1.csv").record(data, cur_timestamp)
 
 
 def main():
@@ -727,7 +711,6 @@ def main():
 
 
 def single_process():
-    change_network("polygon-main")
     process_v2(21, sui_project.network_config["SoDiamond"])
 
 
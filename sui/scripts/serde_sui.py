@@ -5,6 +5,7 @@ from brownie import Contract
 from scripts import sui_project
 from scripts.struct_sui import change_network, omniswap_ethereum_project
 import sui_brownie
+from omniswap_relayer import wormhole_serder
 
 
 def parse_u256(data):
@@ -206,8 +207,20 @@ def parse_wormhole_payload(
 def parse_vaa_to_wormhole_payload(
         project: sui_brownie.SuiProject,
         net: str,
-        vaa: str
+        vaa: str,
+        offline: bool = False
 ):
+    """
+    Decode vaa, transfer and wormhole payload
+    :param project:
+    :param net: evm network used to decode, not needed when offline
+    :param vaa:
+    :param offline: decode locally with wormhole_serder instead of evm eth_call,
+        the result layout is the same
+    :return: (vaa_data, transfer_data, wormhole_data)
+    """
+    if offline:
+        return wormhole_serder.parse_vaa_to_wormhole_payload(vaa)
     vaa_data = parse_vaa(project, net, vaa)
     transfer_data = parse_transfer_with_payload(project, net, vaa_data[-4])
     wormhole_data = parse_wormhole_payload(project, net, transfer_data[-1])
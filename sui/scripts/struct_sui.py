@@ -1,4 +1,7 @@
+import importlib.machinery
+import importlib.util
 import json
+import sys
 from pathlib import Path
 from random import choice
 from typing import List
@@ -9,6 +12,17 @@ omniswap_ethereum_path = Path(__file__).parent.parent.parent.joinpath("ethereum"
 omniswap_ethereum_project = project.load(str(omniswap_ethereum_path), raise_if_loaded=False)
 omniswap_ethereum_project.load_config()
 
+# The evm relayer modules (offline vaa decoder, guardian fetcher, stores)
+# are shared as the `omniswap_relayer` package, `scripts.relayer` is taken
+# by this project
+omniswap_ethereum_relayer_path = omniswap_ethereum_path.joinpath("scripts", "relayer")
+if "omniswap_relayer" not in sys.modules:
+    omniswap_relayer = importlib.util.module_from_spec(
+        importlib.machinery.ModuleSpec("omniswap_relayer", None, is_package=True)
+    )
+    omniswap_relayer.__path__ = [str(omniswap_ethereum_relayer_path)]
+    sys.modules["omniswap_relayer"] = omniswap_relayer
+
 omniswap_sui_path = Path(__file__).parent.parent
 
 